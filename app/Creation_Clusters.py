@@ -1,89 +1,11 @@
 import argparse
-import csv
-import subprocess
-from geopy.distance import geodesic
-from neo4j import GraphDatabase
-from sklearn.cluster import KMeans
-import folium
-import psycopg2
-
-
-# Connexion à la base de données PostgreSQL
-conn = psycopg2.connect(
-    host="188.166.105.53",
-    port="65001",
-    database="postgres",
-    user="postgres",
-    password="LearnPostgreSQL"
-)
-cursor = conn.cursor()
-
-# Connexion à la base de données Neo4j
-uri = "bolt://188.166.105.53:7687"
-username = "neo4j"
-password = "od1235Azerty%"
-driver = GraphDatabase.driver(uri, auth=(username, password))
-
-# Fonction pour filtrer les points d'intérêt dans un rayon donné autour d'une position
-def filter_pois(position, pois, radius_km):
-    list_pois = []
-    for poi in pois:
-        poi_latitude, poi_longitude = float(poi[1]), float(poi[2])
-        if -90 <= poi_latitude <= 90 and -180 <= poi_longitude <= 180:
-            poi_position = (poi_latitude, poi_longitude)
-            if geodesic(position, poi_position).kilometers <= radius_km:
-                list_pois.append(poi)
-        else:
-            print("Coordonnées incorrectes")
-    return list_pois
-
-
-# Fonction pour créer les clusters et les POIs dans Neo4j
-def create_graphXxxxx(tx, clusters, list_pois):
-    # Supprimer tous les nœuds et relations existants dans la base Neo4j
-    tx.run("MATCH (n) DETACH DELETE n")
-
-    # Création des clusters
-    for i in range(max(clusters) + 1):
-        cluster_name = f"Cluster_{i}"
-        tx.run("CREATE (:Cluster {name: $name})", name=cluster_name)
-
-    # Création des POIs et des relations avec les clusters
-    for i, row in enumerate(list_pois):
-        label_fr, latitude, longitude, poi_type = row
-        cluster_name = f"Cluster_{clusters[i]}"
-        tx.run(
-            "CREATE (:POI {label_fr: $label_fr, latitude: $latitude, longitude: $longitude, poi_type: $poi_type})",
-            label_fr=label_fr, latitude=latitude, longitude=longitude, poi_type=poi_type
-        )
-        tx.run(
-            "MATCH (poi:POI {label_fr: $label_fr}), (cluster:Cluster {name: $cluster_name}) "
-            "CREATE (poi)-[:BELONGS_TO]->(cluster)",
-            label_fr=label_fr, cluster_name=cluster_name
-        )
-
-
-# Fonction pour récupérer les coordonnées GPS et les labels des POIs de chaque cluster depuis Neo4j
-def get_clusters_poi_data(min_poi_count=6, max_clusters=10, max_pois_per_cluster=10):
-    clusters_data = {}
-    with driver.session() as session:
-        result = session.run(
-            """
-            MATCH (c:Cluster)<-[:BELONGS_TO]-(p:POI)
-            WITH c, p
-            ORDER BY c.name, p.label_fr
-            WHERE size([(c)-[:BELONGS_TO]-(p2) | p2]) >= $min_poi_count
-            RETURN c.name AS cluster_name, collect([p.latitude, p.longitude, p.label_fr]) AS poi_data
-            LIMIT $max_clusters
-            """,
-            min_poi_count=min_poi_count,
-            max_clusters=max_clusters
-        )
-        for record in result:
-            cluster_name = record["cluster_name"]
-            poi_data = record["poi_data"][:max_pois_per_cluster]  # Limiter les POI par cluster
-            clusters_data[cluster_name] = poi_data
-    return clusters_data
+import logging
+import time
+from clustering import (ClusteringEngine, DEFAULT_BATCH_SIZE, DEFAULT_ITERSIZE, DEFAULT_RUN_TTL)
+from result_cache import ResultCache
+from clusters_result import save_result
+from poi_index import PoiIndex
+from instrumentation import StageRecorder
 
 
 # Définition des arguments en ligne de commande
@@ -93,115 +15,81 @@ parser.add_argument('--latitude', type=float, required=True, help='Latitude du p
 parser.add_argument('--longitude', type=float, required=True, help='Longitude du point de référence')
 parser.add_argument('--poi_types', nargs='+', required=True, help='Types d_activité')
 parser.add_argument('--radius', type=float, required=True, help='Rayon en kilomètres pour filtrer les points d_intérêt')
+parser.add_argument('--query_mode', choices=['python', 'sql', 'index'], default='sql',
+                    help='Filtrage par rayon dans PostgreSQL (sql), uniquement en Python (python) '
+                         'ou dans l\'index spatial sur disque (index, voir --poi_index)')
+parser.add_argument('--poi_index', default=None,
+                    help="Répertoire de l'index spatial des POIs (voir poi_index.py), aussi utilisé "
+                         "si PostgreSQL est injoignable")
+parser.add_argument('--itersize', type=int, default=DEFAULT_ITERSIZE,
+                    help='Lignes lues par bloc depuis le curseur serveur PostgreSQL, filtrées dès leur arrivée '
+                         '(0 : lecture complète avec fetchall)')
+parser.add_argument('--create_index', action='store_true',
+                    help="Créer l'index latitude/longitude sur datatourisme s'il n'existe pas")
+parser.add_argument('--graph_writer', choices=['batched', 'legacy'], default='batched',
+                    help='Écriture du graphe Neo4j par lots UNWIND (batched) ou POI par POI (legacy)')
+parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                    help='Nombre de POIs par instruction UNWIND envoyée à Neo4j')
+parser.add_argument('--with_types', action='store_true',
+                    help='Relier aussi chaque POI à ses nœuds (:Type) dans Neo4j')
+parser.add_argument('--clustering', choices=['auto', 'kmeans', 'minibatch'], default='auto',
+                    help='Algorithme de clustering (auto : MiniBatchKMeans pour les gros volumes)')
+parser.add_argument('--n_clusters', default='10',
+                    help="Nombre de clusters, ou 'auto' (toujours plafonné au nombre de POIs)")
+parser.add_argument('--run_id', default=None,
+                    help='Identifiant du run dans Neo4j (généré si absent ; un run_id imposé ne passe pas par le cache)')
+parser.add_argument('--run_ttl', type=int, default=DEFAULT_RUN_TTL,
+                    help='Durée de conservation des runs dans Neo4j, en secondes')
+parser.add_argument('--output', default='clusters_data',
+                    help='Chemin (sans extension) du résultat columnaire : <output>.npy et <output>.json')
+parser.add_argument('--cache_dir', default=None,
+                    help='Répertoire du cache disque des résultats (désactivé si absent)')
+parser.add_argument('--profile', default=None,
+                    help='Fichier .prof où écrire le profil cProfile du run (affiche aussi les 20 fonctions les plus coûteuses)')
+parser.add_argument('--trace_memory', action='store_true',
+                    help='Mesurer le pic mémoire de chaque étape avec tracemalloc (ralentit le run)')
+parser.add_argument('--log_stages', action='store_true',
+                    help='Écrire un log JSON par étape sur la sortie d\'erreur')
 args = parser.parse_args()
-
-# Requête SQL pour récupérer les points d'intérêt correspondant aux types spécifiés
-poi_types_condition = " OR ".join([f"tp.type = '{poi_type}'" for poi_type in args.poi_types])
-sql_query = (
-    "SELECT dt.label_fr, dt.latitude, dt.longitude, tp.type "
-    "FROM datatourisme dt "
-    "JOIN liaison_datatourisme_types_de_poi ldtp ON dt.id = ldtp.id_datatourisme "
-    "JOIN types_de_poi tp ON ldtp.id_type_de_poi = tp.id "
-    f"WHERE {poi_types_condition} "
-    "GROUP BY dt.label_fr, dt.latitude, dt.longitude, tp.type"
-)
-
-# Exécution de la requête SQL
-cursor.execute(sql_query)
-rows = cursor.fetchall()
-conn.commit()
-
-# Position de référence pour le filtrage des POIs
-reference_position = (args.latitude, args.longitude)
-
-# Filtrer les points d'intérêt dans le rayon spécifié autour de la position de référence
-list_pois = filter_pois(reference_position, rows, args.radius)
-
-# Utilisation de KMeans pour regrouper les POIs en clusters
-X = [(row[1], row[2]) for row in list_pois]
-kmeans = KMeans(n_clusters=10, n_init=10)
-kmeans.fit(X)
-clusters = kmeans.labels_
-
-
-# Fonction pour créer les clusters et les POIs dans Neo4j
-def create_graph(tx):
-    # Supprimer tous les nœuds et relations existants dans la base Neo4j
-    tx.run("MATCH (n) DETACH DELETE n")
-
-    # Création des clusters
-    for i in range(max(clusters) + 1):
-        cluster_name = f"Cluster_{i}"
-        tx.run("CREATE (:Cluster {name: $name})", name=cluster_name)
-
-    # Création des POIs et des relations avec les clusters
-    for i, row in enumerate(list_pois):
-        label_fr, latitude, longitude, poi_type = row
-        cluster_name = f"Cluster_{clusters[i]}"
-        tx.run(
-            "CREATE (:POI {label_fr: $label_fr, latitude: $latitude, longitude: $longitude, poi_type: $poi_type})",
-            label_fr=label_fr, latitude=latitude, longitude=longitude, poi_type=poi_type
-        )
-        tx.run(
-            "MATCH (poi:POI {label_fr: $label_fr}), (cluster:Cluster {name: $cluster_name}) "
-            "CREATE (poi)-[:BELONGS_TO]->(cluster)",
-            label_fr=label_fr, cluster_name=cluster_name
+if args.log_stages:
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+if args.query_mode == 'index' and args.poi_index is None:
+    parser.error("--query_mode index nécessite --poi_index")
+if args.n_clusters != 'auto':
+    args.n_clusters = int(args.n_clusters)
+
+# Exécution du pipeline de clustering (PostgreSQL -> KMeans -> Neo4j)
+start_time = time.perf_counter()
+cache = ResultCache(disk_dir=args.cache_dir) if args.cache_dir else None
+poi_index = PoiIndex(args.poi_index) if args.poi_index else None
+with StageRecorder(run_id=args.run_id, profile=args.profile is not None, trace_memory=args.trace_memory) as recorder:
+    with ClusteringEngine(cache=cache, poi_index=poi_index, itersize=args.itersize or None) as engine:
+        if args.create_index:
+            engine.create_spatial_index()
+        result = engine.run(
+            args.latitude, args.longitude, args.poi_types, args.radius,
+            run_id=args.run_id, query_mode=args.query_mode, graph_writer=args.graph_writer,
+            batch_size=args.batch_size, run_ttl=args.run_ttl, with_types=args.with_types,
+            n_clusters=args.n_clusters, clustering=args.clustering, recorder=recorder
         )
-
-
-# Création de la session Neo4j et exécution de la transaction
-with driver.session() as session:
-    session.write_transaction(create_graph)
-
-# Fermeture du curseur et de la connexion à la base de données PostgreSQL
-cursor.close()
-conn.close()
-
-# Récupérer les données des POIs pour les clusters avec au moins 6 POI et au maximum 10 clusters
-clusters_data = get_clusters_poi_data(min_poi_count=6, max_clusters=10, max_pois_per_cluster=10)
-
-# Créer la carte
-map = folium.Map(location=[args.latitude, args.longitude], zoom_start=12)
-
-# Définir les couleurs pour les marqueurs de chaque cluster
-colors = ['red', 'blue', 'green', 'purple', 'orange', 'lightgreen', 'pink', 'white', 'gray', 'black']
-
-# Créer une liste pour stocker les données à écrire dans le CSV
-csv_data = []
-
-# Ajouter un marqueur pour chaque POI de chaque cluster avec une couleur différente
-for i, (cluster_name, poi_data) in enumerate(clusters_data.items()):
-    color = colors[i % len(colors)]  # Utilisation d'une couleur cyclique pour chaque cluster
-    for poi_coordinate in poi_data:
-        latitude, longitude, label_fr = poi_coordinate
-        # Ajouter un marqueur avec une info-bulle (tooltip) pour afficher le label_fr du POI
-        folium.Marker(
-            location=[latitude, longitude],
-            icon=folium.Icon(color=color),
-            tooltip=label_fr
-        ).add_to(map)
-
-        # Ajouter les données au CSV
-        csv_data.append({
-            'color': color,
-            'label_fr': label_fr,
-            'latitude': latitude,
-            'longitude': longitude
-        })
-
-# Sauvegarder la carte dans un fichier HTML
-map_filename = 'clusters_map.html'
-map.save(map_filename)
-print(f"La carte '{map_filename}' a été créée avec succès.")
-
-# Écrire les données dans un fichier CSV
-csv_filename = 'clusters_data.csv'
-csv_fields = ['color', 'label_fr', 'latitude', 'longitude']
-
-with open(csv_filename, 'w', newline='') as csvfile:
-    writer = csv.DictWriter(csvfile, fieldnames=csv_fields)
-    writer.writeheader()
-    for data in csv_data:
-        writer.writerow(data)
-
-print(f"Le fichier CSV '{csv_filename}' a été créé avec succès.")
+    print(f"Run '{result['run_id']}' terminé en {time.perf_counter() - start_time:.2f} s "
+          f"({args.graph_writer}, {result['poi_count']} POIs, cache {'hit' if result['cache_hit'] else 'miss'})")
+
+    # Sauvegarder la carte dans un fichier HTML
+    map_filename = 'clusters_map.html'
+    with recorder.stage('map_render', rows=len(result['points'])):
+        # folium n'est chargé qu'une fois le run terminé (démarrage et --help plus rapides)
+        from map_rendering import clusters_map
+        map = clusters_map(result, result['center'])
+        map.save(map_filename)
+    print(f"La carte '{map_filename}' a été créée avec succès.")
+
+    # Écrire le résultat columnaire (tableau NumPy mappable en mémoire et ses catégories)
+    with recorder.stage('result_write', rows=len(result['points'])):
+        save_result(args.output, result)
+    print(f"Le résultat '{args.output}.npy' a été créé avec succès.")
+
+print(recorder.summary())
+if args.profile is not None:
+    recorder.dump_profile(args.profile)
+    print(recorder.profile_stats())
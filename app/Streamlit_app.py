@@ -1,134 +1,215 @@
 import streamlit as st
-import pandas as pd
-import requests
-import subprocess
-import folium
+import numpy as np
+import json
 import os
+import requests
 import streamlit.components.v1 as components
-from ortools.constraint_solver import pywrapcp, routing_enums_pb2
-# from ortools.constraint_solver import pywrapcp
+import threading
 import time
-
-# Fonction pour charger les données
+from clusters_result import clusters_to_result
+from result_cache import ResultCache
+from geocoding import Geocoder, GeocodingError
+from distance_matrix import build_distance_matrix
+from ors_client import ORSClient, ORSError, PROFILES
+
+# API (backend/main.py) qui exécute les clusterings dans sa file de jobs ; à défaut, le
+# clustering est exécuté dans le processus Streamlit
+BACKEND_URL = os.getenv('BACKEND_URL')
+
+# Délais (secondes) de connexion et de lecture des appels à l'API
+BACKEND_TIMEOUT = (3.05, 30)
+
+# Silence maximal (secondes) du flux d'événements d'un job avant de passer au sondage de
+# GET /jobs/{id}, toutes les BACKEND_POLL_INTERVAL secondes et au plus BACKEND_JOB_TIMEOUT secondes
+BACKEND_EVENTS_TIMEOUT = 15
+BACKEND_POLL_INTERVAL = 1
+BACKEND_JOB_TIMEOUT = 600
+
+# Moteur de clustering partagé par toutes les sessions (connexions et cache de résultats ouverts une seule fois).
+# Avec une API (BACKEND_URL), scikit-learn et les pilotes des bases ne sont jamais chargés par Streamlit.
+@st.cache_resource
+def get_engine():
+    from clustering import ClusteringEngine
+    from poi_index import PoiIndex
+    # Index spatial des POIs (voir poi_index.py) : recherches sans PostgreSQL quand il est fourni
+    poi_index = PoiIndex(os.getenv('POI_INDEX_DIR')) if os.getenv('POI_INDEX_DIR') else None
+    return ClusteringEngine(cache=ResultCache(disk_dir=os.getenv('CLUSTERS_CACHE_DIR')), poi_index=poi_index)
+
+
+# Préchauffage du moteur en arrière-plan, une fois par processus, dès la première page servie :
+# la première requête de clustering trouve les connexions ouvertes
+@st.cache_resource
+def warm_up_engine():
+    thread = threading.Thread(target=lambda: print(f"Préchauffage du moteur : {get_engine().warm_up()}"),
+                              daemon=True)
+    thread.start()
+    return thread
+
+
+# Tableau des établissements construit directement depuis le résultat columnaire (une fois par résultat).
+# pandas, folium et map_rendering ne sont chargés qu'au premier résultat ou à la première carte affichée
+@st.cache_data
+def result_to_dataframe(points, colors):
+    import pandas as pd
+    return pd.DataFrame({
+        'color': pd.Categorical(np.asarray(colors, dtype=object)[points['cluster']]),
+        'label_fr': points['label_fr'],
+        'latitude': points['latitude'],
+        'longitude': points['longitude']
+    })
+
+
+# Fonction pour charger les données du dernier clustering de la session
 def load_data():
-    try:
-        df = pd.read_csv('clusters_data.csv')
-        return df
-    except FileNotFoundError:
-        st.error("Le fichier 'clusters_data.csv' est introuvable.")
-        return pd.DataFrame()  # DF Vide en cas d'erreur
+    result = st.session_state.get('clusters_result')
+    if result is None:
+        return None  # Aucun tableau tant qu'aucun clustering n'a été lancé
+    return result_to_dataframe(result['points'], result['colors'])
+
+
+# État d'un job de l'API, relu jusqu'à ce qu'il soit terminé (au plus BACKEND_JOB_TIMEOUT secondes)
+def poll_backend_job(job_id, status):
+    deadline = time.monotonic() + BACKEND_JOB_TIMEOUT
+    while True:
+        response = requests.get(f"{BACKEND_URL}/jobs/{job_id}", timeout=BACKEND_TIMEOUT)
+        response.raise_for_status()
+        job = response.json()['data']
+        if job['status'] in ('done', 'failed', 'cancelled'):
+            return job
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"job {job_id} toujours {job['status']} après {BACKEND_JOB_TIMEOUT} s")
+        if job['stage']:
+            status.update(label=f"Création des clusters : {job['stage']}...")
+        time.sleep(BACKEND_POLL_INTERVAL)
+
+
+# Clustering exécuté par la file de jobs de l'API : la progression des étapes est lue
+# sur le flux d'événements du job, puis le résultat columnaire est reconstruit localement
+def run_backend_job(latitude, longitude, poi_types, radius):
+    response = requests.post(f"{BACKEND_URL}/jobs/", timeout=BACKEND_TIMEOUT, json={
+        'latitude': latitude, 'longitude': longitude, 'poi_types': list(poi_types), 'radius': float(radius)
+    })
+    response.raise_for_status()
+    job_id = response.json()['data']['job_id']
+
+    with st.status('Création des clusters...') as status:
+        try:
+            with requests.get(f"{BACKEND_URL}/jobs/{job_id}/events", stream=True,
+                              timeout=(BACKEND_TIMEOUT[0], BACKEND_EVENTS_TIMEOUT)) as events:
+                for line in events.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data: '):
+                        continue
+                    event = json.loads(line[len('data: '):])
+                    if event['type'] == 'stage_start':
+                        status.update(label=f"Création des clusters : {event['stage']}...")
+                    elif event['type'] == 'stage_end':
+                        status.write(f"{event['stage']} : {event['seconds']:.2f} s")
+                    elif event['type'] in ('done', 'failed', 'cancelled'):
+                        break
+        except requests.RequestException as e:
+            # Flux muet ou coupé : l'état du job est sondé à la place
+            print(f"Flux d'événements du job {job_id} interrompu, sondage de l'état : {e}")
+        job = poll_backend_job(job_id, status)
+        if job['status'] != 'done':
+            status.update(label='Échec de la création des clusters', state='error')
+            raise RuntimeError(job['error'] or job['status'])
+        status.update(label='Clusters créés', state='complete')
+    return dict(job['result'], **clusters_to_result(job['result']['clusters']))
 
 
 def execute_query(latitude, longitude, poi_types, radius):
-    poi_types_str = " ".join(poi_types)
-    command = f"python3 Creation_Clusters.py --latitude {latitude} --longitude {longitude} --poi_types {poi_types_str} --radius {radius}"
-
-    with st.spinner('Création des clusters...'):
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-
-    if process.returncode == 0:
-        st.success('Done!')
-        return True
-    else:
-        st.error(f"Erreur lors de l'exécution de la requête : {stderr.decode('utf-8')}")
-        return False
-
-
-# Fonction pour exécuter la requête de géocodage
-def geocode_sync(address):
-    url = 'https://api-adresse.data.gouv.fr/search/'
-    params = {
-        'q': address
-    }
-
     try:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            if len(data['features']) > 0:
-                return {
-                    'latitude': float(data['features'][0]['geometry']['coordinates'][1]),
-                    'longitude': float(data['features'][0]['geometry']['coordinates'][0])
-                }
-            else:
-                return None
+        if BACKEND_URL:
+            result = run_backend_job(latitude, longitude, poi_types, radius)
         else:
-            st.error(f"Erreur lors de la récupération des coordonnées pour '{address}' : {response.status_code}")
-            return None
-    except requests.RequestException as e:
-        st.error(f"Erreur lors de la requête de géocodage : {str(e)}")
+            with st.spinner('Création des clusters...'):
+                engine = get_engine()
+                query_mode = 'index' if engine.poi_index is not None else 'sql'
+                result = engine.run(latitude, longitude, poi_types, float(radius), query_mode=query_mode)
+    except Exception as e:
+        st.error(f"Erreur lors de l'exécution de la requête : {str(e)}")
         return None
 
+    st.session_state['clusters_result'] = result
+    st.success('Done!')
+    if BACKEND_URL:
+        st.caption(f"Cache des clusters : {'hit' if result['cache_hit'] else 'miss'}")
+    else:
+        stats = get_engine().cache.stats()
+        st.caption(f"Cache des clusters : {'hit' if result['cache_hit'] else 'miss'} "
+                   f"({stats['hits'] + stats['disk_hits']} hits / {stats['misses']} misses)")
+    with st.expander("Durée des étapes"):
+        import pandas as pd
+        st.dataframe(pd.DataFrame(result['timings'], columns=['stage', 'seconds', 'rows']))
+    return result
 
-# Fonction pour résoudre le problème du voyageur de commerce
-def solve_tsp(distance_matrix):
-    # Instantiate the data problem.
-    data = {}
-    data['distance_matrix'] = distance_matrix
-    data['num_vehicles'] = 1
-    data['depot'] = 0
-
-    manager = pywrapcp.RoutingIndexManager(len(data['distance_matrix']),
-                                           data['num_vehicles'], data['depot'])
-
-    routing = pywrapcp.RoutingModel(manager)
 
-    def distance_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return int(data['distance_matrix'][from_node][to_node])
+# Client de géocodage partagé (session HTTP keep-alive et cache des adresses)
+@st.cache_resource
+def get_geocoder():
+    return Geocoder(cache_dir=os.getenv('GEOCODING_CACHE_DIR'))
 
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
 
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+# Fonction pour exécuter la requête de géocodage
+def geocode_sync(address):
+    try:
+        return get_geocoder().geocode(address)
+    except GeocodingError as e:
+        st.error(str(e))
+        return None
 
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (
-        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
 
-    solution = routing.SolveWithParameters(search_parameters)
-    if solution:
-        index = routing.Start(0)
-        route = []
-        while not routing.IsEnd(index):
-            route.append(manager.IndexToNode(index))
-            index = solution.Value(routing.NextVar(index))
-        route.append(manager.IndexToNode(index))
-        return route
+# Couleurs des tracés de chaque journée
+DAY_COLORS = ['blue', 'red', 'green', 'purple', 'orange', 'darkblue', 'darkred', 'cadetblue', 'pink', 'gray']
+
+
+# Fonction pour résoudre le problème du voyageur de commerce (une route par journée).
+# stop_ids identifie les arrêts : si une solution précédente de la session partage des
+# arrêts, elle sert de solution initiale (arrêts ajoutés insérés au moindre coût).
+def solve_tsp(distance_matrix, num_days=1, end=None, time_limit=None, stop_ids=None):
+    # OR-Tools n'est chargé qu'au premier calcul d'itinéraire
+    from route_optimizer import DEFAULT_TIME_LIMIT, optimize_routes, warm_start_routes
+    time_limit = DEFAULT_TIME_LIMIT if time_limit is None else time_limit
+    initial_routes = None
+    previous = st.session_state.get('last_routes')
+    if stop_ids is not None and previous is not None:
+        previous_ids, previous_routes, previous_options = previous
+        if previous_options == (num_days, end) and set(previous_ids) & set(stop_ids):
+            initial_routes = warm_start_routes(previous_routes, previous_ids, stop_ids, distance_matrix, end=end)
+
+    routes = optimize_routes(distance_matrix, num_days=num_days, end=end, time_limit=time_limit,
+                             initial_routes=initial_routes)
+    if routes:
+        if stop_ids is not None:
+            st.session_state['last_routes'] = (stop_ids, routes, (num_days, end))
+        return routes
     else:
         st.error("Aucune solution trouvée.")
         return None
 
 
-def generate_map(route, coordinates):
-    # Crée une carte centrée sur le premier point
-    m = folium.Map(location=[coordinates[0][0], coordinates[0][1]], zoom_start=13)
+def generate_map(routes, coordinates):
+    from map_rendering import add_route_line, steps_map
+    # Crée une carte centrée sur le premier point, avec une seule couche pour les étapes
+    m = steps_map(coordinates)
 
-    # Ajouter des marqueurs pour chaque point
-    for i, (lat, lon) in enumerate(coordinates):
-        folium.Marker([lat, lon], popup=f"Étape {i + 1}").add_to(m)
-
-    # Ajouter des lignes pour l'itinéraire
-    for i in range(len(route) - 1):
-        start = coordinates[route[i]]
-        end = coordinates[route[1 + i]]
-        folium.PolyLine([(start[0], start[1]), (end[0], end[1])], color="blue", weight=2.5, opacity=1).add_to(m)
+    # Ajouter des lignes pour l'itinéraire de chaque journée
+    for day, route in enumerate(routes):
+        color = DAY_COLORS[day % len(DAY_COLORS)]
+        add_route_line(m, [coordinates[node] for node in route], color=color, tolerance=0,
+                       tooltip=f"Jour {day + 1}")
 
     return m
 
 
-# Fonction pour tracer l'itinéraire avec OpenRouteService
-def get_ors_route(coordinates, mode):
-    API_KEY = os.getenv('OPENROUTE_API_KEY')
-    ORS_URL = 'https://api.openrouteservice.org/v2/directions'
+# Client OpenRouteService partagé (connexions, cache des itinéraires et des matrices, débit)
+@st.cache_resource
+def get_ors_client():
+    return ORSClient(cache_dir=os.getenv('ORS_CACHE_DIR'))
 
-    headers = {
-        'Authorization': API_KEY,
-        'Content-Type': 'application/json; charset=utf-8',
-        'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8'
-    }
 
+# Fonction pour tracer l'itinéraire avec OpenRouteService
+def get_ors_route(coordinates, mode):
     # Map mode to OpenRouteService endpoint
     ors_mode_map = {
         'à pied': 'foot-walking',
@@ -137,61 +218,33 @@ def get_ors_route(coordinates, mode):
     }
     ors_mode = ors_mode_map.get(mode, 'driving-car')
 
-    url = f'{ORS_URL}/{ors_mode}/gpx'
-    payload = {
-        'coordinates': coordinates
-    }
-
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        if response.status_code == 200:
-            gpx_data = response.text
-            return gpx_data
-        else:
-            st.error(f"Erreur lors de la récupération de l'itinéraire : {response.status_code}")
-            return None
-    except requests.RequestException as e:
-        st.error(f"Erreur lors de la requête OpenRouteService : {str(e)}")
+        return get_ors_client().directions_gpx(coordinates, ors_mode)
+    except ORSError as e:
+        st.error(str(e))
         return None
 
 
 def get_route_from_openrouteservice(coordinates, mode):
-    API_KEY = os.getenv('OPENROUTE_API_KEY')
-    ORS_URL = 'https://api.openrouteservice.org/v2/directions'
-
-    modes = {
-        "driving-car": "driving-car",
-        "cycling-regular": "cycling-regular",
-        "foot-walking": "foot-walking"
-    }
-
-    if mode not in modes:
-        st.error("Mode de transport non valide.")
+    try:
+        return get_ors_client().directions(coordinates, mode)
+    except ORSError as e:
+        st.error(str(e))
         return None
 
-    url = f'{ORS_URL}/{modes[mode]}/geojson'
-    headers = {
-        'Authorization': API_KEY,
-        'Content-Type': 'application/json; charset=utf-8'
-    }
-    body = {
-        'coordinates': coordinates
-    }
 
+# Matrice des distances routières (mètres) entre les coordonnées [lat, lon], via OpenRouteService
+def get_road_distance_matrix(coordinates, mode):
     try:
-        response = requests.post(url, json=body, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        else:
-            st.error(f"Erreur lors de la récupération de l'itinéraire : {response.status_code}")
-            return None
-    except requests.RequestException as e:
-        st.error(f"Erreur lors de la requête de l'itinéraire : {str(e)}")
+        return get_ors_client().matrix([[lon, lat] for lat, lon in coordinates], mode)
+    except ORSError as e:
+        st.error(str(e))
         return None
 
 
 def main():
+    if not BACKEND_URL:
+        warm_up_engine()
     st.title("Projet Itinéraire Data Engineer")
 
     st.header("Paramètres de la requête")
@@ -220,6 +273,7 @@ def main():
     # Afficher une carte initiale si des coordonnées sont disponibles
     if coordinates:
         st.markdown("## Carte initiale")
+        import folium
         m = folium.Map(location=[latitude, longitude], zoom_start=13)
         folium.Marker([latitude, longitude], popup="Adresse").add_to(m)
         st.components.v1.html(m._repr_html_(), width=800, height=600)
@@ -230,18 +284,12 @@ def main():
             if result:
                 st.success("La requête a été exécutée avec succès !")
                 st.markdown("## Résultat de la carte des clusters")
-                with open("clusters_map.html", "r", encoding="utf-8") as file:
-                    html_code = file.read()
-                    st.components.v1.html(html_code, width=800, height=600)
+                from map_rendering import clusters_map
+                m = clusters_map(result, result['center'])
+                st.components.v1.html(m._repr_html_(), width=800, height=600)
 
                 st.markdown("## Données des établissements")
-                try:
-                    df = pd.read_csv("clusters_data.csv")
-                    st.dataframe(df)
-                except ValueError as e:
-                    st.error(str(e))
-                except FileNotFoundError:
-                    st.error("Le fichier csv est introuvable.")
+                st.dataframe(load_data())
             else:
                 st.error("Erreur lors de l'exécution de la requête.")
         else:
@@ -250,8 +298,10 @@ def main():
     st.header("Calculer l'itinéraire le plus court")
 
     df = load_data()
-    if df.empty:
+    if df is None or df.empty:
         return
+    from map_rendering import add_route_line, steps_map
+    from route_optimizer import DEFAULT_TIME_LIMIT, routes_cost
 
     selected_color = st.selectbox('Choisir une couleur :', df['color'].unique(), key='selectbox_1')
     filtered_data = df[df['color'] == selected_color]
@@ -264,30 +314,39 @@ def main():
     # Afficher une carte avec les coordonnées sélectionnées
     if len(coordinates) > 1:
         st.markdown("## Carte des points sélectionnés")
-        m = folium.Map(location=[coordinates[0][0], coordinates[0][1]], zoom_start=13)
-        for i, (lat, lon) in enumerate(coordinates):
-            folium.Marker([lat, lon], popup=f"Étape {i + 1}").add_to(m)
+        m = steps_map(coordinates)
         st.components.v1.html(m._repr_html_(), width=800, height=600)
 
+    # Options de l'itinéraire
+    start_from_address = st.checkbox("Partir de mon adresse", value=latitude is not None)
+    open_route = st.checkbox("Ne pas revenir au point de départ")
+    num_days = int(st.number_input("Nombre de journées :", min_value=1, max_value=10, value=1))
+    time_limit = st.slider("Temps de calcul maximal (secondes) :", min_value=1, max_value=30,
+                           value=int(DEFAULT_TIME_LIMIT))
+    road_distances = st.checkbox("Utiliser les distances routières (OpenRouteService)")
+    road_mode = st.selectbox("Mode de transport pour les distances routières :", PROFILES, key='road_mode')
+
     if st.button("Calculer l'itinéraire le plus court"):
         if len(coordinates) > 1:
-            # Calculer la matrice des distances (ici, juste une distance euclidienne simplifiée)
-            num_points = len(coordinates)
-            distance_matrix = [[0] * num_points for _ in range(num_points)]
-            for i in range(num_points):
-                for j in range(num_points):
-                    if i != j:
-                        coord1 = coordinates[i]
-                        coord2 = coordinates[j]
-                        distance_matrix[i][j] = ((coord1[0] - coord2[0]) ** 2 + (coord1[1] - coord2[1]) ** 2) ** 0.5
+            # L'adresse de l'utilisateur devient le point de départ (nœud 0)
+            route_coordinates = coordinates
+            if start_from_address and latitude is not None:
+                route_coordinates = [[latitude, longitude]] + coordinates
+
+            # Calculer la matrice des distances (routières si demandé, haversine sinon), en mètres entiers pour OR-Tools
+            road_matrix = get_road_distance_matrix(route_coordinates, road_mode) if road_distances else None
+            distance_matrix = build_distance_matrix(route_coordinates, routing_matrix=road_matrix).tolist()
 
             # Résoudre le problème TSP
-            route = solve_tsp(distance_matrix)
+            stop_ids = [(round(lat, 6), round(lon, 6)) for lat, lon in route_coordinates]
+            routes = solve_tsp(distance_matrix, num_days=num_days, end='open' if open_route else None,
+                               time_limit=time_limit, stop_ids=stop_ids)
 
-            if route:
+            if routes:
                 st.success("L'itinéraire le plus court a été trouvé !")
+                st.write(f"Distance totale : {routes_cost(routes, distance_matrix) / 1000:.1f} km")
                 # Générer et afficher la carte de l'itinéraire le plus court
-                m = generate_map(route, coordinates)
+                m = generate_map(routes, route_coordinates)
                 st.components.v1.html(m._repr_html_(), width=800, height=600)
             else:
                 st.error("Impossible de trouver l'itinéraire le plus court.")
@@ -298,8 +357,7 @@ def main():
 
     coordinates = filtered_data[['longitude', 'latitude']].values.tolist()  # Changer l'ordre pour OpenRouteService
 
-    transport_mode = st.selectbox("Choisissez un mode de transport :",
-                                  ["driving-car", "cycling-regular", "foot-walking"])
+    transport_mode = st.selectbox("Choisissez un mode de transport :", PROFILES)
 
     if st.button("Tracer le chemin sur la route"):
         if len(coordinates) > 1:
@@ -308,17 +366,12 @@ def main():
             if openrouteservice_data:
                 st.success("L'itinéraire a été tracé avec OpenRouteService !")
                 # Générer et afficher la carte avec OpenRouteService
-                m = folium.Map(location=[coordinates[0][1], coordinates[0][0]], zoom_start=13)
-
-                # Ajouter des marqueurs pour chaque point
-                for i, (lon, lat) in enumerate(coordinates):
-                    folium.Marker([lat, lon], popup=f"Étape {i + 1}").add_to(m)
+                m = steps_map([(lat, lon) for lon, lat in coordinates])
 
-                # Ajouter l'itinéraire
+                # Ajouter l'itinéraire, simplifié avant d'être intégré à la carte
                 if 'features' in openrouteservice_data and len(openrouteservice_data['features']) > 0:
                     route_coords = openrouteservice_data['features'][0]['geometry']['coordinates']
-                    folium.PolyLine([(coord[1], coord[0]) for coord in route_coords], color="blue", weight=2.5,
-                                    opacity=1).add_to(m)
+                    add_route_line(m, [(coord[1], coord[0]) for coord in route_coords])
 
                 st.components.v1.html(m._repr_html_(), width=800, height=600)
             else:
@@ -0,0 +1,257 @@
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import psycopg2
+from concurrent.futures import ProcessPoolExecutor
+from threadpoolctl import threadpool_limits
+from clustering import (DEFAULT_BATCH_SIZE, NEO4J_AUTH, NEO4J_URI, POSTGRES_CONFIG, bounding_box, build_poi_query,
+                        create_graph_indexes, create_graphs_bulk, fit_clusters, project_coordinates, within_radius)
+
+
+# Tableaux partagés entre les processus : écrits une fois sur disque puis mappés en mémoire
+# par chaque worker (les pages sont partagées par le cache du système, sans copie)
+SHARED_ARRAYS = ['latitudes', 'longitudes', 'type_starts', 'poi_numbers']
+
+
+# Lecture du fichier de requêtes : CSV (latitude,longitude,radius,poi_types séparés par « | »
+# et colonnes optionnelles n_clusters, run_id) ou JSON Lines avec les mêmes clés
+def read_requests(path):
+    with open(path, encoding='utf-8') as file:
+        if path.endswith('.csv'):
+            records = list(csv.DictReader(file))
+            for record in records:
+                record['poi_types'] = [poi_type for poi_type in record['poi_types'].split('|') if poi_type]
+        else:
+            records = [json.loads(line) for line in file if line.strip()]
+    requests = []
+    for i, record in enumerate(records):
+        n_clusters = record.get('n_clusters') or 10
+        requests.append({
+            'latitude': float(record['latitude']),
+            'longitude': float(record['longitude']),
+            'radius': float(record['radius']),
+            'poi_types': list(record['poi_types']),
+            'n_clusters': n_clusters if n_clusters == 'auto' else int(n_clusters),
+            'run_id': record.get('run_id') or f"batch_{i}"
+        })
+    return requests
+
+
+# Tableaux de POIs triés par type puis par latitude, à partir des lignes
+# (label_fr, latitude, longitude, types, id) : un POI figure une fois par type, chaque type occupant
+# la tranche [type_starts[code], type_starts[code + 1]) où les latitudes sont croissantes ;
+# poi_numbers renvoie à la ligne du POI (labels, poi_ids, poi_types)
+def build_poi_arrays(rows):
+    types = sorted({poi_type for row in rows for poi_type in row[3]})
+    type_codes = {poi_type: code for code, poi_type in enumerate(types)}
+    numbers = np.array([i for i, row in enumerate(rows) for _ in row[3]], dtype=np.int64)
+    codes = np.array([type_codes[poi_type] for row in rows for poi_type in row[3]], dtype=np.int32)
+    latitudes = np.array([row[1] for row in rows], dtype=np.float64)[numbers]
+    longitudes = np.array([row[2] for row in rows], dtype=np.float64)[numbers]
+    valid = (latitudes >= -90) & (latitudes <= 90) & (longitudes >= -180) & (longitudes <= 180)
+    if not valid.all():
+        print(f"Coordonnées incorrectes : {len(np.unique(numbers[~valid]))} POI(s) ignoré(s)")
+
+    order = np.flatnonzero(valid)
+    order = order[np.lexsort((latitudes[order], codes[order]))]
+    return {
+        'latitudes': latitudes[order],
+        'longitudes': longitudes[order],
+        'type_starts': np.searchsorted(codes[order], np.arange(len(types) + 1)).astype(np.int64),
+        'poi_numbers': numbers[order],
+        'labels': [row[0] or '' for row in rows],
+        'poi_ids': [str(row[4]) for row in rows],
+        'poi_types': [list(row[3]) for row in rows],
+        'types': types
+    }
+
+
+def save_shared_arrays(arrays, directory):
+    for name in SHARED_ARRAYS:
+        np.save(os.path.join(directory, f'{name}.npy'), arrays[name], allow_pickle=False)
+
+
+# État d'un worker : tableaux mappés en mémoire, chargés une fois par processus
+_shared = {}
+
+
+def init_worker(directory):
+    for name in SHARED_ARRAYS:
+        _shared[name] = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+    # Un seul thread OpenMP/BLAS par worker : le parallélisme vient des processus
+    threadpool_limits(1)
+
+
+# Filtre par rayon et clustering d'une requête ; renvoie (indices des POIs, labels des clusters).
+# Pour chaque type demandé, seules les latitudes de la boîte englobante sont lues (recherche dichotomique) ;
+# un POI de plusieurs types demandés n'est retenu qu'une fois.
+def cluster_request(request, clustering='auto', random_state=0, arrays=None):
+    arrays = arrays if arrays is not None else _shared
+    latitudes, longitudes, type_starts = arrays['latitudes'], arrays['longitudes'], arrays['type_starts']
+    position = (request['latitude'], request['longitude'])
+    min_lat, max_lat, _ = bounding_box(position, request['radius'])
+
+    selected = []
+    for code in request['type_codes']:
+        start, end = int(type_starts[code]), int(type_starts[code + 1])
+        first = start + int(np.searchsorted(latitudes[start:end], min_lat, side='left'))
+        last = start + int(np.searchsorted(latitudes[start:end], max_lat, side='right'))
+        candidates = np.arange(first, last)
+        inside = within_radius(position, np.asarray(latitudes[candidates]), np.asarray(longitudes[candidates]),
+                               request['radius'])
+        selected.append(candidates[inside])
+    indices = np.concatenate(selected) if selected else np.empty(0, dtype=np.int64)
+    _, first = np.unique(arrays['poi_numbers'][indices], return_index=True)
+    indices = indices[np.sort(first)]
+
+    coordinates = np.column_stack([latitudes[indices], longitudes[indices]])
+    labels, _ = fit_clusters(project_coordinates(coordinates, position), n_clusters=request['n_clusters'],
+                             algorithm=clustering, random_state=random_state)
+    return indices, labels
+
+
+def _cluster_request(args):
+    return cluster_request(*args)
+
+
+# Exécution de toutes les requêtes sur workers processus ; renvoie une liste de (indices, labels)
+def run_batch(requests, arrays, workers=None, clustering='auto', work_dir=None):
+    type_codes = {poi_type: code for code, poi_type in enumerate(arrays['types'])}
+    tasks = [
+        (dict(request, type_codes=sorted({type_codes[t] for t in request['poi_types'] if t in type_codes})), clustering)
+        for request in requests
+    ]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [cluster_request(*task, arrays=arrays) for task in tasks]
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as directory:
+        save_shared_arrays(arrays, directory)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(directory,)) as executor:
+            # Des paquets de requêtes par échange limitent le coût de communication entre processus
+            chunksize = max(1, len(tasks) // (workers * 8))
+            return list(executor.map(_cluster_request, tasks, chunksize=chunksize))
+
+
+# Type des lignes de l'export columnaire : numéro de requête, cluster, coordonnées, label,
+# identifiant DataTourisme et types demandés du POI (séparés par « | »)
+def batch_result_dtype(label_width, id_width, type_width):
+    return np.dtype([
+        ('request', np.int32),
+        ('cluster', np.int16),
+        ('latitude', np.float64),
+        ('longitude', np.float64),
+        ('label_fr', f'U{max(1, label_width)}'),
+        ('poi_id', f'U{max(1, id_width)}'),
+        ('types', f'U{max(1, type_width)}')
+    ])
+
+
+# Export columnaire de tous les résultats : path.npy (lignes triées par requête) et path.json
+# (requêtes et tranches [offsets[i], offsets[i + 1]) de chaque requête)
+def save_batch_result(path, requests, results, arrays):
+    counts = [len(indices) for indices, _ in results]
+    indices = np.concatenate([indices for indices, _ in results]) if results else np.empty(0, dtype=np.int64)
+    numbers = arrays['poi_numbers'][indices]
+    request_numbers = np.repeat(np.arange(len(results)), counts)
+    labels = [arrays['labels'][number] for number in numbers]
+    poi_ids = [arrays['poi_ids'][number] for number in numbers]
+    poi_types = ['|'.join(request_types(requests[r], arrays['poi_types'][number]))
+                 for r, number in zip(request_numbers, numbers)]
+    points = np.empty(len(indices), dtype=batch_result_dtype(
+        max(map(len, labels), default=1), max(map(len, poi_ids), default=1), max(map(len, poi_types), default=1)))
+    points['request'] = request_numbers
+    points['cluster'] = np.concatenate([clusters for _, clusters in results]) if results else []
+    points['latitude'] = arrays['latitudes'][indices]
+    points['longitude'] = arrays['longitudes'][indices]
+    points['label_fr'] = labels
+    points['poi_id'] = poi_ids
+    points['types'] = poi_types
+    np.save(f'{path}.npy', points, allow_pickle=False)
+    with open(f'{path}.json', 'w', encoding='utf-8') as file:
+        json.dump({'requests': requests, 'offsets': np.concatenate([[0], np.cumsum(counts)]).tolist()},
+                  file, ensure_ascii=False)
+    return points
+
+
+# Types d'un POI parmi ceux demandés par la requête
+def request_types(request, poi_types):
+    return [poi_type for poi_type in poi_types if poi_type in request['poi_types']]
+
+
+# Runs Neo4j (run_id, clusters, list_pois) des résultats, pour create_graphs_bulk
+def graph_runs(requests, results, arrays):
+    runs = []
+    for request, (indices, labels) in zip(requests, results):
+        list_pois = []
+        for i in indices:
+            number = arrays['poi_numbers'][i]
+            list_pois.append((arrays['labels'][number], float(arrays['latitudes'][i]), float(arrays['longitudes'][i]),
+                              request_types(request, arrays['poi_types'][number]), arrays['poi_ids'][number]))
+        runs.append((request['run_id'], labels, list_pois))
+    return runs
+
+
+# Lecture unique des POIs de tous les types demandés par le lot
+def fetch_union_rows(requests):
+    poi_types = sorted({poi_type for request in requests for poi_type in request['poi_types']})
+    sql_query, sql_params = build_poi_query(poi_types)
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql_query, sql_params)
+            return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clustering en lot de nombreuses requêtes (une lecture des POIs, '
+                                                 'filtre et KMeans en parallèle)')
+    parser.add_argument('requests', help='Fichier des requêtes (.csv ou .jsonl)')
+    parser.add_argument('--workers', type=int, default=None, help='Nombre de processus (défaut : nombre de cœurs)')
+    parser.add_argument('--clustering', choices=['auto', 'kmeans', 'minibatch'], default='auto')
+    parser.add_argument('--output', default='batch_clusters',
+                        help='Chemin (sans extension) de l\'export columnaire : <output>.npy et <output>.json')
+    parser.add_argument('--no_graph', action='store_true', help='Ne pas écrire les runs dans Neo4j')
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Nombre de POIs par instruction UNWIND envoyée à Neo4j')
+    parser.add_argument('--with_types', action='store_true',
+                        help='Relier aussi chaque POI à ses nœuds (:Type) dans Neo4j')
+    parser.add_argument('--work_dir', default=None,
+                        help='Répertoire des tableaux partagés (ex. /dev/shm), temporaire par défaut')
+    args = parser.parse_args()
+
+    requests = read_requests(args.requests)
+    start = time.perf_counter()
+    arrays = build_poi_arrays(fetch_union_rows(requests))
+    print(f"{len(arrays['labels'])} POIs lus en {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    results = run_batch(requests, arrays, workers=args.workers, clustering=args.clustering, work_dir=args.work_dir)
+    elapsed = time.perf_counter() - start
+    print(f"{len(requests)} requêtes traitées en {elapsed:.2f} s ({len(requests) / elapsed:.1f} requêtes/s)")
+
+    save_batch_result(args.output, requests, results, arrays)
+    print(f"Le résultat '{args.output}.npy' a été créé avec succès.")
+
+    if not args.no_graph:
+        from neo4j import GraphDatabase
+        start = time.perf_counter()
+        driver = GraphDatabase.driver(NEO4J_URI, auth=NEO4J_AUTH)
+        try:
+            with driver.session() as session:
+                create_graph_indexes(session)
+                create_graphs_bulk(session, graph_runs(requests, results, arrays), batch_size=args.batch_size,
+                                   with_types=args.with_types)
+        finally:
+            driver.close()
+        print(f"{len(requests)} runs écrits dans Neo4j en {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,746 @@
+import threading
+import time
+import uuid
+import numpy as np
+import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from clusters_result import clusters_to_result
+from instrumentation import StageRecorder
+from settings import (NEO4J_AUTH, NEO4J_URI, POSTGRES_CONFIG, POSTGRES_POOL_MAX, POSTGRES_POOL_MIN,
+                      POSTGRES_POOL_TIMEOUT)
+
+# scikit-learn, geopy et le driver Neo4j (plusieurs secondes d'import à eux trois) sont
+# importés à leur première utilisation : importer ce module reste rapide
+
+# Rayon terrestre moyen (km) utilisé par la formule de haversine
+EARTH_RADIUS_KM = 6371.0088
+
+# Tolérance relative entre haversine (sphère) et geodesic (ellipsoïde WGS84) :
+# l'écart atteint 0,56 % (déplacement nord-sud près de l'équateur, où le rayon de
+# courbure du méridien est le plus petit). Les POIs dont la distance haversine tombe
+# dans cette bande autour du rayon sont départagés avec geodesic, ce qui donne
+# exactement le même ensemble de POIs que le filtre ligne par ligne.
+HAVERSINE_TOLERANCE = 0.006
+
+# Demi-grand axe (km) et aplatissement de l'ellipsoïde WGS84
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+
+# Écart relatif maximal entre la formule d'Andoyer-Lambert et geodesic : 1,4e-6 mesuré de
+# 1 m à 15 000 km à toutes les latitudes, pris ici avec une marge. Au-delà de
+# LAMBERT_MAX_RADIUS_KM (points presque antipodaux) la formule n'est plus utilisée.
+LAMBERT_TOLERANCE = 1e-5
+LAMBERT_MAX_RADIUS_KM = 10_000
+
+
+# Distance haversine (km) entre une position et des tableaux de latitudes/longitudes
+def haversine_km(position, latitudes, longitudes):
+    lat0, lon0 = np.radians(position[0]), np.radians(position[1])
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# Distance ellipsoïdale (km) d'Andoyer-Lambert : haversine sur les latitudes réduites,
+# corrigée au premier ordre de l'aplatissement. Vectorisée, contrairement à geodesic.
+def lambert_km(position, latitudes, longitudes):
+    beta0 = np.arctan((1 - WGS84_F) * np.tan(np.radians(position[0])))
+    beta = np.arctan((1 - WGS84_F) * np.tan(np.radians(latitudes)))
+    a = np.sin((beta - beta0) / 2) ** 2 + np.cos(beta0) * np.cos(beta) * np.sin(np.radians(longitudes - position[1]) / 2) ** 2
+    sigma = 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    p, q = (beta0 + beta) / 2, (beta - beta0) / 2
+    # Points confondus (sigma nul) : NaN, laissés à geodesic par within_radius
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (sigma - np.sin(sigma)) * np.sin(p) ** 2 * np.cos(q) ** 2 / np.cos(sigma / 2) ** 2
+        y = (sigma + np.sin(sigma)) * np.cos(p) ** 2 * np.sin(q) ** 2 / np.sin(sigma / 2) ** 2
+    return WGS84_A_KM * (sigma - WGS84_F / 2 * (x + y))
+
+
+# Boîte englobante du cercle de rayon radius_km : (min_lat, max_lat, delta_lon)
+# delta_lon vaut None lorsque la boîte couvre toutes les longitudes
+def bounding_box(position, radius_km):
+    # Marge de sécurité pour couvrir l'écart entre sphère et ellipsoïde
+    margin_km = radius_km * (1 + 2 * HAVERSINE_TOLERANCE)
+    delta_lat = float(np.degrees(margin_km / EARTH_RADIUS_KM))
+    min_lat, max_lat = position[0] - delta_lat, position[0] + delta_lat
+    # Près des pôles la boîte couvre toutes les longitudes
+    if max_lat >= 90 or min_lat <= -90:
+        return min_lat, max_lat, None
+    delta_lon = float(np.degrees(margin_km / (EARTH_RADIUS_KM * np.cos(np.radians(max(abs(min_lat), abs(max_lat)))))))
+    if delta_lon >= 180:
+        return min_lat, max_lat, None
+    return min_lat, max_lat, delta_lon
+
+
+# Masque des coordonnées situées dans la boîte englobante du cercle de rayon radius_km
+def bounding_box_mask(position, latitudes, longitudes, radius_km):
+    min_lat, max_lat, delta_lon = bounding_box(position, radius_km)
+    mask = (latitudes >= min_lat) & (latitudes <= max_lat)
+    if delta_lon is None:
+        return mask
+    # Écart de longitude ramené dans [-180, 180] pour gérer l'antiméridien
+    lon_diff = np.abs((longitudes - position[1] + 180) % 360 - 180)
+    return mask & (lon_diff <= delta_lon)
+
+
+# Indices des coordonnées (tableaux valides) situées à moins de radius_km de position
+def within_radius(position, latitudes, longitudes, radius_km):
+    # Rejet grossier par boîte englobante, puis distance exacte sur les candidats
+    candidates = np.flatnonzero(bounding_box_mask(position, latitudes, longitudes, radius_km))
+    distances = haversine_km(position, latitudes[candidates], longitudes[candidates])
+
+    inside = distances <= radius_km * (1 - HAVERSINE_TOLERANCE)
+    ambiguous = np.flatnonzero(~inside & (distances <= radius_km * (1 + HAVERSINE_TOLERANCE)))
+    # Bande haversine ambiguë : Andoyer-Lambert, vectorisée, tranche tout sauf les points
+    # à moins de LAMBERT_TOLERANCE du rayon
+    if len(ambiguous) and radius_km <= LAMBERT_MAX_RADIUS_KM:
+        ellipsoidal = lambert_km(position, latitudes[candidates[ambiguous]], longitudes[candidates[ambiguous]])
+        inside[ambiguous] = ellipsoidal <= radius_km * (1 - LAMBERT_TOLERANCE)
+        ambiguous = ambiguous[~(np.abs(ellipsoidal - radius_km) > radius_km * LAMBERT_TOLERANCE)]
+    # Les derniers cas limites sont départagés avec geodesic pour rester fidèle à WGS84
+    if len(ambiguous):
+        from geopy.distance import geodesic
+    for k in ambiguous:
+        idx = candidates[k]
+        inside[k] = geodesic(position, (float(latitudes[idx]), float(longitudes[idx]))).kilometers <= radius_km
+
+    return candidates[inside]
+
+
+# Fonction pour filtrer les points d'intérêt dans un rayon donné autour d'une position
+def filter_pois(position, pois, radius_km):
+    if len(pois) == 0:
+        return []
+
+    latitudes = np.array([poi[1] for poi in pois], dtype=np.float64)
+    longitudes = np.array([poi[2] for poi in pois], dtype=np.float64)
+
+    # Vérification des coordonnées sur l'ensemble du tableau
+    valid = (latitudes >= -90) & (latitudes <= 90) & (longitudes >= -180) & (longitudes <= 180)
+    invalid_count = int(np.count_nonzero(~valid))
+    if invalid_count:
+        print(f"Coordonnées incorrectes : {invalid_count} POI(s) ignoré(s)")
+
+    valid_indices = np.flatnonzero(valid)
+    inside = within_radius(position, latitudes[valid_indices], longitudes[valid_indices], radius_km)
+    return [pois[idx] for idx in valid_indices[inside]]
+
+
+# Nombre de lignes lues par aller-retour avec le curseur serveur de PostgreSQL
+DEFAULT_ITERSIZE = 20_000
+
+
+# Lecture par blocs d'un curseur (curseur nommé côté serveur) et filtrage par rayon de chaque
+# bloc dès son arrivée : seuls les POIs retenus restent en mémoire.
+# Renvoie (pois, statistiques de lecture et de filtrage).
+def stream_filtered_pois(cursor, position, radius_km, itersize=DEFAULT_ITERSIZE):
+    pois = []
+    stats = {'rows_read': 0, 'chunks': 0, 'filter_seconds': 0.0}
+    while True:
+        chunk = cursor.fetchmany(itersize)
+        if not chunk:
+            return pois, stats
+        start = time.perf_counter()
+        pois.extend(filter_pois(position, chunk, radius_km))
+        stats['filter_seconds'] += time.perf_counter() - start
+        stats['rows_read'] += len(chunk)
+        stats['chunks'] += 1
+
+
+# Nombre maximal de clusters en mode automatique (une couleur de marqueur par cluster)
+MAX_AUTO_CLUSTERS = 10
+
+# Au-delà de ce nombre de POIs, le mode 'auto' passe de KMeans à MiniBatchKMeans
+MINIBATCH_THRESHOLD = 50_000
+
+# Taille des lots passés à MiniBatchKMeans.partial_fit et nombre de passes sur les données
+MINIBATCH_SIZE = 4096
+MINIBATCH_EPOCHS = 3
+
+# Nombre d'initialisations de KMeans (k-means++ rend les 10 redémarrages superflus)
+KMEANS_N_INIT = 3
+
+
+# Coordonnées des POIs sous forme de tableau NumPy contigu (n, 2) de latitudes/longitudes
+def poi_coordinates(list_pois):
+    # POIs de l'index en colonnes (poi_index.IndexPois) : coordonnées lues sans parcourir les lignes
+    if hasattr(list_pois, 'coordinates'):
+        return list_pois.coordinates()
+    coordinates = np.empty((len(list_pois), 2), dtype=np.float64)
+    for i, poi in enumerate(list_pois):
+        coordinates[i, 0] = poi[1]
+        coordinates[i, 1] = poi[2]
+    return coordinates
+
+
+# Projection équirectangulaire locale (mètres) autour de center : les distances
+# euclidiennes y sont fidèles à l'échelle d'une ville, contrairement aux degrés
+def project_coordinates(coordinates, center):
+    lat0 = np.radians(center[0])
+    projected = np.empty_like(coordinates, dtype=np.float64)
+    projected[:, 0] = np.radians(coordinates[:, 1] - center[1]) * np.cos(lat0) * EARTH_RADIUS_KM * 1000
+    projected[:, 1] = np.radians(coordinates[:, 0] - center[0]) * EARTH_RADIUS_KM * 1000
+    return projected
+
+
+# Nombre de clusters effectif : 'auto' suit la règle sqrt(n / 2), toujours plafonné au nombre de points
+def choose_n_clusters(n_points, n_clusters='auto'):
+    if n_clusters == 'auto':
+        n_clusters = min(MAX_AUTO_CLUSTERS, int(np.ceil(np.sqrt(n_points / 2))))
+    return max(1, min(int(n_clusters), n_points))
+
+
+# Regroupement des points projetés ; renvoie (labels, centres)
+# algorithm : 'kmeans', 'minibatch' (partial_fit par lots) ou 'auto' selon le volume
+def fit_clusters(points, n_clusters='auto', algorithm='auto', random_state=None):
+    n_points = len(points)
+    if n_points == 0:
+        return np.empty(0, dtype=np.int32), np.empty((0, points.shape[1]))
+    k = choose_n_clusters(n_points, n_clusters)
+    points = np.ascontiguousarray(points, dtype=np.float64)
+
+    if algorithm == 'auto':
+        algorithm = 'minibatch' if n_points >= MINIBATCH_THRESHOLD else 'kmeans'
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    if algorithm == 'kmeans':
+        model = KMeans(n_clusters=k, n_init=KMEANS_N_INIT, random_state=random_state)
+        model.fit(points)
+        return model.labels_, model.cluster_centers_
+
+    # MiniBatchKMeans alimenté en flux : quelques passes de lots mélangés, puis affectation par lots
+    batch_size = max(MINIBATCH_SIZE, k)
+    model = MiniBatchKMeans(n_clusters=k, batch_size=batch_size, random_state=random_state)
+    rng = np.random.default_rng(random_state)
+    for _ in range(MINIBATCH_EPOCHS):
+        order = rng.permutation(n_points)
+        for start in range(0, n_points, batch_size):
+            batch = points[order[start:start + batch_size]]
+            # Le premier lot doit contenir au moins k points
+            if not hasattr(model, 'cluster_centers_') and len(batch) < k:
+                continue
+            model.partial_fit(batch)
+    labels = np.empty(n_points, dtype=np.int32)
+    for start in range(0, n_points, batch_size):
+        labels[start:start + batch_size] = model.predict(points[start:start + batch_size])
+    return labels, model.cluster_centers_
+
+
+# Construction de la requête SQL des POIs : types en paramètre (tp.type = ANY(%s)) et,
+# si une position est donnée, prédicat de boîte englobante évalué par l'index spatial
+def build_poi_query(poi_types, position=None, radius_km=None):
+    conditions = ["tp.type = ANY(%s)"]
+    params = [list(poi_types)]
+    if position is not None:
+        min_lat, max_lat, delta_lon = bounding_box(position, radius_km)
+        conditions.append("dt.latitude::double precision BETWEEN %s AND %s")
+        params += [min_lat, max_lat]
+        min_lon, max_lon = (position[1] - delta_lon, position[1] + delta_lon) if delta_lon is not None else (-180, 180)
+        # Une boîte qui traverse l'antiméridien n'est filtrée qu'en latitude
+        if min_lon >= -180 and max_lon <= 180:
+            conditions.append("dt.longitude::double precision BETWEEN %s AND %s")
+            params += [min_lon, max_lon]
+    sql_query = (
+        # Une ligne par POI (label_fr, latitude, longitude, types, id) : ses types demandés sont
+        # agrégés en tableau. Coordonnées converties par PostgreSQL : psycopg2 renvoie des float.
+        "SELECT dt.label_fr, dt.latitude::double precision, dt.longitude::double precision, "
+        "array_agg(DISTINCT tp.type), dt.id "
+        "FROM datatourisme dt "
+        "JOIN liaison_datatourisme_types_de_poi ldtp ON dt.id = ldtp.id_datatourisme "
+        "JOIN types_de_poi tp ON ldtp.id_type_de_poi = tp.id "
+        f"WHERE {' AND '.join(conditions)} "
+        "GROUP BY dt.id, dt.label_fr, dt.latitude, dt.longitude"
+    )
+    return sql_query, params
+
+
+# Création (idempotente) des index utilisés par build_poi_query
+def create_spatial_index(cursor):
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_datatourisme_lat_lon "
+        "ON datatourisme (((latitude)::double precision), ((longitude)::double precision))"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_types_de_poi_type ON types_de_poi (type)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_liaison_id_datatourisme "
+        "ON liaison_datatourisme_types_de_poi (id_datatourisme, id_type_de_poi)"
+    )
+    cursor.connection.commit()
+
+
+# Taille par défaut des lots envoyés à Neo4j dans une instruction UNWIND
+DEFAULT_BATCH_SIZE = 1000
+
+# Durée de conservation (secondes) d'un run avant sa suppression
+DEFAULT_RUN_TTL = 24 * 3600
+
+
+# Création (idempotente) des index et contraintes utilisés par l'écriture, la lecture et la purge du graphe
+def create_graph_indexes(session):
+    session.run("CREATE INDEX cluster_run_name IF NOT EXISTS FOR (c:Cluster) ON (c.run_id, c.name)")
+    session.run("CREATE INDEX cluster_created_at IF NOT EXISTS FOR (c:Cluster) ON (c.created_at)")
+    # Un POI est identifié par son identifiant DataTourisme dans son run (index d'unicité)
+    session.run("CREATE CONSTRAINT poi_run_id_unique IF NOT EXISTS FOR (p:POI) REQUIRE (p.run_id, p.id) IS UNIQUE")
+    session.run("CREATE CONSTRAINT type_name_unique IF NOT EXISTS FOR (t:Type) REQUIRE t.name IS UNIQUE")
+    session.run("CREATE INDEX poi_run_id IF NOT EXISTS FOR (p:POI) ON (p.run_id)")
+    session.run("CREATE INDEX poi_run_batch IF NOT EXISTS FOR (p:POI) ON (p.run_id, p.batch)")
+    session.run("CREATE INDEX poi_label_fr IF NOT EXISTS FOR (p:POI) ON (p.label_fr)")
+
+
+# Découpage d'une liste en lots de batch_size éléments
+def chunked(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+# Suppression par lots des nœuds des runs indiqués, sans transaction globale
+def delete_runs(session, run_ids, batch_size=DEFAULT_BATCH_SIZE):
+    if not run_ids:
+        return
+    # CALL { ... } IN TRANSACTIONS n'est accepté que dans une transaction implicite (session.run)
+    for label in ("POI", "Cluster"):
+        session.run(
+            f"MATCH (n:{label}) WHERE n.run_id IN $run_ids "
+            f"CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF {int(batch_size)} ROWS",
+            run_ids=list(run_ids)
+        ).consume()
+
+
+# Suppression des runs plus anciens que ttl_seconds
+def delete_expired_runs(session, ttl_seconds=DEFAULT_RUN_TTL, batch_size=DEFAULT_BATCH_SIZE):
+    expired_run_ids = session.run(
+        "MATCH (c:Cluster) WHERE c.created_at < datetime() - duration({seconds: $ttl}) "
+        "RETURN DISTINCT c.run_id AS run_id",
+        ttl=int(ttl_seconds)
+    ).value()
+    delete_runs(session, expired_run_ids, batch_size=batch_size)
+    return expired_run_ids
+
+
+# Lignes des POIs envoyées à Neo4j ; list_pois contient des (label_fr, latitude, longitude, types, id)
+def graph_rows(clusters, list_pois, **extra):
+    return [
+        dict(extra, id=str(poi_id), label_fr=label_fr, latitude=latitude, longitude=longitude,
+             types=list(poi_types), cluster_name=f"Cluster_{int(clusters[i])}")
+        for i, (label_fr, latitude, longitude, poi_types, poi_id) in enumerate(list_pois)
+    ]
+
+
+# Écriture d'un lot de POIs : MERGE sur la contrainte (run_id, id), si bien qu'un POI présent
+# plusieurs fois dans l'entrée reste un seul nœud ; with_types relie aussi chaque POI à ses
+# nœuds (:Type), partagés entre les runs
+def merge_pois_query(run_id='$run_id', with_types=False):
+    query = (
+        "UNWIND $rows AS row "
+        f"MATCH (cluster:Cluster {{run_id: {run_id}, name: row.cluster_name}}) "
+        f"MERGE (poi:POI {{run_id: {run_id}, id: row.id}}) "
+        "ON CREATE SET poi.batch = $batch_number, poi.label_fr = row.label_fr, poi.latitude = row.latitude, "
+        "poi.longitude = row.longitude, poi.types = row.types "
+        "MERGE (poi)-[:BELONGS_TO]->(cluster)"
+    )
+    if with_types:
+        query += " FOREACH (type IN row.types | MERGE (t:Type {name: type}) MERGE (poi)-[:HAS_TYPE]->(t))"
+    return query
+
+
+# Fonction pour créer les clusters et les POIs d'un run dans Neo4j par lots UNWIND
+def create_graph_batched(session, run_id, clusters, list_pois, batch_size=DEFAULT_BATCH_SIZE, with_types=False):
+    # Un run relancé avec le même identifiant remplace uniquement ses propres nœuds
+    delete_runs(session, [run_id], batch_size=batch_size)
+
+    # Création des clusters en une seule instruction
+    cluster_names = [f"Cluster_{i}" for i in range(int(max(clusters)) + 1)]
+    session.execute_write(
+        lambda tx: tx.run(
+            "UNWIND $names AS name CREATE (:Cluster {run_id: $run_id, name: name, created_at: datetime()})",
+            run_id=run_id, names=cluster_names
+        ).consume()
+    )
+
+    # Création des POIs et de leur relation vers leur cluster, un lot par transaction.
+    # Chaque POI garde le numéro de son lot : les lecteurs ne relisent que les lots nouveaux
+    query = merge_pois_query(with_types=with_types)
+    for batch_number, batch in enumerate(chunked(graph_rows(clusters, list_pois), batch_size)):
+        session.execute_write(
+            lambda tx, batch=batch, batch_number=batch_number: tx.run(
+                query, run_id=run_id, batch_number=batch_number, rows=batch
+            ).consume()
+        )
+
+
+# Écriture groupée de plusieurs runs : runs est une liste de (run_id, clusters, list_pois).
+# Les clusters de tous les runs partent en une instruction, les POIs en lots mêlant les runs.
+def create_graphs_bulk(session, runs, batch_size=DEFAULT_BATCH_SIZE, with_types=False):
+    # Tous les runs précédents sont supprimés, y compris ceux dont le nouveau résultat est
+    # vide (comme write_graph) ; seuls les runs avec des POIs sont ensuite écrits
+    delete_runs(session, [run_id for run_id, _, _ in runs], batch_size=batch_size)
+    runs = [(run_id, clusters, list_pois) for run_id, clusters, list_pois in runs if len(list_pois)]
+
+    cluster_rows = [
+        {'run_id': run_id, 'name': f"Cluster_{i}"}
+        for run_id, clusters, _ in runs
+        for i in range(int(max(clusters)) + 1)
+    ]
+    for batch in chunked(cluster_rows, batch_size):
+        session.execute_write(
+            lambda tx, batch=batch: tx.run(
+                "UNWIND $rows AS row CREATE (:Cluster {run_id: row.run_id, name: row.name, created_at: datetime()})",
+                rows=batch
+            ).consume()
+        )
+
+    rows = [row for run_id, clusters, list_pois in runs for row in graph_rows(clusters, list_pois, run_id=run_id)]
+    query = merge_pois_query(run_id='row.run_id', with_types=with_types)
+    # Les numéros de lot sont globaux : croissants pour chaque run, comme l'attendent les lecteurs
+    for batch_number, batch in enumerate(chunked(rows, batch_size)):
+        session.execute_write(
+            lambda tx, batch=batch, batch_number=batch_number: tx.run(
+                query, batch_number=batch_number, rows=batch
+            ).consume()
+        )
+
+
+# Fonction pour créer les clusters et les POIs d'un run dans Neo4j, POI par POI
+def create_graph(tx, run_id, clusters, list_pois, with_types=False):
+    # Création des clusters
+    for i in range(max(clusters) + 1):
+        cluster_name = f"Cluster_{i}"
+        tx.run("CREATE (:Cluster {run_id: $run_id, name: $name, created_at: datetime()})",
+               run_id=run_id, name=cluster_name)
+
+    # Création des POIs et des relations avec leur cluster ; un POI est retrouvé par son
+    # identifiant DataTourisme, jamais par son label (les homonymes restent distincts)
+    query = merge_pois_query(with_types=with_types)
+    for row in graph_rows(clusters, list_pois):
+        tx.run(query, run_id=run_id, batch_number=0, rows=[row])
+
+
+# Lecture des clusters d'un run : la taille d'un cluster vient du degré de ses relations,
+# le filtrage, le tri et la limite par cluster sont faits dans Neo4j
+CLUSTERS_POI_QUERY = """
+MATCH (c:Cluster {run_id: $run_id})
+WITH c, COUNT { (c)<-[:BELONGS_TO]-() } AS poi_count
+WHERE poi_count >= $min_poi_count
+WITH c
+ORDER BY c.name
+LIMIT $max_clusters
+CALL {
+    WITH c
+    MATCH (c)<-[:BELONGS_TO]-(p:POI)
+    WITH p
+    ORDER BY p.label_fr
+    LIMIT $max_pois_per_cluster
+    RETURN collect([p.latitude, p.longitude, p.label_fr]) AS poi_data
+}
+RETURN c.name AS cluster_name, poi_data
+ORDER BY cluster_name
+"""
+
+
+# Fonction pour récupérer les coordonnées GPS et les labels des POIs de chaque cluster d'un run depuis Neo4j
+def get_clusters_poi_data(driver, run_id, min_poi_count=6, max_clusters=10, max_pois_per_cluster=10):
+    clusters_data = {}
+    with driver.session() as session:
+        result = session.run(
+            CLUSTERS_POI_QUERY,
+            run_id=run_id,
+            min_poi_count=min_poi_count,
+            max_clusters=max_clusters,
+            max_pois_per_cluster=max_pois_per_cluster
+        )
+        for record in result:
+            clusters_data[record["cluster_name"]] = record["poi_data"]
+    return clusters_data
+
+
+# Version des tables DataTourisme : somme des insertions/mises à jour/suppressions
+# comptées par PostgreSQL, qui change dès qu'une des trois tables est modifiée
+# Délai (secondes) avant une nouvelle tentative d'ouverture du pool PostgreSQL, quand
+# l'index des POIs a pris le relais
+POSTGRES_RETRY_INTERVAL = 30
+
+DATA_VERSION_QUERY = (
+    "SELECT COALESCE(sum(n_tup_ins + n_tup_upd + n_tup_del), 0) "
+    "FROM pg_stat_user_tables "
+    "WHERE relname IN ('datatourisme', 'liaison_datatourisme_types_de_poi', 'types_de_poi')"
+)
+
+
+# Moteur de clustering réutilisable : garde les connexions PostgreSQL (pool) et le
+# driver Neo4j ouverts entre deux requêtes et renvoie les clusters en mémoire.
+# Les connexions sont ouvertes à la première requête, ou d'avance par warm_up.
+class ClusteringEngine:
+    def __init__(self, postgres_config=None, neo4j_uri=NEO4J_URI, neo4j_auth=NEO4J_AUTH,
+                 min_connections=POSTGRES_POOL_MIN, max_connections=POSTGRES_POOL_MAX, pool_timeout=POSTGRES_POOL_TIMEOUT,
+                 cache=None, poi_index=None, itersize=DEFAULT_ITERSIZE):
+        # Index spatial optionnel des POIs (poi_index.PoiIndex), utilisé par query_mode='index'
+        # et en secours quand PostgreSQL est injoignable
+        self.poi_index = poi_index
+        # Taille des blocs lus par le curseur serveur ; None pour tout lire d'un coup (fetchall)
+        self.itersize = itersize
+        self._pool_args = (min_connections, max_connections, postgres_config or POSTGRES_CONFIG)
+        self._pg_pool = None
+        # Prochaine tentative d'ouverture du pool (time.monotonic) après un échec
+        self._pg_retry_at = None
+        self._pool_lock = threading.Lock()
+        # ThreadedConnectionPool lève PoolError dès qu'il est vide : le sémaphore fait attendre
+        # les requêtes en trop jusqu'à ce qu'une connexion soit rendue
+        self._pool_slots = threading.BoundedSemaphore(max_connections)
+        self._pool_timeout = pool_timeout
+        self._neo4j_args = (neo4j_uri, neo4j_auth)
+        self._driver = None
+        self._driver_lock = threading.Lock()
+        self._graph_indexes_created = False
+        # Cache optionnel des résultats (ResultCache), invalidé par la version des données
+        self.cache = cache
+        if cache is not None and cache.version_fn is None:
+            cache.version_fn = self.data_version
+
+    # Pool PostgreSQL, ouvert à la première utilisation ; None si PostgreSQL est injoignable
+    # et que l'index des POIs prend le relais, jusqu'à la tentative suivante
+    # (au plus une toutes les POSTGRES_RETRY_INTERVAL secondes)
+    @property
+    def pg_pool(self):
+        with self._pool_lock:
+            if self._pg_pool is None and (self._pg_retry_at is None or time.monotonic() >= self._pg_retry_at):
+                min_connections, max_connections, postgres_config = self._pool_args
+                try:
+                    self._pg_pool = ThreadedConnectionPool(min_connections, max_connections, **postgres_config)
+                    self._pg_retry_at = None
+                except psycopg2.OperationalError as e:
+                    if self.poi_index is None:
+                        raise
+                    print(f"PostgreSQL injoignable, utilisation de l'index des POIs : {e}")
+                    self._pg_retry_at = time.monotonic() + POSTGRES_RETRY_INTERVAL
+            return self._pg_pool
+
+    # Driver Neo4j, créé (et le module neo4j chargé) à la première utilisation ; il ne se
+    # connecte qu'à la première session
+    @property
+    def driver(self):
+        with self._driver_lock:
+            if self._driver is None:
+                from neo4j import GraphDatabase
+                neo4j_uri, neo4j_auth = self._neo4j_args
+                self._driver = GraphDatabase.driver(neo4j_uri, auth=neo4j_auth)
+            return self._driver
+
+    # Connexion empruntée au pool, en attendant au plus pool_timeout secondes qu'une se libère
+    def getconn(self):
+        if not self._pool_slots.acquire(timeout=self._pool_timeout):
+            raise PoolError(f"aucune connexion PostgreSQL libérée en {self._pool_timeout} s")
+        try:
+            pool = self.pg_pool
+            if pool is None:
+                raise psycopg2.OperationalError(
+                    f"PostgreSQL injoignable (index des POIs utilisé), nouvel essai au plus tard dans "
+                    f"{POSTGRES_RETRY_INTERVAL} s"
+                )
+            return pool.getconn()
+        except BaseException:
+            self._pool_slots.release()
+            raise
+
+    # Retour d'une connexion au pool ; une connexion fermée (serveur perdu) est écartée
+    def putconn(self, conn):
+        try:
+            self._pg_pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._pool_slots.release()
+
+    # Préchauffage avant de servir des requêtes : pool PostgreSQL ouvert, connexion Neo4j
+    # vérifiée et scikit-learn chargé. Renvoie l'état de chaque dépendance (contrôle de santé).
+    def warm_up(self):
+        status = {}
+        try:
+            pool = self.pg_pool
+            if pool is None:
+                status['postgres'] = 'unavailable (poi index)'
+            else:
+                conn = self.getconn()
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    conn.commit()
+                finally:
+                    self.putconn(conn)
+                status['postgres'] = 'ok'
+        except psycopg2.Error as e:
+            status['postgres'] = f"error: {e}"
+        try:
+            self.driver.verify_connectivity()
+            status['neo4j'] = 'ok'
+        except Exception as e:
+            status['neo4j'] = f"error: {e}"
+        if self.poi_index is not None:
+            status['poi_index'] = len(self.poi_index)
+        fit_clusters(np.zeros((1, 2)), n_clusters=1, algorithm='kmeans')
+        return status
+
+    def close(self):
+        if self._pg_pool is not None:
+            self._pg_pool.closeall()
+        if self._driver is not None:
+            self._driver.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Création des index PostgreSQL utilisés par le filtrage par rayon
+    def create_spatial_index(self):
+        conn = self.getconn()
+        try:
+            with conn.cursor() as cursor:
+                create_spatial_index(cursor)
+        finally:
+            self.putconn(conn)
+
+    # Version courante des tables DataTourisme (voir DATA_VERSION_QUERY) ; celle de l'index
+    # des POIs quand PostgreSQL est injoignable, comme pour fetch_pois
+    def data_version(self):
+        if self.pg_pool is None:
+            return self.poi_index.data_version
+        try:
+            conn = self.getconn()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(DATA_VERSION_QUERY)
+                    version = cursor.fetchone()[0]
+                conn.commit()
+            finally:
+                self.putconn(conn)
+        except psycopg2.OperationalError as e:
+            if self.poi_index is None:
+                raise
+            print(f"PostgreSQL injoignable, version des données de l'index des POIs : {e}")
+            return self.poi_index.data_version
+        return int(version)
+
+    # Récupération des POIs des types demandés, filtrés dans le rayon autour de position
+    # query_mode : 'sql' (boîte englobante dans PostgreSQL), 'python' (tous les POIs des types)
+    # ou 'index' (index spatial sur disque, sans base de données)
+    def fetch_pois(self, position, poi_types, radius_km, query_mode='sql', recorder=None):
+        recorder = recorder or StageRecorder()
+        if query_mode != 'index' and self.pg_pool is not None:
+            try:
+                return self._fetch_pois_postgres(position, poi_types, radius_km, query_mode, recorder)
+            except psycopg2.OperationalError as e:
+                if self.poi_index is None:
+                    raise
+                print(f"PostgreSQL injoignable, utilisation de l'index des POIs : {e}")
+        # Colonnes de l'index : les lignes ne sont décodées qu'à l'écriture dans Neo4j
+        with recorder.stage('index_query') as stage:
+            pois = self.poi_index.pois(position, poi_types, radius_km)
+            stage['rows'] = len(pois)
+        return pois
+
+    def _fetch_pois_postgres(self, position, poi_types, radius_km, query_mode, recorder):
+        if query_mode == 'sql':
+            # Le rayon est transmis à PostgreSQL : seule la boîte englobante est rapatriée
+            sql_query, sql_params = build_poi_query(poi_types, position, radius_km)
+        else:
+            sql_query, sql_params = build_poi_query(poi_types)
+        conn = self.getconn()
+        try:
+            if self.itersize:
+                # Curseur nommé : le résultat reste côté serveur et arrive par blocs de itersize lignes
+                with recorder.stage('sql_stream') as stage:
+                    with conn.cursor(name=f"poi_stream_{uuid.uuid4().hex}") as cursor:
+                        cursor.itersize = self.itersize
+                        cursor.execute(sql_query, sql_params)
+                        pois, stats = stream_filtered_pois(cursor, position, radius_km, itersize=self.itersize)
+                    stage.update(stats, rows=len(pois))
+            else:
+                with recorder.stage('sql_fetch') as stage:
+                    with conn.cursor() as cursor:
+                        cursor.execute(sql_query, sql_params)
+                        rows = cursor.fetchall()
+                    stage['rows'] = len(rows)
+                with recorder.stage('radius_filter') as stage:
+                    pois = filter_pois(position, rows, radius_km)
+                    stage['rows'] = len(pois)
+            conn.commit()
+        except Exception:
+            # La connexion retourne au pool sans transaction interrompue
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn)
+        return pois
+
+    # Écriture du run dans Neo4j, après purge des runs expirés
+    def write_graph(self, run_id, clusters, list_pois, graph_writer='batched',
+                    batch_size=DEFAULT_BATCH_SIZE, run_ttl=DEFAULT_RUN_TTL, with_types=False):
+        with self.driver.session() as session:
+            if not self._graph_indexes_created:
+                create_graph_indexes(session)
+                self._graph_indexes_created = True
+            # Purge par lots des runs expirés, sans toucher aux runs des autres utilisateurs
+            delete_expired_runs(session, ttl_seconds=run_ttl, batch_size=batch_size)
+            if len(list_pois) == 0:
+                # Aucun POI dans le rayon : le run précédent de même identifiant est simplement vidé
+                delete_runs(session, [run_id], batch_size=batch_size)
+            elif graph_writer == 'batched':
+                create_graph_batched(session, run_id, clusters, list_pois, batch_size=batch_size,
+                                     with_types=with_types)
+            else:
+                delete_runs(session, [run_id], batch_size=batch_size)
+                session.execute_write(create_graph, run_id, clusters, list_pois, with_types=with_types)
+
+    # Pipeline complet : POIs -> KMeans -> graphe Neo4j -> clusters relus pour la carte
+    # recorder (instrumentation.StageRecorder) reçoit la durée de chaque étape ; elles sont
+    # aussi renvoyées dans result['timings']
+    def run(self, latitude, longitude, poi_types, radius, run_id=None, query_mode='sql',
+            graph_writer='batched', batch_size=DEFAULT_BATCH_SIZE, run_ttl=DEFAULT_RUN_TTL,
+            n_clusters=10, clustering='auto', min_poi_count=6, max_clusters=10, max_pois_per_cluster=10,
+            with_types=False, recorder=None):
+        recorder = recorder or StageRecorder()
+        # Un résultat en cache renvoie le run_id du run qui l'a produit : seuls les runs dont
+        # l'identifiant est tiré ici (run_id=None), jamais réécrits, passent par le cache.
+        # Un run_id imposé par l'appelant peut être réécrit par lui : il est toujours recalculé.
+        cache_key = None
+        if self.cache is not None and run_id is None:
+            with recorder.stage('cache_lookup'):
+                cache_key = self.cache.make_key(
+                    latitude, longitude, poi_types, radius, query_mode=query_mode, n_clusters=n_clusters,
+                    clustering=clustering, min_poi_count=min_poi_count, max_clusters=max_clusters,
+                    max_pois_per_cluster=max_pois_per_cluster, with_types=with_types
+                )
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                return dict(cached, cache_hit=True, timings=recorder.stages)
+
+        run_id = run_id or uuid.uuid4().hex
+        recorder.run_id = recorder.run_id or run_id
+        position = (latitude, longitude)
+
+        list_pois = self.fetch_pois(position, poi_types, radius, query_mode=query_mode, recorder=recorder)
+
+        # Regroupement des POIs en clusters sur des coordonnées projetées en mètres
+        with recorder.stage('kmeans_fit', rows=len(list_pois)):
+            points = project_coordinates(poi_coordinates(list_pois), position)
+            clusters, _ = fit_clusters(points, n_clusters=n_clusters, algorithm=clustering)
+
+        with recorder.stage('neo4j_write', rows=len(list_pois)):
+            self.write_graph(run_id, clusters, list_pois, graph_writer=graph_writer,
+                             batch_size=batch_size, run_ttl=run_ttl, with_types=with_types)
+
+        with recorder.stage('neo4j_read') as stage:
+            clusters_data = get_clusters_poi_data(self.driver, run_id, min_poi_count=min_poi_count,
+                                                  max_clusters=max_clusters, max_pois_per_cluster=max_pois_per_cluster)
+            stage['rows'] = sum(len(pois) for pois in clusters_data.values())
+        result = {
+            'run_id': run_id,
+            'center': position,
+            'poi_count': len(list_pois),
+            'clusters': clusters_data,
+            'cache_hit': False,
+            **clusters_to_result(clusters_data)
+        }
+        if cache_key is not None:
+            self.cache.set(cache_key, result)
+        return dict(result, timings=recorder.stages)
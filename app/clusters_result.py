@@ -0,0 +1,55 @@
+import json
+import numpy as np
+
+
+# Couleurs des marqueurs de chaque cluster
+COLORS = ['red', 'blue', 'green', 'purple', 'orange', 'lightgreen', 'pink', 'white', 'gray', 'black']
+
+
+# Type des lignes du résultat : code du cluster (index dans colors / cluster_names),
+# coordonnées en float64 et label en unicode de largeur fixe (mappable en mémoire)
+def result_dtype(label_width):
+    return np.dtype([
+        ('cluster', np.int16),
+        ('latitude', np.float64),
+        ('longitude', np.float64),
+        ('label_fr', f'U{max(1, label_width)}')
+    ])
+
+
+# Résultat columnaire d'un clustering à partir des clusters lus dans Neo4j :
+# {'points': tableau structuré, 'colors': couleur par code, 'cluster_names': nom par code}
+def clusters_to_result(clusters_data):
+    cluster_names = list(clusters_data)
+    rows = [
+        (code, float(latitude), float(longitude), label_fr or '')
+        for code, cluster_name in enumerate(cluster_names)
+        for latitude, longitude, label_fr in clusters_data[cluster_name]
+    ]
+    label_width = max((len(row[3]) for row in rows), default=1)
+    return {
+        'points': np.array(rows, dtype=result_dtype(label_width)),
+        # Utilisation d'une couleur cyclique pour chaque cluster
+        'colors': [COLORS[code % len(COLORS)] for code in range(len(cluster_names))],
+        'cluster_names': cluster_names
+    }
+
+
+# Couleur de chaque ligne du résultat
+def point_colors(result):
+    return np.array(result['colors'], dtype=object)[result['points']['cluster']]
+
+
+# Sauvegarde du résultat : path.npy (tableau structuré) et path.json (catégories)
+def save_result(path, result):
+    np.save(f'{path}.npy', result['points'], allow_pickle=False)
+    with open(f'{path}.json', 'w', encoding='utf-8') as file:
+        json.dump({'colors': result['colors'], 'cluster_names': result['cluster_names']}, file, ensure_ascii=False)
+
+
+# Lecture d'un résultat sauvegardé ; le tableau est mappé en mémoire (aucune copie ni analyse)
+def load_result(path, mmap=True):
+    with open(f'{path}.json', encoding='utf-8') as file:
+        categories = json.load(file)
+    points = np.load(f'{path}.npy', mmap_mode='r' if mmap else None, allow_pickle=False)
+    return dict(categories, points=points)
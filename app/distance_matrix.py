@@ -0,0 +1,51 @@
+import numpy as np
+
+
+# Rayon terrestre moyen (m) utilisé par la formule de haversine
+EARTH_RADIUS_M = 6371008.8
+
+# Coût affecté aux trajets impossibles signalés par un moteur d'itinéraire (None / inf)
+UNREACHABLE_COST = 10 ** 9
+
+
+# Matrice (n, n) des distances haversine en mètres entre des coordonnées (latitude, longitude),
+# calculée par broadcasting NumPy ; dtype=np.float32 divise la mémoire par deux
+def haversine_matrix(coordinates, dtype=np.float64):
+    coordinates = np.radians(np.asarray(coordinates, dtype=np.float64).reshape(-1, 2))
+    lat = coordinates[:, 0]
+    lon = coordinates[:, 1]
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    matrix = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return matrix.astype(dtype, copy=False)
+
+
+# Matrice entière pour OR-Tools : coûts multipliés par scale puis arrondis (1 = mètre près)
+def to_integer_matrix(matrix, scale=1):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    matrix = np.where(np.isfinite(matrix), np.rint(matrix * scale), UNREACHABLE_COST)
+    return np.minimum(matrix, UNREACHABLE_COST).astype(np.int64)
+
+
+# Matrice éventuellement asymétrique fournie par un moteur d'itinéraire (ex. /matrix
+# d'OpenRouteService) : validation de la forme, trajets impossibles remplacés par UNREACHABLE_COST
+def from_routing_engine(values, dtype=np.float64):
+    matrix = np.array([[np.inf if value is None else value for value in row] for row in values], dtype=np.float64)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError(f"La matrice du moteur d'itinéraire doit être carrée : {matrix.shape}")
+    np.fill_diagonal(matrix, 0)
+    matrix[~np.isfinite(matrix)] = UNREACHABLE_COST
+    return matrix.astype(dtype, copy=False)
+
+
+# Matrice des distances prête pour solve_tsp : haversine par défaut, ou valeurs d'un moteur
+# d'itinéraire si routing_matrix est fournie ; as_integer=True renvoie des entiers mis à l'échelle
+def build_distance_matrix(coordinates=None, routing_matrix=None, dtype=np.float64, as_integer=True, scale=1):
+    if routing_matrix is not None:
+        matrix = from_routing_engine(routing_matrix, dtype=dtype)
+    else:
+        matrix = haversine_matrix(coordinates, dtype=dtype)
+    if as_integer:
+        return to_integer_matrix(matrix, scale=scale)
+    return matrix
@@ -0,0 +1,115 @@
+import csv
+import io
+import re
+import requests
+from requests.adapters import HTTPAdapter
+from result_cache import ResultCache
+
+
+# API Adresse (Base Adresse Nationale)
+GEOCODING_URL = 'https://api-adresse.data.gouv.fr'
+
+# Délais (secondes) de connexion et de lecture des requêtes de géocodage
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Une adresse géocodée reste valable longtemps : 30 jours en cache
+GEOCODING_CACHE_TTL = 30 * 24 * 3600
+
+# Valeur mise en cache pour une adresse sans résultat (distincte d'un défaut de cache)
+NOT_FOUND = {}
+
+
+class GeocodingError(Exception):
+    pass
+
+
+# Normalisation d'une adresse pour la clé de cache : casse, espaces et séparateurs
+def normalize_address(address):
+    return re.sub(r'[\s,;]+', ' ', address).strip(' .').lower()
+
+
+# Client de géocodage : session HTTP partagée (keep-alive), délais, cache mémoire borné
+# et cache disque optionnel des adresses normalisées
+class Geocoder:
+    def __init__(self, base_url=GEOCODING_URL, timeout=DEFAULT_TIMEOUT, max_entries=1024,
+                 cache_dir=None, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        # Compteurs gardés dans self.cache.metrics : clustering_result_cache_events_total ne
+        # compte que le cache des clusters
+        self.cache = ResultCache(max_entries=max_entries, ttl=GEOCODING_CACHE_TTL, disk_dir=cache_dir, registry=None)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    # Coordonnées {'latitude', 'longitude'} de l'adresse, ou None si elle est introuvable
+    def geocode(self, address):
+        key = normalize_address(address)
+        if not key:
+            return None
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached or None
+
+        try:
+            response = self.session.get(f'{self.base_url}/search/', params={'q': key, 'limit': 1},
+                                        timeout=self.timeout)
+        except requests.RequestException as e:
+            raise GeocodingError(f"Erreur lors de la requête de géocodage : {str(e)}") from e
+        if response.status_code != 200:
+            raise GeocodingError(
+                f"Erreur lors de la récupération des coordonnées pour '{address}' : {response.status_code}")
+
+        features = response.json().get('features', [])
+        coordinates = NOT_FOUND
+        if features:
+            coordinates = {
+                'latitude': float(features[0]['geometry']['coordinates'][1]),
+                'longitude': float(features[0]['geometry']['coordinates'][0])
+            }
+        self.cache.set(key, coordinates)
+        return coordinates or None
+
+    # Géocodage d'une liste d'adresses en une seule requête /search/csv/ pour les adresses
+    # absentes du cache ; renvoie un dict adresse -> coordonnées (ou None)
+    def geocode_batch(self, addresses):
+        keys = {address: normalize_address(address) for address in addresses}
+        resolved = {}
+        missing = []
+        for key in dict.fromkeys(keys.values()):
+            cached = self.cache.get(key) if key else NOT_FOUND
+            if cached is None:
+                missing.append(key)
+            else:
+                resolved[key] = cached or None
+
+        if missing:
+            body = io.StringIO()
+            writer = csv.writer(body)
+            writer.writerow(['address'])
+            writer.writerows([key] for key in missing)
+            try:
+                response = self.session.post(
+                    f'{self.base_url}/search/csv/',
+                    files={'data': ('addresses.csv', body.getvalue().encode('utf-8'), 'text/csv')},
+                    data={'columns': 'address'},
+                    timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                raise GeocodingError(f"Erreur lors de la requête de géocodage : {str(e)}") from e
+            if response.status_code != 200:
+                raise GeocodingError(f"Erreur lors du géocodage par lot : {response.status_code}")
+
+            for row in csv.DictReader(io.StringIO(response.content.decode('utf-8-sig'))):
+                key = row['address']
+                coordinates = NOT_FOUND
+                if row.get('latitude') and row.get('longitude'):
+                    coordinates = {'latitude': float(row['latitude']), 'longitude': float(row['longitude'])}
+                self.cache.set(key, coordinates)
+                resolved[key] = coordinates or None
+
+        return {address: resolved.get(key) for address, key in keys.items()}
@@ -0,0 +1,215 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+logger = logging.getLogger('clustering.stages')
+
+# Bornes (secondes) des histogrammes de durée
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS_HELP = {
+    'clustering_stage_duration_seconds': ('histogram', "Durée d'une étape du pipeline de clustering"),
+    'clustering_stage_rows_total': ('counter', "Lignes traitées par une étape du pipeline de clustering"),
+    'clustering_stage_memory_peak_bytes': ('gauge', "Pic mémoire Python de la dernière exécution d'une étape"),
+    'clustering_stage_rss_delta_bytes': ('gauge', "Variation de la mémoire résidente pendant la dernière "
+                                                  "exécution d'une étape"),
+    'http_request_duration_seconds': ('histogram', "Durée des requêtes HTTP par route"),
+    'clustering_jobs_total': ('counter', "Jobs de clustering de l'API par statut final (ou dédupliqués)"),
+    'clustering_result_cache_events_total': ('counter', "Événements du cache de résultats de clustering "
+                                                        "(succès, échecs, évictions, invalidations...)"),
+}
+
+
+# Taille d'une page mémoire, pour convertir /proc/self/statm en octets
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+# Mémoire résidente actuelle du processus (octets), lue dans /proc/self/statm ; None hors Linux
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, **extra):
+    items = list(labels) + sorted(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label_value(value)}"' for key, value in items) + '}'
+
+
+# Registre de métriques en mémoire, restitué au format texte de Prometheus (voir render)
+class MetricsRegistry:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            histogram = self._histograms.setdefault(self._key(name, labels), {
+                'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0
+            })
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            key = self._key(name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def render(self):
+        with self._lock:
+            series = {}
+            for (name, labels), histogram in self._histograms.items():
+                lines = series.setdefault(name, [])
+                for bound, count in zip(self.buckets, histogram['buckets']):
+                    lines.append(f"{name}_bucket{format_labels(labels, le=bound)} {count}")
+                lines.append(f"{name}_bucket{format_labels(labels, le='+Inf')} {histogram['count']}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+            for metrics in (self._counters, self._gauges):
+                for (name, labels), value in metrics.items():
+                    series.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+        output = []
+        for name in sorted(series):
+            metric_type, help_text = METRICS_HELP.get(name, ('untyped', name))
+            output += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+            output += series[name]
+        return '\n'.join(output) + '\n'
+
+
+# Registre partagé par le processus (exposé par /metrics sur l'API)
+METRICS = MetricsRegistry()
+
+
+# Métriques d'une étape terminée (voir StageRecorder.stage)
+def record_stage_metrics(registry, record):
+    registry.observe('clustering_stage_duration_seconds', record['seconds'], stage=record['stage'])
+    if record['rows'] is not None:
+        registry.inc('clustering_stage_rows_total', record['rows'], stage=record['stage'])
+    if 'memory_peak_bytes' in record:
+        registry.set('clustering_stage_memory_peak_bytes', record['memory_peak_bytes'], stage=record['stage'])
+    if record.get('rss_delta_bytes') is not None:
+        registry.set('clustering_stage_rss_delta_bytes', record['rss_delta_bytes'], stage=record['stage'])
+
+
+# Compteurs du cache de résultats, {événement: nombre} (voir result_cache.ResultCache.metrics)
+def record_cache_metrics(registry, counts):
+    for event, count in counts.items():
+        if count:
+            registry.inc('clustering_result_cache_events_total', count, event=event)
+
+
+# Chronométrage des étapes d'un run : une entrée par étape (durée, lignes, mémoire), un log
+# structuré JSON par étape et, en option, profil cProfile et pics mémoire tracemalloc.
+# listener(event, record) est appelé au début ('start') et à la fin ('end') de chaque étape ;
+# une exception levée au début interrompt le run (annulation).
+class StageRecorder:
+    def __init__(self, run_id=None, profile=False, trace_memory=False, registry=METRICS, listener=None):
+        self.run_id = run_id
+        self.stages = []
+        self.registry = registry
+        self.listener = listener
+        self.trace_memory = trace_memory
+        self.profiler = cProfile.Profile() if profile else None
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    # Usage : with recorder.stage('sql_fetch') as stage: ...; stage['rows'] = len(rows)
+    @contextmanager
+    def stage(self, name, rows=None):
+        record = {'stage': name, 'rows': rows}
+        if self.listener is not None:
+            self.listener('start', record)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if tracing:
+                record['memory_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            # Variation de la mémoire résidente pendant l'étape (négative si de la mémoire est
+            # rendue au système) ; toujours mesurée, contrairement au pic tracemalloc
+            rss_after = current_rss_bytes()
+            record['rss_delta_bytes'] = None if rss_before is None or rss_after is None else rss_after - rss_before
+            self.stages.append(record)
+            logger.info(json.dumps(dict(record, run_id=self.run_id)))
+            if self.registry is not None:
+                record_stage_metrics(self.registry, record)
+            if self.listener is not None:
+                self.listener('end', record)
+
+    @property
+    def total_seconds(self):
+        return sum(record['seconds'] for record in self.stages)
+
+    # Tableau texte des étapes, pour la console
+    def summary(self):
+        lines = [f"{'étape':<16}{'durée (s)':>12}{'lignes':>10}{'pic mémoire (Mo)':>18}{'Δ RSS (Mo)':>12}"]
+        for record in self.stages:
+            rows = '' if record['rows'] is None else record['rows']
+            memory = record.get('memory_peak_bytes')
+            memory = '' if memory is None else f"{memory / 2 ** 20:.1f}"
+            rss = record.get('rss_delta_bytes')
+            rss = '' if rss is None else f"{rss / 2 ** 20:+.1f}"
+            lines.append(f"{record['stage']:<16}{record['seconds']:>12.3f}{rows:>10}{memory:>18}{rss:>12}")
+        lines.append(f"{'total':<16}{self.total_seconds:>12.3f}")
+        return '\n'.join(lines)
+
+    # Fonctions les plus coûteuses du profil cProfile (temps cumulé)
+    def profile_stats(self, limit=20):
+        if self.profiler is None:
+            return ''
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def dump_profile(self, path):
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
@@ -0,0 +1,124 @@
+import folium
+import numpy as np
+from folium.plugins import FastMarkerCluster
+
+
+# Au-delà de ce nombre de points, les POIs sont regroupés côté navigateur (FastMarkerCluster)
+FAST_CLUSTER_THRESHOLD = 2000
+
+# Tolérance (mètres) de simplification des tracés d'itinéraire
+DEFAULT_SIMPLIFY_TOLERANCE = 5.0
+
+EARTH_RADIUS_M = 6371008.8
+
+# Marqueur JavaScript d'un point [lat, lon, couleur, label] de FastMarkerCluster
+FAST_MARKER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 6, color: row[2], fillColor: row[2], fillOpacity: 0.8, weight: 1
+    });
+    marker.bindTooltip(row[3]);
+    return marker;
+};
+"""
+
+
+# Collection GeoJSON de points, la couleur et le label étant des propriétés de chaque point
+def points_geojson(latitudes, longitudes, colors, labels):
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [float(longitude), float(latitude)]},
+                'properties': {'color': str(color), 'label': str(label)}
+            }
+            for latitude, longitude, color, label in zip(latitudes, longitudes, colors, labels)
+        ]
+    }
+
+
+# Une seule couche pour tous les points : GeoJSON de cercles dessinés sur canvas, ou
+# FastMarkerCluster (données brutes + un seul callback JS) pour les gros volumes
+def add_points_layer(map, latitudes, longitudes, colors, labels, name='POIs', mode='auto'):
+    # Aucun point (aucun POI dans le rayon ou aucun cluster retenu) : carte vide, sans couche,
+    # GeoJsonTooltip refusant une collection sans propriétés
+    if len(latitudes) == 0:
+        return map
+    if mode == 'auto':
+        mode = 'fast_cluster' if len(latitudes) > FAST_CLUSTER_THRESHOLD else 'geojson'
+    if mode == 'fast_cluster':
+        data = [[float(latitude), float(longitude), str(color), str(label)]
+                for latitude, longitude, color, label in zip(latitudes, longitudes, colors, labels)]
+        FastMarkerCluster(data, callback=FAST_MARKER_CALLBACK, name=name).add_to(map)
+    else:
+        folium.GeoJson(
+            points_geojson(latitudes, longitudes, colors, labels),
+            name=name,
+            marker=folium.CircleMarker(radius=6, weight=1, fill_opacity=0.8),
+            style_function=lambda feature: {
+                'color': feature['properties']['color'],
+                'fillColor': feature['properties']['color']
+            },
+            tooltip=folium.GeoJsonTooltip(fields=['label'], labels=False)
+        ).add_to(map)
+    return map
+
+
+# Carte des POIs du résultat columnaire (voir clusters_result), dessinée sur canvas
+def clusters_map(result, center, zoom_start=12, mode='auto'):
+    map = folium.Map(location=list(center), zoom_start=zoom_start, prefer_canvas=True)
+    points = result['points']
+    colors = np.asarray(result['colors'], dtype=object)[points['cluster']]
+    return add_points_layer(map, points['latitude'], points['longitude'], colors, points['label_fr'], mode=mode)
+
+
+# Carte des étapes [lat, lon] d'un itinéraire, numérotées « Étape i »
+def steps_map(coordinates, zoom_start=13):
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    map = folium.Map(location=coordinates[0].tolist(), zoom_start=zoom_start, prefer_canvas=True)
+    labels = [f"Étape {i + 1}" for i in range(len(coordinates))]
+    return add_points_layer(map, coordinates[:, 0], coordinates[:, 1], ['blue'] * len(coordinates), labels,
+                            name='Étapes')
+
+
+# Simplification Douglas-Peucker d'une polyligne [lat, lon] ; tolerance en mètres,
+# mesurée dans une projection équirectangulaire locale
+def simplify_polyline(coordinates, tolerance=DEFAULT_SIMPLIFY_TOLERANCE):
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if len(coordinates) < 3 or tolerance <= 0:
+        return coordinates.tolist()
+    lat0 = np.radians(coordinates[:, 0].mean())
+    points = np.column_stack([
+        np.radians(coordinates[:, 1]) * np.cos(lat0) * EARTH_RADIUS_M,
+        np.radians(coordinates[:, 0]) * EARTH_RADIUS_M
+    ])
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        segment = points[last] - points[first]
+        offsets = points[first + 1:last] - points[first]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return coordinates[keep].tolist()
+
+
+# Ajout d'un tracé [lat, lon] simplifié à la carte
+def add_route_line(map, coordinates, color='blue', tolerance=DEFAULT_SIMPLIFY_TOLERANCE, tooltip=None):
+    folium.PolyLine(simplify_polyline(coordinates, tolerance), color=color, weight=2.5, opacity=1,
+                    tooltip=tooltip).add_to(map)
+    return map
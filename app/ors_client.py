@@ -0,0 +1,206 @@
+import math
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from result_cache import ResultCache
+
+
+ORS_URL = 'https://api.openrouteservice.org'
+
+PROFILES = ['driving-car', 'cycling-regular', 'foot-walking']
+
+# Délais (secondes) de connexion et de lecture des requêtes OpenRouteService
+DEFAULT_TIMEOUT = (3.05, 30)
+
+# Limites par appel de l'offre standard : points de passage d'un itinéraire et
+# nombre de cellules (sources x destinations) d'une requête /matrix
+MAX_DIRECTIONS_WAYPOINTS = 50
+MAX_MATRIX_ELEMENTS = 3500
+
+# Débit maximal (requêtes par minute) et nombre de nouvelles tentatives sur HTTP 429
+DEFAULT_REQUESTS_PER_MINUTE = 40
+MAX_RETRIES = 3
+
+# Attente maximale (secondes) acceptée d'un en-tête Retry-After avant une nouvelle tentative
+MAX_RETRY_AFTER = 60
+
+# Les itinéraires routiers changent peu : 24 h en cache
+ORS_CACHE_TTL = 24 * 3600
+
+# Décimales conservées sur les coordonnées de la clé de cache (5 décimales ≈ 1 m)
+COORDINATE_PRECISION = 5
+
+
+class ORSError(Exception):
+    pass
+
+
+# Limiteur de débit à seau de jetons, partagé entre les threads
+class RateLimiter:
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE):
+        self.capacity = requests_per_minute
+        self.rate = requests_per_minute / 60.0
+        self.tokens = float(requests_per_minute)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Délai (secondes) d'un en-tête Retry-After, en secondes ou en date HTTP (RFC 9110) ;
+# default si l'en-tête est absent ou illisible, plafonné à MAX_RETRY_AFTER
+def retry_after_seconds(value, default):
+    if value is None:
+        return default
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError, IndexError):
+            return default
+    if math.isnan(delay):
+        return default
+    return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+
+# Clé de cache d'une suite de coordonnées [lon, lat]
+def coordinates_key(coordinates):
+    return tuple((round(float(lon), COORDINATE_PRECISION), round(float(lat), COORDINATE_PRECISION))
+                 for lon, lat in coordinates)
+
+
+# Client OpenRouteService : session HTTP partagée, cache des itinéraires et des matrices,
+# découpage des requêtes au-delà des limites par appel et respect du débit autorisé
+class ORSClient:
+    def __init__(self, api_key=None, base_url=ORS_URL, timeout=DEFAULT_TIMEOUT,
+                 requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, cache_dir=None, max_entries=256,
+                 max_waypoints=MAX_DIRECTIONS_WAYPOINTS, max_matrix_elements=MAX_MATRIX_ELEMENTS, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_waypoints = max_waypoints
+        self.max_matrix_elements = max_matrix_elements
+        # Compteurs gardés dans self.cache.metrics, hors des métriques du cache des clusters
+        self.cache = ResultCache(max_entries=max_entries, ttl=ORS_CACHE_TTL, disk_dir=cache_dir, registry=None)
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': api_key if api_key is not None else os.getenv('OPENROUTE_API_KEY', ''),
+            'Content-Type': 'application/json; charset=utf-8',
+            'Accept': 'application/json, application/geo+json, application/gpx+xml; charset=utf-8'
+        })
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def _post(self, path, body):
+        for attempt in range(MAX_RETRIES + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.post(f'{self.base_url}{path}', json=body, timeout=self.timeout)
+            except requests.RequestException as e:
+                raise ORSError(f"Erreur lors de la requête OpenRouteService : {str(e)}") from e
+            if response.status_code == 429 and attempt < MAX_RETRIES:
+                # Quota dépassé : attendre le délai indiqué par le serveur (ou un délai croissant)
+                time.sleep(retry_after_seconds(response.headers.get('Retry-After'), 2 ** attempt))
+                continue
+            if response.status_code != 200:
+                raise ORSError(f"Erreur lors de la récupération de l'itinéraire : {response.status_code}")
+            return response
+        raise ORSError("Quota OpenRouteService dépassé.")
+
+    # Itinéraire GeoJSON passant par coordinates ([lon, lat]) ; au-delà de max_waypoints,
+    # l'itinéraire est calculé par tronçons qui se chevauchent d'un point puis recollé
+    def directions(self, coordinates, profile='driving-car'):
+        if profile not in PROFILES:
+            raise ORSError("Mode de transport non valide.")
+        key = ('directions', profile, coordinates_key(coordinates))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        step = self.max_waypoints - 1
+        segments = [coordinates[start:start + self.max_waypoints]
+                    for start in range(0, max(len(coordinates) - 1, 1), step)]
+        features = []
+        for segment in segments:
+            response = self._post(f'/v2/directions/{profile}/geojson', {'coordinates': segment})
+            features.append(response.json()['features'][0])
+
+        route = features[0]
+        if len(features) > 1:
+            line = list(features[0]['geometry']['coordinates'])
+            for feature in features[1:]:
+                # Le premier point d'un tronçon est le dernier du précédent
+                line.extend(feature['geometry']['coordinates'][1:])
+            summaries = [feature.get('properties', {}).get('summary', {}) for feature in features]
+            route = {
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': line},
+                'properties': {'summary': {
+                    'distance': sum(summary.get('distance', 0) for summary in summaries),
+                    'duration': sum(summary.get('duration', 0) for summary in summaries)
+                }}
+            }
+        data = {'type': 'FeatureCollection', 'features': [route]}
+        self.cache.set(key, data)
+        return data
+
+    # Itinéraire au format GPX (texte), sans découpage
+    def directions_gpx(self, coordinates, profile='driving-car'):
+        if profile not in PROFILES:
+            raise ORSError("Mode de transport non valide.")
+        key = ('gpx', profile, coordinates_key(coordinates))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        gpx_data = self._post(f'/v2/directions/{profile}/gpx', {'coordinates': coordinates}).text
+        self.cache.set(key, gpx_data)
+        return gpx_data
+
+    # Matrice (asymétrique) des distances en mètres ou des durées en secondes entre toutes les
+    # coordinates ([lon, lat]), assemblée par blocs de sources x destinations si nécessaire
+    def matrix(self, coordinates, profile='driving-car', metric='distance'):
+        if profile not in PROFILES:
+            raise ORSError("Mode de transport non valide.")
+        key = ('matrix', profile, metric, coordinates_key(coordinates))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        n = len(coordinates)
+        block = max(1, min(n, int(self.max_matrix_elements ** 0.5)))
+        values = [[None] * n for _ in range(n)]
+        for row_start in range(0, n, block):
+            sources = list(range(row_start, min(row_start + block, n)))
+            for col_start in range(0, n, block):
+                destinations = list(range(col_start, min(col_start + block, n)))
+                # Seuls les points du bloc sont envoyés ; sources/destinations y sont réindexées
+                locations = sorted(set(sources) | set(destinations))
+                position = {node: i for i, node in enumerate(locations)}
+                response = self._post(f'/v2/matrix/{profile}', {
+                    'locations': [coordinates[node] for node in locations],
+                    'sources': [position[node] for node in sources],
+                    'destinations': [position[node] for node in destinations],
+                    'metrics': [metric]
+                })
+                result = response.json()[f'{metric}s']
+                for i, source in enumerate(sources):
+                    for j, destination in enumerate(destinations):
+                        values[source][destination] = result[i][j]
+        self.cache.set(key, values)
+        return values
@@ -0,0 +1,303 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import psycopg2
+from clustering import DATA_VERSION_QUERY, POSTGRES_CONFIG, bounding_box, within_radius
+
+
+# Côté (degrés) des cellules de la grille latitude/longitude (0,05° ≈ 5,5 km en latitude)
+DEFAULT_CELL_SIZE = 0.05
+
+INDEX_FORMAT_VERSION = 2
+
+# Nombre de POIs dont les chaînes sont décodées d'un coup quand un IndexPois est parcouru
+DEFAULT_DECODE_BLOCK = 10_000
+
+# Instantané complet de la jointure datatourisme / types_de_poi (une ligne par POI et par type)
+SNAPSHOT_QUERY = (
+    "SELECT dt.label_fr, dt.latitude, dt.longitude, tp.type, dt.id "
+    "FROM datatourisme dt "
+    "JOIN liaison_datatourisme_types_de_poi ldtp ON dt.id = ldtp.id_datatourisme "
+    "JOIN types_de_poi tp ON ldtp.id_type_de_poi = tp.id"
+)
+
+# Tableaux du répertoire de l'index, tous mappés en mémoire au chargement
+ARRAYS = ['latitudes', 'longitudes', 'type_masks', 'cell_ids', 'cell_starts', 'label_offsets', 'labels',
+          'id_offsets', 'ids']
+
+
+# Numéro de ligne/colonne de la grille des coordonnées
+def grid_rows(latitudes, cell_size):
+    n_rows = int(np.ceil(180 / cell_size))
+    return np.clip(np.floor((np.asarray(latitudes, dtype=np.float64) + 90) / cell_size), 0, n_rows - 1).astype(np.int64)
+
+
+def grid_cols(longitudes, cell_size):
+    n_cols = int(np.ceil(360 / cell_size))
+    return np.floor((np.asarray(longitudes, dtype=np.float64) + 180) / cell_size).astype(np.int64) % n_cols
+
+
+# Concaténation UTF-8 de chaînes et décalages [offsets[i], offsets[i + 1]) de chacune
+def encode_strings(values):
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+# Construction de l'index à partir des lignes (label_fr, latitude, longitude, type, id) de SNAPSHOT_QUERY.
+# Un POI (identifiant DataTourisme) apparaît une seule fois, ses types étant réunis dans un masque de bits ;
+# les POIs sont triés par cellule, chaque cellule correspondant à une tranche contiguë des tableaux.
+def build_poi_index(rows, path, cell_size=DEFAULT_CELL_SIZE, data_version=None):
+    positions = {}
+    ids, labels, latitudes, longitudes, poi_types = [], [], [], [], []
+    types = {}
+    invalid_count = 0
+    for label_fr, latitude, longitude, poi_type, poi_id in rows:
+        try:
+            latitude, longitude = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            invalid_count += 1
+            continue
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            invalid_count += 1
+            continue
+        poi_id = str(poi_id)
+        position = positions.get(poi_id)
+        if position is None:
+            position = positions[poi_id] = len(labels)
+            ids.append(poi_id)
+            labels.append(label_fr or '')
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+            poi_types.append(set())
+        poi_types[position].add(types.setdefault(poi_type, len(types)))
+    if invalid_count:
+        print(f"Coordonnées incorrectes : {invalid_count} ligne(s) ignorée(s)")
+
+    n_pois = len(labels)
+    n_words = max(1, (len(types) + 63) // 64)
+    type_masks = np.zeros((n_pois, n_words), dtype=np.uint64)
+    for position, bits in enumerate(poi_types):
+        for bit in bits:
+            type_masks[position, bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+
+    latitudes = np.array(latitudes, dtype=np.float64)
+    longitudes = np.array(longitudes, dtype=np.float64)
+    n_cols = int(np.ceil(360 / cell_size))
+    cells = grid_rows(latitudes, cell_size) * n_cols + grid_cols(longitudes, cell_size)
+    order = np.argsort(cells, kind='stable')
+    cell_ids, cell_starts = np.unique(cells[order], return_index=True)
+
+    label_offsets, label_bytes = encode_strings([labels[position] for position in order])
+    id_offsets, id_bytes = encode_strings([ids[position] for position in order])
+
+    os.makedirs(path, exist_ok=True)
+    arrays = {
+        'latitudes': latitudes[order].astype(np.float32),
+        'longitudes': longitudes[order].astype(np.float32),
+        'type_masks': type_masks[order],
+        'cell_ids': cell_ids.astype(np.int64),
+        'cell_starts': np.append(cell_starts, n_pois).astype(np.int64),
+        'label_offsets': label_offsets,
+        'labels': label_bytes,
+        'id_offsets': id_offsets,
+        'ids': id_bytes
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), array, allow_pickle=False)
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as file:
+        json.dump({
+            'format': INDEX_FORMAT_VERSION,
+            'cell_size': cell_size,
+            'types': sorted(types, key=types.get),
+            'poi_count': n_pois,
+            'data_version': data_version,
+            'built_at': time.time()
+        }, file, ensure_ascii=False)
+    return n_pois
+
+
+# Index spatial des POIs DataTourisme par cellule et par type, lu depuis le disque
+# (voir build_poi_index) : une recherche ne lit que les cellules qui touchent le rayon
+class PoiIndex:
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as file:
+            self.meta = json.load(file)
+        if self.meta.get('format') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Format d'index non pris en charge : {self.meta.get('format')}")
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r', allow_pickle=False))
+        self.cell_size = self.meta['cell_size']
+        self.n_cols = int(np.ceil(360 / self.cell_size))
+        self.types = self.meta['types']
+        self.type_bits = {poi_type: bit for bit, poi_type in enumerate(self.types)}
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    # Version des données au moment de la construction (voir DATA_VERSION_QUERY)
+    @property
+    def data_version(self):
+        return self.meta.get('data_version')
+
+    # Masque de bits (un mot de 64 bits par colonne de type_masks) des types demandés
+    def types_mask(self, poi_types):
+        mask = np.zeros(self.type_masks.shape[1], dtype=np.uint64)
+        for poi_type in poi_types:
+            bit = self.type_bits.get(poi_type)
+            if bit is not None:
+                mask[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        return mask
+
+    # Tranches [début, fin) des POIs des cellules qui touchent la boîte englobante du cercle
+    def cell_ranges(self, position, radius_km):
+        min_lat, max_lat, delta_lon = bounding_box(position, radius_km)
+        first_row, last_row = grid_rows([min_lat, max_lat], self.cell_size)
+        if delta_lon is None or 2 * delta_lon >= 360 - self.cell_size:
+            col_ranges = [(0, self.n_cols - 1)]
+        else:
+            first_col = int(np.floor((position[1] - delta_lon + 180) / self.cell_size))
+            last_col = int(np.floor((position[1] + delta_lon + 180) / self.cell_size))
+            # Une boîte qui traverse l'antiméridien couvre les deux bords de la grille
+            if first_col < 0:
+                col_ranges = [(first_col % self.n_cols, self.n_cols - 1), (0, last_col)]
+            elif last_col >= self.n_cols:
+                col_ranges = [(first_col, self.n_cols - 1), (0, last_col % self.n_cols)]
+            else:
+                col_ranges = [(first_col, last_col)]
+
+        ranges = []
+        for row in range(int(first_row), int(last_row) + 1):
+            for first_col, last_col in col_ranges:
+                first_cell = np.searchsorted(self.cell_ids, row * self.n_cols + first_col, side='left')
+                last_cell = np.searchsorted(self.cell_ids, row * self.n_cols + last_col, side='right')
+                if last_cell > first_cell:
+                    ranges.append((int(self.cell_starts[first_cell]), int(self.cell_starts[last_cell])))
+        return ranges
+
+    def label(self, position):
+        return bytes(self.labels[self.label_offsets[position]:self.label_offsets[position + 1]]).decode('utf-8')
+
+    def poi_id(self, position):
+        return bytes(self.ids[self.id_offsets[position]:self.id_offsets[position + 1]]).decode('utf-8')
+
+    # Chaînes des positions : les octets sont rassemblés en une fois par indexation NumPy,
+    # séparés par un octet nul (absent des textes PostgreSQL), puis décodés et découpés en bloc
+    @staticmethod
+    def strings(offsets, blob, positions):
+        if len(positions) == 0:
+            return []
+        starts = offsets[positions]
+        lengths = offsets[positions + 1] - starts
+        ends = np.cumsum(lengths)
+        byte_positions = np.repeat(starts - (ends - lengths), lengths) + np.arange(int(ends[-1]))
+        data = np.insert(blob[byte_positions], ends, 0)
+        return data.tobytes().decode('utf-8').split('\x00')[:-1]
+
+    # Listes des types demandés de chaque POI, construites une fois par combinaison de types
+    def requested_types(self, masks, poi_types):
+        requested = [(poi_type, self.type_bits[poi_type]) for poi_type in dict.fromkeys(poi_types)
+                     if poi_type in self.type_bits]
+        codes = np.zeros(len(masks), dtype=np.int64)
+        for k, (_, bit) in enumerate(requested):
+            codes |= ((masks[:, bit // 64] >> np.uint64(bit % 64)) & np.uint64(1)).astype(np.int64) << k
+        combinations = {
+            code: [poi_type for k, (poi_type, _) in enumerate(requested) if code >> k & 1]
+            for code in np.unique(codes).tolist()
+        }
+        # Une liste par ligne, comme array_agg côté SQL
+        return list(map(list, map(combinations.__getitem__, codes.tolist())))
+
+    # Recherche par rayon sous forme de colonnes, sans objet Python par POI : positions dans
+    # l'index, coordonnées (float64) et masques de types des POIs des types demandés à moins
+    # de radius_km de position
+    def query_arrays(self, position, poi_types, radius_km):
+        ranges = self.cell_ranges(position, radius_km)
+        if not ranges:
+            return {'positions': np.empty(0, dtype=np.int64), 'latitudes': np.empty(0), 'longitudes': np.empty(0),
+                    'type_masks': np.empty((0, self.type_masks.shape[1]), dtype=np.uint64)}
+        positions = np.concatenate([np.arange(start, end) for start, end in ranges])
+        masks = self.type_masks[positions]
+        selected = (masks & self.types_mask(poi_types)).any(axis=1)
+        positions, masks = positions[selected], masks[selected]
+
+        latitudes = self.latitudes[positions].astype(np.float64)
+        longitudes = self.longitudes[positions].astype(np.float64)
+        inside = within_radius(position, latitudes, longitudes, radius_km)
+        return {'positions': positions[inside], 'latitudes': latitudes[inside], 'longitudes': longitudes[inside],
+                'type_masks': masks[inside]}
+
+    # Résultat en colonnes de query_arrays, utilisable à la place des lignes SQL (voir IndexPois)
+    def pois(self, position, poi_types, radius_km):
+        return IndexPois(self, self.query_arrays(position, poi_types, radius_km), poi_types)
+
+    # POIs des types demandés à moins de radius_km de position, au format des lignes SQL
+    # (label_fr, latitude, longitude, types, id) : une ligne par POI avec ses types demandés
+    def query(self, position, poi_types, radius_km):
+        return self.pois(position, poi_types, radius_km).rows()
+
+
+# POIs trouvés par l'index, en colonnes. Se comporte comme la liste des lignes SQL (len, parcours) :
+# le clustering part directement des tableaux de coordonnées, et labels, identifiants et types ne
+# sont décodés qu'au parcours, par blocs de block_size POIs, quand les POIs sont écrits dans Neo4j.
+class IndexPois:
+    def __init__(self, index, columns, poi_types, block_size=DEFAULT_DECODE_BLOCK):
+        self.index = index
+        self.columns = columns
+        self.poi_types = poi_types
+        self.block_size = block_size
+
+    def __len__(self):
+        return len(self.columns['positions'])
+
+    def __iter__(self):
+        for start in range(0, len(self), self.block_size):
+            yield from self.rows(start, start + self.block_size)
+
+    # Tableau (n, 2) des latitudes et longitudes, sans décodage
+    def coordinates(self):
+        return np.column_stack((self.columns['latitudes'], self.columns['longitudes']))
+
+    # Lignes (label_fr, latitude, longitude, types, id) des POIs start à stop ;
+    # chaînes et types sont décodés en bloc, seules les lignes sont construites en Python
+    def rows(self, start=0, stop=None):
+        positions = self.columns['positions'][start:stop]
+        if len(positions) == 0:
+            return []
+        index = self.index
+        return list(zip(
+            index.strings(index.label_offsets, index.labels, positions),
+            self.columns['latitudes'][start:stop].tolist(),
+            self.columns['longitudes'][start:stop].tolist(),
+            index.requested_types(self.columns['type_masks'][start:stop], self.poi_types),
+            index.strings(index.id_offsets, index.ids, positions)
+        ))
+
+
+# Construction hors ligne de l'index depuis PostgreSQL
+def main():
+    parser = argparse.ArgumentParser(description="Construction de l'index spatial des POIs DataTourisme")
+    parser.add_argument('--output', type=str, default='poi_index', help="Répertoire de l'index")
+    parser.add_argument('--cell_size', type=float, default=DEFAULT_CELL_SIZE,
+                        help="Côté des cellules de la grille, en degrés")
+    args = parser.parse_args()
+
+    start = time.time()
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(DATA_VERSION_QUERY)
+            data_version = int(cursor.fetchone()[0])
+            cursor.execute(SNAPSHOT_QUERY)
+            rows = cursor.fetchall()
+    finally:
+        conn.close()
+    n_pois = build_poi_index(rows, args.output, cell_size=args.cell_size, data_version=data_version)
+    print(f"Index de {n_pois} POIs écrit dans {args.output} en {time.time() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
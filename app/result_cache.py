@@ -0,0 +1,200 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from instrumentation import METRICS, record_cache_metrics
+
+
+# Nombre de décimales conservées sur la position de référence (3 décimales ≈ 100 m)
+DEFAULT_PRECISION = 3
+
+# Durée de vie (secondes) d'un résultat en cache ; doit rester inférieure à la durée
+# de conservation des runs dans Neo4j pour que le run_id renvoyé existe encore
+DEFAULT_TTL = 3600
+
+# Intervalle minimal (secondes) entre deux vérifications de la version des données
+DEFAULT_VERSION_CHECK_INTERVAL = 60
+
+# Intervalle minimal (secondes) entre deux purges des fichiers expirés du niveau disque
+DEFAULT_DISK_PRUNE_INTERVAL = 600
+
+
+# Clé d'une requête de clustering : position arrondie à precision décimales, types triés,
+# rayon, puis les autres paramètres du run
+def make_key(latitude, longitude, poi_types, radius, precision=DEFAULT_PRECISION, **params):
+    return (
+        round(float(latitude), precision),
+        round(float(longitude), precision),
+        tuple(sorted(set(poi_types))),
+        float(radius),
+        tuple(sorted(params.items()))
+    )
+
+
+# Cache LRU/TTL des résultats de clustering, avec un niveau disque optionnel.
+# Les entrées sont invalidées dès que la version des données (version_fn) change.
+# Les compteurs (metrics) sont aussi reportés dans registry (instrumentation.METRICS
+# par défaut, None pour ne rien reporter).
+class ResultCache:
+    def __init__(self, max_entries=128, ttl=DEFAULT_TTL, disk_dir=None, precision=DEFAULT_PRECISION,
+                 version_fn=None, version_check_interval=DEFAULT_VERSION_CHECK_INTERVAL,
+                 disk_prune_interval=DEFAULT_DISK_PRUNE_INTERVAL, registry=METRICS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.precision = precision
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+        self.disk_prune_interval = disk_prune_interval
+        self.registry = registry
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = None
+        self._disk_pruned_at = None
+        self.metrics = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0,
+                        'disk_pruned': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # Clé : voir make_key, à la précision du cache
+    def make_key(self, latitude, longitude, poi_types, radius, **params):
+        return make_key(latitude, longitude, poi_types, radius, precision=self.precision, **params)
+
+    # Version courante des données, relue au plus toutes les version_check_interval secondes
+    def data_version(self):
+        if self.version_fn is None:
+            return None
+        now = time.monotonic()
+        if self._version_checked_at is None or now - self._version_checked_at >= self.version_check_interval:
+            version = self.version_fn()
+            with self._lock:
+                if self._version_checked_at is not None and version != self._version:
+                    # Les tables DataTourisme ont changé : tout le niveau mémoire est périmé
+                    self._count('invalidations')
+                    self._entries.clear()
+                self._version = version
+                self._version_checked_at = now
+        return self._version
+
+    def get(self, key):
+        version = self.data_version()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry, version, now):
+                self._entries.move_to_end(key)
+                self._count('hits')
+                return entry[2]
+            if entry is not None:
+                del self._entries[key]
+
+        entry = self._read_disk(key)
+        if entry is not None and self._is_fresh(entry, version, now):
+            with self._lock:
+                self._store(key, entry)
+                self._count('disk_hits')
+            return entry[2]
+        if entry is not None:
+            # Entrée périmée (TTL ou version des données) : le fichier n'est plus utile
+            self._remove_disk(key)
+
+        with self._lock:
+            self._count('misses')
+        return None
+
+    def set(self, key, value):
+        entry = (self.data_version(), time.time(), value)
+        with self._lock:
+            self._store(key, entry)
+        self._write_disk(key, entry)
+        if self.disk_dir and (self._disk_pruned_at is None
+                              or time.monotonic() - self._disk_pruned_at >= self.disk_prune_interval):
+            self.prune_disk()
+
+    # Suppression des fichiers du niveau disque plus vieux que ttl (date de modification =
+    # date d'écriture), y compris les fichiers temporaires laissés par une écriture interrompue
+    def prune_disk(self):
+        if not self.disk_dir:
+            return 0
+        self._disk_pruned_at = time.monotonic()
+        expired_before = time.time() - self.ttl
+        removed = 0
+        for filename in os.listdir(self.disk_dir):
+            if not filename.endswith(('.pkl', '.tmp')):
+                continue
+            path = os.path.join(self.disk_dir, filename)
+            try:
+                if os.path.getmtime(path) < expired_before:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                # Fichier déjà supprimé par un autre processus partageant le répertoire
+                continue
+        with self._lock:
+            self._count('disk_pruned', removed)
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk_dir:
+            for filename in os.listdir(self.disk_dir):
+                if filename.endswith('.pkl'):
+                    os.remove(os.path.join(self.disk_dir, filename))
+
+    # Compteurs et taille du cache, pour les logs et l'endpoint de métriques
+    def stats(self):
+        with self._lock:
+            lookups = self.metrics['hits'] + self.metrics['disk_hits'] + self.metrics['misses']
+            hit_ratio = (self.metrics['hits'] + self.metrics['disk_hits']) / lookups if lookups else 0.0
+            return dict(self.metrics, entries=len(self._entries), hit_ratio=hit_ratio)
+
+    # À appeler sous self._lock
+    def _count(self, name, value=1):
+        self.metrics[name] += value
+        if self.registry is not None and value:
+            record_cache_metrics(self.registry, {name: value})
+
+    def _is_fresh(self, entry, version, now):
+        entry_version, created_at, _ = entry
+        return entry_version == version and now - created_at <= self.ttl
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._count('evictions')
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.pkl")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as file:
+                stored_key, entry = pickle.load(file)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+        return entry if stored_key == key else None
+
+    def _remove_disk(self, key):
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        # Écriture atomique : fichier temporaire puis renommage
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump((key, entry), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._disk_path(key))
@@ -0,0 +1,125 @@
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+
+# Budget de temps (secondes) par défaut de la recherche locale guidée
+DEFAULT_TIME_LIMIT = 2.0
+
+# Coefficient d'équilibrage des journées : pénalise l'écart entre la plus longue et la plus courte
+DAY_SPAN_COST_COEFFICIENT = 100
+
+# Borne haute de la distance parcourue en une journée si aucune limite n'est donnée
+MAX_DAY_COST = 10 ** 12
+
+
+# Insertion de chaque arrêt dans la route (et à la position) où elle coûte le moins ;
+# end vaut None pour une route ouverte
+def cheapest_insertion(routes, stops, distance_matrix, start, end=None):
+    routes = [list(route) for route in routes]
+    for stop in stops:
+        best = None
+        for r, route in enumerate(routes):
+            path = [start] + route + ([end] if end is not None else [])
+            for position in range(len(route) + 1):
+                previous = path[position]
+                cost = distance_matrix[previous][stop]
+                if position + 1 < len(path):
+                    following = path[position + 1]
+                    cost += distance_matrix[stop][following] - distance_matrix[previous][following]
+                if best is None or cost < best[0]:
+                    best = (cost, r, position)
+        routes[best[1]].insert(best[2], stop)
+    return routes
+
+
+# Routes initiales dans la numérotation des nouveaux arrêts, à partir d'une solution précédente :
+# les arrêts conservés gardent leur ordre, les arrêts ajoutés sont insérés au moindre coût.
+# previous_ids / stop_ids identifient les arrêts (ex. coordonnées arrondies) avant / après édition ;
+# start et end ont le même sens que pour optimize_routes.
+def warm_start_routes(previous_routes, previous_ids, stop_ids, distance_matrix, start=0, end=None):
+    index_of = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+    closing_node = None if end == 'open' else (start if end is None else end)
+    fixed = {start, closing_node}
+    routes = []
+    kept = set()
+    for route in previous_routes:
+        remapped = []
+        for node in route:
+            if node >= len(previous_ids):
+                continue
+            new_node = index_of.get(previous_ids[node])
+            if new_node is not None and new_node not in fixed and new_node not in kept:
+                remapped.append(new_node)
+                kept.add(new_node)
+        routes.append(remapped)
+    added = [i for i in range(len(stop_ids)) if i not in fixed and i not in kept]
+    return cheapest_insertion(routes or [[]], added, distance_matrix, start, closing_node)
+
+
+# Optimisation des tournées sur une matrice de coûts entiers (voir distance_matrix.to_integer_matrix).
+#   num_days       : nombre de journées (véhicules), équilibrées entre elles
+#   start          : nœud de départ (l'adresse de l'utilisateur)
+#   end            : nœud d'arrivée, None pour revenir au départ, 'open' pour finir n'importe où
+#   time_limit     : budget en secondes de la recherche locale guidée (0 : première solution seule)
+#   initial_routes : routes de départ (sans les nœuds de départ/arrivée), ex. warm_start_routes
+# Renvoie une liste de routes (une par journée), chacune commençant au départ, ou None.
+def optimize_routes(distance_matrix, num_days=1, start=0, end=None, time_limit=DEFAULT_TIME_LIMIT,
+                    initial_routes=None, max_day_cost=None):
+    matrix = [[int(value) for value in row] for row in distance_matrix]
+    n = len(matrix)
+    open_end = end == 'open'
+    if open_end:
+        # Nœud fictif d'arrivée, atteignable gratuitement depuis n'importe quel arrêt
+        for row in matrix:
+            row.append(0)
+        matrix.append([0] * (n + 1))
+        end = n
+    ends = [end if end is not None else start] * num_days
+
+    manager = pywrapcp.RoutingIndexManager(len(matrix), num_days, [start] * num_days, ends)
+    routing = pywrapcp.RoutingModel(manager)
+
+    # Matrice enregistrée nativement : pas de rappel Python à chaque évaluation d'arc
+    transit_index = routing.RegisterTransitMatrix(matrix)
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_index)
+
+    if num_days > 1 or max_day_cost is not None:
+        routing.AddDimension(transit_index, 0, int(max_day_cost or MAX_DAY_COST), True, 'Distance')
+        if num_days > 1:
+            routing.GetDimensionOrDie('Distance').SetGlobalSpanCostCoefficient(DAY_SPAN_COST_COEFFICIENT)
+
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (
+        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+    if time_limit:
+        search_parameters.local_search_metaheuristic = (
+            routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
+        search_parameters.time_limit.FromMilliseconds(int(time_limit * 1000))
+
+    solution = None
+    if initial_routes is not None:
+        routing.CloseModelWithParameters(search_parameters)
+        initial_routes = list(initial_routes) + [[]] * (num_days - len(initial_routes))
+        initial_assignment = routing.ReadAssignmentFromRoutes(initial_routes, True)
+        if initial_assignment is not None:
+            solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+    if solution is None:
+        solution = routing.SolveWithParameters(search_parameters)
+    if not solution:
+        return None
+
+    routes = []
+    for day in range(num_days):
+        index = routing.Start(day)
+        route = []
+        while not routing.IsEnd(index):
+            route.append(manager.IndexToNode(index))
+            index = solution.Value(routing.NextVar(index))
+        if not open_end:
+            route.append(manager.IndexToNode(index))
+        routes.append(route)
+    return routes
+
+
+# Coût total d'un ensemble de routes sur la matrice
+def routes_cost(routes, distance_matrix):
+    return sum(distance_matrix[a][b] for route in routes for a, b in zip(route, route[1:]))
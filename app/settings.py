@@ -0,0 +1,32 @@
+import os
+
+# Paramètres de connexion lus dans l'environnement (voir docker-compose.yml) ; une variable
+# vide compte comme absente. En local, un fichier .env est chargé s'il existe et que
+# python-dotenv est installé
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    pass
+else:
+    load_dotenv()
+
+
+# Paramètres de connexion à la base de données PostgreSQL
+POSTGRES_CONFIG = {
+    'host': os.getenv('POSTGRES_HOST') or 'localhost',
+    'port': int(os.getenv('POSTGRES_PORT') or 5432),
+    'database': os.getenv('POSTGRES_DB') or 'postgres',
+    'user': os.getenv('POSTGRES_USER') or 'postgres',
+    'password': os.getenv('POSTGRES_PASSWORD') or ''
+}
+
+# Pool de connexions PostgreSQL du moteur de clustering, partagé par toutes les sessions
+# Streamlit et tous les workers : au-delà de POSTGRES_POOL_MAX requêtes simultanées, une
+# requête attend qu'une connexion se libère, au plus POSTGRES_POOL_TIMEOUT secondes
+POSTGRES_POOL_MIN = int(os.getenv('POSTGRES_POOL_MIN') or 1)
+POSTGRES_POOL_MAX = int(os.getenv('POSTGRES_POOL_MAX') or 10)
+POSTGRES_POOL_TIMEOUT = float(os.getenv('POSTGRES_POOL_TIMEOUT') or 30)
+
+# Paramètres de connexion à la base de données Neo4j
+NEO4J_URI = os.getenv('NEO4J_URI') or 'bolt://localhost:7687'
+NEO4J_AUTH = (os.getenv('NEO4J_USER') or 'neo4j', os.getenv('NEO4J_PASSWORD') or '')
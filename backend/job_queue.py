@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from instrumentation import METRICS, StageRecorder, record_cache_metrics, record_stage_metrics
+from result_cache import make_key
+
+# CPU-bound fits run in this many worker processes; everything else waits in the queue
+JOB_WORKERS = int(os.getenv("CLUSTERING_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# jobs accepted (queued or running) before new submissions are refused
+MAX_PENDING_JOBS = int(os.getenv("CLUSTERING_MAX_PENDING_JOBS", 32))
+# finished jobs stay readable for this many seconds
+JOB_RETENTION_SECONDS = 3600
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+TERMINAL_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+# --- worker processes ------------------------------------------------------------------
+
+# one engine (PostgreSQL pool, Neo4j driver, result cache) per worker process, opened on first job
+_engine = None
+
+
+def get_worker_engine():
+    global _engine
+    if _engine is None:
+        from clustering import ClusteringEngine
+        from poi_index import PoiIndex
+        from result_cache import ResultCache
+        poi_index = PoiIndex(os.getenv("POI_INDEX_DIR")) if os.getenv("POI_INDEX_DIR") else None
+        # cache counters are sent to the API process with each job (see run_job), not kept in the worker
+        cache = ResultCache(disk_dir=os.getenv("CLUSTERS_CACHE_DIR"), registry=None)
+        _engine = ClusteringEngine(cache=cache, poi_index=poi_index)
+    return _engine
+
+
+# opens the worker's connections and loads scikit-learn; returns the engine health status
+def warm_up_worker():
+    return get_worker_engine().warm_up()
+
+
+def run_job(job_id, params, events, cancelled):
+    # stage progress goes back to the API process through the shared events queue;
+    # a cancellation request stops the run at the start of the next stage
+    def listener(event, record):
+        if event == "start" and cancelled.get(job_id):
+            raise JobCancelled(job_id)
+        events.put((job_id, f"stage_{event}", dict(record)))
+
+    if cancelled.get(job_id):
+        raise JobCancelled(job_id)
+    events.put((job_id, RUNNING, None))
+    recorder = StageRecorder(run_id=params.get("run_id"), registry=None, listener=listener)
+    engine = get_worker_engine()
+    cache_counts = dict(engine.cache.metrics)
+    try:
+        result = engine.run(recorder=recorder, **params)
+    finally:
+        # the worker's result cache counters reach the API's /metrics as per-job deltas
+        events.put((job_id, "cache_metrics", {
+            name: count - cache_counts.get(name, 0) for name, count in engine.cache.metrics.items()
+        }))
+    # the structured array is rebuilt by clients with clusters_result.clusters_to_result
+    return {key: value for key, value in result.items() if key != "points"}
+
+
+# --- API process -----------------------------------------------------------------------
+
+class Job:
+    def __init__(self, job_id, key, params):
+        self.id = job_id
+        self.key = key
+        self.params = params
+        self.status = QUEUED
+        self.stage = None
+        self.stages = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        # callers sharing this job (identical submissions); it is cancelled when the last one cancels
+        self.subscribers = 1
+        # progress events, replayed to every event stream subscriber
+        self.events = []
+        self.changed = asyncio.Event()
+
+    def publish(self, event_type, **data):
+        self.events.append(dict(data, type=event_type, job_id=self.id, status=self.status))
+        # wake current subscribers; later ones wait on a fresh event
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def to_dict(self, include_result=False):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": self.stages,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "subscribers": self.subscribers,
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+# Clustering jobs run on a bounded process pool; identical in-flight requests share one job.
+# The run_id is part of the identity: a job writes its graph under a single run.
+class JobManager:
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS, retention=JOB_RETENTION_SECONDS):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.jobs = {}
+        self.in_flight = {}
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.manager = multiprocessing.Manager()
+        self.events = self.manager.Queue()
+        self.cancelled = self.manager.dict()
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self.reader = threading.Thread(target=self._read_events, daemon=True)
+        self.reader.start()
+
+    # best effort: the pool starts workers on demand, so a fast warm-up may reach fewer processes
+    def warm_up(self):
+        for _ in range(self.max_workers):
+            future = self.executor.submit(warm_up_worker)
+            future.add_done_callback(
+                lambda future: logger.info("clustering worker warm-up: %s", future.exception() or future.result())
+            )
+
+    async def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.events.put(None)
+        self.manager.shutdown()
+
+    # worker messages are forwarded to the event loop in the order they were sent
+    def _read_events(self):
+        while True:
+            message = self.events.get()
+            if message is None:
+                return
+            self.loop.call_soon_threadsafe(self._on_event, *message)
+
+    def _on_event(self, job_id, event_type, record):
+        if event_type == "cache_metrics":
+            record_cache_metrics(METRICS, record)
+            return
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        if event_type == RUNNING:
+            job.status = RUNNING
+            job.publish(RUNNING)
+        elif event_type == "stage_start":
+            job.stage = record["stage"]
+            job.publish(event_type, **record)
+        elif event_type == "stage_end":
+            job.stages.append(record)
+            record_stage_metrics(METRICS, record)
+            job.publish(event_type, **record)
+        elif event_type == "finished":
+            self._finish(job)
+
+    def _finish(self, job):
+        future = job.future
+        if future.cancelled():
+            job.status = CANCELLED
+        elif isinstance(future.exception(), JobCancelled):
+            job.status = CANCELLED
+        elif future.exception() is not None:
+            job.status = FAILED
+            job.error = str(future.exception())
+        else:
+            job.status = DONE
+            job.result = future.result()
+        job.stage = None
+        job.finished_at = time.time()
+        self._release(job)
+        self.cancelled.pop(job.id, None)
+        METRICS.inc("clustering_jobs_total", status=job.status)
+        job.publish(job.status, error=job.error)
+
+    # a job leaving the in-flight table no longer takes new subscribers
+    def _release(self, job):
+        if self.in_flight.get(job.key) is job:
+            del self.in_flight[job.key]
+
+    def _purge(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.retention]:
+            del self.jobs[job_id]
+
+    # returns (job, deduplicated); raises QueueFull when max_pending jobs are already waiting
+    def submit(self, params):
+        self._purge()
+        key = make_key(params["latitude"], params["longitude"], params["poi_types"], params["radius"],
+                       **{name: value for name, value in params.items()
+                          if name not in ("latitude", "longitude", "poi_types", "radius")})
+        job = self.in_flight.get(key)
+        if job is not None:
+            job.subscribers += 1
+            METRICS.inc("clustering_jobs_total", status="deduplicated")
+            return job, True
+        if len(self.in_flight) >= self.max_pending:
+            raise QueueFull(f"{len(self.in_flight)} clustering jobs already pending")
+
+        job = Job(uuid.uuid4().hex, key, params)
+        self.jobs[job.id] = job
+        self.in_flight[key] = job
+        job.future = self.executor.submit(run_job, job.id, params, self.events, self.cancelled)
+        # sent through the events queue so it arrives after the job's last progress message
+        job.future.add_done_callback(lambda future, job_id=job.id: self.events.put((job_id, "finished", None)))
+        job.publish(QUEUED)
+        return job, False
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    # one subscriber leaves the job; when it was the last one, a queued job is dropped and a
+    # running job stops at the start of its next stage. Returns True when the job is cancelled.
+    def cancel(self, job):
+        if job.status in TERMINAL_STATUSES or job.subscribers == 0:
+            return False
+        job.subscribers -= 1
+        if job.subscribers > 0:
+            return False
+        self._release(job)
+        if not job.future.cancel():
+            self.cancelled[job.id] = True
+        return True
+
+    # server-sent events: past events first, then new ones until the job finishes
+    async def stream(self, job):
+        index = 0
+        while True:
+            changed = job.changed
+            while index < len(job.events):
+                event = job.events[index]
+                index += 1
+                yield event
+                if event["type"] in TERMINAL_STATUSES:
+                    return
+            await changed.wait()
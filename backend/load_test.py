@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+
+# Concurrent load test of a backend endpoint: prints throughput and latency percentiles
+async def worker(client, url, n_requests, latencies, errors):
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            errors.append(1)
+
+
+async def run_load_test(url, concurrency, requests_per_worker):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            worker(client, url, requests_per_worker, latencies, errors) for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+
+    print(f"{url}")
+    print(f"concurrency={concurrency} requests={len(latencies) + len(errors)} errors={len(errors)} "
+          f"elapsed={elapsed:.2f}s throughput={len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        latencies.sort()
+        print(f"latency p50={statistics.median(latencies) * 1000:.1f}ms "
+              f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms "
+              f"max={latencies[-1] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the backend endpoints")
+    parser.add_argument("--base_url", default="http://localhost:8080")
+    parser.add_argument("--path", default="/neo4j/cluster_poi/6/10/10")
+    parser.add_argument("--run_id", required=True, help="run_id read by /neo4j/cluster_poi")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=20, help="requests per concurrent client")
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        asyncio.run(run_load_test(f"{args.base_url}{args.path}?run_id={args.run_id}", concurrency, args.requests))
@@ -1,14 +1,31 @@
+import os
+import sys
+import time
 import uvicorn
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.responses import JSONResponse, PlainTextResponse
+from neo4j import AsyncGraphDatabase, GraphDatabase
+
+# pipeline modules live in app/ in the repository and at the image root in Docker
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(BASE_DIR, "app"), BASE_DIR]
+
+from instrumentation import METRICS
+from settings import NEO4J_AUTH, NEO4J_URI
+from job_queue import JobManager
+from postgres import PostgresUnavailable, close_pg_pool, get_pg_pool
 from routers.datatourisme import routerDataTourisme as dataTourisme_router
 from routers.neo4j import routerDataNeo4j as dataNeo4j_router
+from routers.jobs import routerJobs as jobs_router
 
 # define origins
 origins = ["*"]
 
+# connection endpoints and credentials come from the environment (see app/settings.py)
+NEO4J_MAX_CONNECTION_POOL_SIZE = 50
+
 logger = logging.getLogger('uvicorn.error')
 logger.setLevel(logging.DEBUG)
 
@@ -24,16 +41,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # labelled by route template (not raw path) to keep the number of series bounded
+    route = request.scope.get("route")
+    METRICS.observe(
+        "http_request_duration_seconds", time.perf_counter() - start,
+        method=request.method, route=getattr(route, "path", "unmatched"), status=response.status_code
+    )
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+# readiness probe: both databases answer through the pools the routes use
+@app.get("/health", include_in_schema=False)
+async def health():
+    status = {}
+    try:
+        pool = await get_pg_pool(app)
+        async with pool.acquire() as connection:
+            await connection.fetchval("SELECT 1")
+        status["postgres"] = "ok"
+    except PostgresUnavailable as e:
+        # no pool yet: the next request tries to connect again
+        status["postgres"] = f"unavailable: {e}"
+    except Exception as e:
+        status["postgres"] = f"error: {e}"
+    try:
+        await app.state.neo4j_driver.verify_connectivity()
+        status["neo4j"] = "ok"
+    except Exception as e:
+        status["neo4j"] = f"error: {e}"
+    healthy = all(value == "ok" for value in status.values())
+    return JSONResponse(status, status_code=200 if healthy else 503)
+
+
 @app.on_event("startup")
 async def startup_event():
     logger.debug('This is a debug message from startup_event')
+    start = time.perf_counter()
+    # one pooled async driver shared by every request
+    app.state.neo4j_driver = AsyncGraphDatabase.driver(
+        NEO4J_URI, auth=NEO4J_AUTH, max_connection_pool_size=NEO4J_MAX_CONNECTION_POOL_SIZE
+    )
+    # blocking driver for the graph writes shared with app/clustering.py (run in worker threads)
+    app.state.neo4j_sync_driver = GraphDatabase.driver(NEO4J_URI, auth=NEO4J_AUTH)
+    # the PostgreSQL pool is opened now if possible, otherwise on the next request (see postgres.py)
+    app.state.pg_pool = None
+    try:
+        await get_pg_pool(app)
+    except PostgresUnavailable:
+        logger.warning("starting without PostgreSQL, the pool will be created on the next request")
+    # clustering runs on a bounded process pool (see job_queue.py)
+    app.state.jobs = JobManager()
+    await app.state.jobs.start()
+    # worker processes open their engine in the background, before the first job
+    app.state.jobs.warm_up()
+    logger.info("startup completed in %.2f s", time.perf_counter() - start)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.debug('This is a debug message from shutdown_event')
+    await app.state.neo4j_driver.close()
+    app.state.neo4j_sync_driver.close()
+    await close_pg_pool(app)
+    await app.state.jobs.shutdown()
 
 app.include_router(dataTourisme_router, prefix="/data", tags=["DataTourisme"])
 app.include_router(dataNeo4j_router, prefix="/neo4j", tags=["Neo4j"])
+app.include_router(jobs_router, prefix="/jobs", tags=["Jobs"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+
+import asyncpg
+
+from settings import POSTGRES_CONFIG
+
+POSTGRES_MIN_POOL_SIZE = 2
+POSTGRES_MAX_POOL_SIZE = 20
+
+logger = logging.getLogger('uvicorn.error')
+
+_pool_lock = asyncio.Lock()
+
+
+class PostgresUnavailable(Exception):
+    pass
+
+
+# asyncpg pool of app.state, created on first use: the API starts (and serves Neo4j
+# and the jobs) while PostgreSQL is down, and the next request retries the connection
+async def get_pg_pool(app):
+    pool = getattr(app.state, "pg_pool", None)
+    if pool is not None:
+        return pool
+    async with _pool_lock:
+        if getattr(app.state, "pg_pool", None) is None:
+            try:
+                app.state.pg_pool = await asyncpg.create_pool(
+                    min_size=POSTGRES_MIN_POOL_SIZE, max_size=POSTGRES_MAX_POOL_SIZE, **POSTGRES_CONFIG
+                )
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+                logger.warning("PostgreSQL unavailable: %s", e)
+                raise PostgresUnavailable(str(e)) from e
+    return app.state.pg_pool
+
+
+async def close_pg_pool(app):
+    pool = getattr(app.state, "pg_pool", None)
+    if pool is not None:
+        app.state.pg_pool = None
+        await pool.close()
@@ -4,6 +4,10 @@ import asyncio
 import requests
 import logging
 import json
+import numpy as np
+from clustering import HAVERSINE_TOLERANCE, bounding_box, within_radius
+from instrumentation import StageRecorder
+from postgres import PostgresUnavailable, get_pg_pool
 # from geopy.distance import geodesic
 
 # logger = logging.getLogger('uvicorn.error')
@@ -24,10 +28,103 @@ async def hello():
     return {"data": "Hello Data Tourisme"}
 
 
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# POIs of the requested types near a point, one row per POI with its types aggregated; the
+# bounding box predicates use idx_datatourisme_lat_lon. The haversine cutoff ($4) includes the
+# sphere/ellipsoid tolerance band: each page is then settled with clustering.within_radius,
+# so the search returns exactly the POIs a clustering run uses.
+POI_SEARCH_QUERY = """
+SELECT dt.id, dt.label_fr,
+       dt.latitude::double precision AS latitude,
+       dt.longitude::double precision AS longitude,
+       array_agg(DISTINCT tp.type) AS types
+FROM datatourisme dt
+JOIN liaison_datatourisme_types_de_poi ldtp ON dt.id = ldtp.id_datatourisme
+JOIN types_de_poi tp ON ldtp.id_type_de_poi = tp.id
+WHERE tp.type = ANY($1::text[])
+  AND dt.latitude::double precision BETWEEN $5 AND $6
+  AND dt.longitude::double precision BETWEEN $7 AND $8
+  AND 2 * {earth_radius} * asin(sqrt(
+        power(sin(radians(dt.latitude::double precision - $2) / 2), 2)
+        + cos(radians($2)) * cos(radians(dt.latitude::double precision))
+        * power(sin(radians(dt.longitude::double precision - $3) / 2), 2)
+      )) <= $4
+  {keyset}
+GROUP BY dt.id, dt.label_fr, dt.latitude, dt.longitude
+ORDER BY dt.id
+LIMIT $9
+"""
+
+FIRST_PAGE_QUERY = POI_SEARCH_QUERY.format(earth_radius=EARTH_RADIUS_KM, keyset="")
+NEXT_PAGE_QUERY = POI_SEARCH_QUERY.format(earth_radius=EARTH_RADIUS_KM, keyset="AND dt.id > $10")
+
+
+# (min_lat, max_lat, min_lon, max_lon) of the pipeline's bounding box (clustering.bounding_box,
+# which keeps the ellipsoid margin), as SQL bounds
+def sql_bounding_box(latitude, longitude, radius_km):
+    min_lat, max_lat, delta_lon = bounding_box((latitude, longitude), radius_km)
+    if delta_lon is None:
+        return min_lat, max_lat, -180.0, 180.0
+    min_lon, max_lon = longitude - delta_lon, longitude + delta_lon
+    # a box crossing the antimeridian is only filtered on latitude (haversine does the rest)
+    if min_lon < -180.0 or max_lon > 180.0:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, min_lon, max_lon
+
+
 @routerDataTourisme.post("/poi", response_description="Data Tourisme")
-async def create_poi(data: dict = Body(...)):
-    # await asyncio.sleep(5)
-    # received_data = {"result": data}
-    logger.debug("create_poi %s", json.dumps(data, indent=4))
+async def search_poi(request: Request, data: dict = Body(...)):
+    # expected body: {"latitude": float, "longitude": float, "radius": km, "poi_types": [str],
+    #                 "limit": int, "after": <id of the last POI of the previous page>}
+    logger.debug("search_poi %s", json.dumps(data))
+
+    try:
+        latitude = float(data["latitude"])
+        longitude = float(data["longitude"])
+        radius = float(data["radius"])
+        poi_types = [str(poi_type) for poi_type in data["poi_types"]]
+        limit = int(data.get("limit", DEFAULT_LIMIT))
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="latitude, longitude, radius and poi_types are required"
+        )
+    if not 1 <= limit <= MAX_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"limit must be between 1 and {MAX_LIMIT}"
+        )
+    after = data.get("after")
+
+    try:
+        pool = await get_pg_pool(request.app)
+    except PostgresUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"PostgreSQL unavailable: {e}")
+
+    params = [poi_types, latitude, longitude, radius * (1 + HAVERSINE_TOLERANCE),
+              *sql_bounding_box(latitude, longitude, radius), limit]
+    with StageRecorder().stage("sql_fetch") as stage:
+        async with pool.acquire() as connection:
+            # prepared once per pooled connection thanks to asyncpg's statement cache
+            if after is None:
+                statement = await connection.prepare(FIRST_PAGE_QUERY)
+                rows = await statement.fetch(*params)
+            else:
+                statement = await connection.prepare(NEXT_PAGE_QUERY)
+                rows = await statement.fetch(*params, after)
+        stage["rows"] = len(rows)
 
-    return {"status": "OK", "data": data}
+    # keyset cursor on the fetched rows: pass it back as "after" to get the next page, which
+    # may hold fewer than limit POIs once the tolerance band is settled
+    next_after = rows[-1]["id"] if len(rows) == limit else None
+    inside = within_radius(
+        (latitude, longitude),
+        np.array([row["latitude"] for row in rows], dtype=np.float64),
+        np.array([row["longitude"] for row in rows], dtype=np.float64),
+        radius
+    )
+    pois = [dict(rows[i]) for i in inside.tolist()] if len(rows) else []
+    return {"status": "OK", "data": pois, "next": next_after}
@@ -0,0 +1,91 @@
+from fastapi import APIRouter, Request, Body, status, HTTPException
+from fastapi.responses import StreamingResponse
+import logging
+import json
+from job_queue import QueueFull
+
+routerJobs = APIRouter()
+
+# Configurer le format de journalisation
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# Créer un logger
+logger = logging.getLogger(__name__)
+
+CLUSTERING_ALGORITHMS = ("auto", "kmeans", "minibatch")
+QUERY_MODES = ("sql", "python", "index")
+
+
+def parse_job_params(data):
+    try:
+        params = {
+            "latitude": float(data["latitude"]),
+            "longitude": float(data["longitude"]),
+            "poi_types": [str(poi_type) for poi_type in data["poi_types"]],
+            "radius": float(data["radius"]),
+            "n_clusters": data.get("n_clusters", 10),
+            "clustering": data.get("clustering", "auto"),
+            "query_mode": data.get("query_mode", "sql"),
+            "min_poi_count": int(data.get("min_poi_count", 6)),
+            "max_clusters": int(data.get("max_clusters", 10)),
+            "max_pois_per_cluster": int(data.get("max_pois_per_cluster", 10)),
+            "with_types": bool(data.get("with_types", False)),
+            "run_id": data.get("run_id"),
+        }
+        if params["n_clusters"] != "auto":
+            params["n_clusters"] = int(params["n_clusters"])
+    except (KeyError, TypeError, ValueError):
+        params = None
+    if params is None or params["clustering"] not in CLUSTERING_ALGORITHMS or params["query_mode"] not in QUERY_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="latitude, longitude, radius and poi_types are required"
+        )
+    return params
+
+
+def get_job_or_404(request, job_id):
+    job = request.app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="unknown job")
+    return job
+
+
+@routerJobs.post("/", status_code=status.HTTP_202_ACCEPTED, response_description="Clustering job")
+async def submit_job(request: Request, data: dict = Body(...)):
+    # expected body: {"latitude", "longitude", "radius", "poi_types", optional "n_clusters",
+    #                 "clustering", "query_mode", "min_poi_count", "max_clusters", "max_pois_per_cluster",
+    #                 "with_types", "run_id"}
+    params = parse_job_params(data)
+    try:
+        job, deduplicated = request.app.state.jobs.submit(params)
+    except QueueFull as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    logger.debug("submit_job %s (deduplicated: %s)", job.id, deduplicated)
+    return {"status": "OK", "data": job.to_dict(), "deduplicated": deduplicated}
+
+
+@routerJobs.get("/{job_id}", response_description="Clustering job")
+async def get_job(request: Request, job_id: str):
+    return {"status": "OK", "data": get_job_or_404(request, job_id).to_dict(include_result=True)}
+
+
+@routerJobs.get("/{job_id}/events", response_description="Clustering job progress (server-sent events)")
+async def stream_job_events(request: Request, job_id: str):
+    job = get_job_or_404(request, job_id)
+
+    async def events():
+        async for event in request.app.state.jobs.stream(job):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@routerJobs.delete("/{job_id}", response_description="Clustering job")
+async def cancel_job(request: Request, job_id: str):
+    # a job shared by identical submissions keeps running until its last subscriber cancels;
+    # the final status arrives asynchronously: poll the job or follow its events
+    job = get_job_or_404(request, job_id)
+    cancel_requested = request.app.state.jobs.cancel(job)
+    return {"status": "OK", "data": job.to_dict(), "cancel_requested": cancel_requested}
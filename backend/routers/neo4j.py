@@ -1,9 +1,14 @@
 import os
 from fastapi import APIRouter, Request, Body, status, HTTPException
+from fastapi.responses import StreamingResponse
 import asyncio
 import requests
 import logging
 import json
+from instrumentation import StageRecorder
+# the read query is app/clustering.py's own, run here through the async driver
+from clustering import (CLUSTERS_POI_QUERY, DEFAULT_BATCH_SIZE, DEFAULT_RUN_TTL, create_graph_batched,
+                        create_graph_indexes, delete_expired_runs)
 # from geopy.distance import geodesic
 
 # logger = logging.getLogger('uvicorn.error')
@@ -24,22 +29,93 @@ async def hello():
     return {"data": "Hello Data Neo4j"}
 
 
+async def stream_clusters_poi_data(driver, run_id, min_poi_count, max_clusters, max_pois_per_cluster):
+    # one JSON fragment per cluster so large results are never serialized at once
+    yield '{"status": "OK", "run_id": ' + json.dumps(run_id) + ', "data": {'
+    # timed until the last cluster is sent, client-side consumption included
+    with StageRecorder(run_id=run_id).stage("neo4j_read") as stage:
+        stage["rows"] = 0
+        async with driver.session() as session:
+            result = await session.run(
+                CLUSTERS_POI_QUERY,
+                run_id=run_id,
+                min_poi_count=min_poi_count,
+                max_clusters=max_clusters,
+                max_pois_per_cluster=max_pois_per_cluster
+            )
+            separator = ""
+            async for record in result:
+                stage["rows"] += len(record["poi_data"])
+                yield separator + json.dumps(record["cluster_name"]) + ": " + json.dumps(record["poi_data"])
+                separator = ", "
+    yield "}}"
+
+
 @routerDataNeo4j.get("/cluster_poi/{min_poi_count}/{max_clusters}/{max_pois_per_cluster}", response_description="Data Neo4j")
 async def get_clusters_poi_data(
+        request: Request,
+        run_id: str,
         min_poi_count: int = 6,
         max_clusters: int = 10,
         max_pois_per_cluster: int = 10,
         ):
-    # await asyncio.sleep(5)
-    # received_data = {"result": data}
-    logger.debug("create_graph %s", min_poi_count)
+    logger.debug("get_clusters_poi_data %s %s", run_id, min_poi_count)
+
+    return StreamingResponse(
+        stream_clusters_poi_data(
+            request.app.state.neo4j_driver, run_id, min_poi_count, max_clusters, max_pois_per_cluster
+        ),
+        media_type="application/json"
+    )
+
+
+# Same write path as ClusteringEngine.write_graph: indexes and constraints (once per process),
+# purge of expired runs, then the run replaced by batched UNWIND writes (create_graph_batched
+# deletes any previous run with the same id first). These helpers use the blocking driver,
+# so they run in a worker thread.
+_graph_indexes_created = False
+
+
+def write_run(driver, run_id, clusters, pois, batch_size, with_types):
+    global _graph_indexes_created
+    with driver.session() as session:
+        if not _graph_indexes_created:
+            create_graph_indexes(session)
+            _graph_indexes_created = True
+        delete_expired_runs(session, ttl_seconds=DEFAULT_RUN_TTL, batch_size=batch_size)
+        create_graph_batched(session, run_id, clusters, pois, batch_size=batch_size, with_types=with_types)
 
-    return {"status": "OK", "data": "data"}
 
 @routerDataNeo4j.post("/graph", response_description="Data Neo4j")
-async def create_graph_neo4j(data: dict = Body(...)):
-    # await asyncio.sleep(5)
-    # received_data = {"result": data}
-    logger.debug("create_graph %s", json.dumps(data, indent=4))
+async def create_graph_neo4j(request: Request, data: dict = Body(...)):
+    # expected body: {"run_id": str, "pois": [[label_fr, latitude, longitude, [type, ...], id], ...],
+    #                 "clusters": [int, ...], optional "batch_size" and "with_types"}
+    logger.debug("create_graph %s", data.get("run_id"))
+
+    run_id = data.get("run_id")
+    pois = data.get("pois", [])
+    clusters = data.get("clusters", [])
+    if not run_id or not pois or len(pois) != len(clusters):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="run_id, pois and clusters (same length) are required"
+        )
+    if not all(type(cluster) is int and cluster >= 0 for cluster in clusters):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="clusters must be non-negative integers"
+        )
+    if not all(isinstance(poi, list) and len(poi) == 5 and isinstance(poi[3], list) for poi in pois):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="each poi must be [label_fr, latitude, longitude, [type, ...], id]"
+        )
+    batch_size = int(data.get("batch_size", DEFAULT_BATCH_SIZE))
+    with_types = bool(data.get("with_types"))
+
+    with StageRecorder(run_id=run_id).stage("neo4j_write", rows=len(pois)):
+        await asyncio.to_thread(
+            write_run, request.app.state.neo4j_sync_driver, run_id, clusters, pois, batch_size, with_types
+        )
 
-    return {"status": "OK", "data": data}
+    return {"status": "OK", "data": {"run_id": run_id, "clusters": max(clusters) + 1, "pois": len(pois)}}
@@ -0,0 +1,43 @@
+-- Extract of the DataTourisme tables around Paris, with the column types of the production
+-- database (coordinates stored as text). Loaded by tests/test_datatourisme.py.
+CREATE TABLE datatourisme (id text PRIMARY KEY, label_fr text, latitude text, longitude text);
+CREATE TABLE types_de_poi (id integer PRIMARY KEY, type text);
+CREATE TABLE liaison_datatourisme_types_de_poi (id_datatourisme text, id_type_de_poi integer);
+
+INSERT INTO types_de_poi (id, type) VALUES
+    (1, 'Culture'),
+    (2, 'Restauration'),
+    (3, 'Hebergement'),
+    (4, 'Monument');
+
+-- distances to (48.8566, 2.3522) in comments
+INSERT INTO datatourisme (id, label_fr, latitude, longitude) VALUES
+    ('https://data.datatourisme.fr/13/poi-01', 'Musée du Louvre', '48.8606', '2.3376'),          -- 1.16 km
+    ('https://data.datatourisme.fr/13/poi-02', 'Musée d''Orsay', '48.8600', '2.3266'),           -- 1.91 km
+    ('https://data.datatourisme.fr/13/poi-03', 'Le Procope', '48.8530', '2.3389'),               -- 1.05 km
+    ('https://data.datatourisme.fr/13/poi-04', 'Café de Flore', '48.8541', '2.3326'),            -- 1.46 km
+    ('https://data.datatourisme.fr/13/poi-05', 'Centre Pompidou', '48.8607', '2.3522'),          -- 0.46 km
+    ('https://data.datatourisme.fr/13/poi-06', 'Cathédrale Notre-Dame', '48.8530', '2.3499'),    -- 0.43 km
+    ('https://data.datatourisme.fr/13/poi-07', 'Hôtel Lutetia', '48.8510', '2.3270'),            -- 1.95 km
+    ('https://data.datatourisme.fr/13/poi-08', 'Château de Vincennes', '48.8427', '2.4359'),     -- 6.32 km
+    ('https://data.datatourisme.fr/13/poi-09', 'Château de Versailles', '48.8049', '2.1204'),    -- 17.91 km
+    -- homonym of poi-01 with invalid coordinates, as found in the export
+    ('https://data.datatourisme.fr/13/poi-10', 'Musée du Louvre', '148.8606', '2.3376');
+
+INSERT INTO liaison_datatourisme_types_de_poi (id_datatourisme, id_type_de_poi) VALUES
+    ('https://data.datatourisme.fr/13/poi-01', 1),
+    ('https://data.datatourisme.fr/13/poi-01', 4),
+    ('https://data.datatourisme.fr/13/poi-02', 1),
+    ('https://data.datatourisme.fr/13/poi-03', 2),
+    ('https://data.datatourisme.fr/13/poi-04', 2),
+    ('https://data.datatourisme.fr/13/poi-04', 1),
+    ('https://data.datatourisme.fr/13/poi-05', 1),
+    ('https://data.datatourisme.fr/13/poi-06', 4),
+    ('https://data.datatourisme.fr/13/poi-07', 3),
+    ('https://data.datatourisme.fr/13/poi-08', 4),
+    ('https://data.datatourisme.fr/13/poi-08', 1),
+    ('https://data.datatourisme.fr/13/poi-09', 1),
+    ('https://data.datatourisme.fr/13/poi-10', 1);
+
+CREATE INDEX idx_datatourisme_lat_lon
+    ON datatourisme (((latitude)::double precision), ((longitude)::double precision));
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(os.path.dirname(BACKEND_DIR), "app"), BACKEND_DIR]
+
+import job_queue
+from job_queue import JobManager
+
+PARAMS = {"latitude": 48.8566, "longitude": 2.3522, "poi_types": ["Culture"], "radius": 2.0}
+
+
+# jobs block until released, in threads instead of worker processes: no database needed
+@pytest.fixture
+def manager(monkeypatch):
+    release = threading.Event()
+
+    def run_job(job_id, params, events, cancelled):
+        release.wait(5)
+        if cancelled.get(job_id):
+            raise job_queue.JobCancelled(job_id)
+        return {"run_id": params["run_id"]}
+
+    monkeypatch.setattr(job_queue, "run_job", run_job)
+    manager = JobManager(max_workers=1)
+    manager.executor = ThreadPoolExecutor(max_workers=1)
+    manager.events = queue.Queue()
+    manager.cancelled = {}
+    yield manager
+    release.set()
+    manager.executor.shutdown(wait=True)
+
+
+def test_submissions_with_different_run_ids_are_separate_jobs(manager):
+    async def scenario():
+        first, first_deduplicated = manager.submit(dict(PARAMS, run_id="a"))
+        second, second_deduplicated = manager.submit(dict(PARAMS, run_id="b"))
+        same, same_deduplicated = manager.submit(dict(PARAMS, run_id="a"))
+        assert not first_deduplicated and not second_deduplicated
+        assert first.id != second.id
+        assert same_deduplicated and same is first and first.subscribers == 2
+
+    asyncio.run(scenario())
+
+
+def test_shared_job_is_cancelled_by_its_last_subscriber(manager):
+    async def scenario():
+        job, _ = manager.submit(dict(PARAMS, run_id=None))
+        manager.submit(dict(PARAMS, run_id=None))
+        assert not manager.cancel(job)
+        assert job.subscribers == 1 and not manager.cancelled.get(job.id)
+        # once the last subscriber leaves, an identical submission starts a new job
+        assert manager.cancel(job)
+        assert job.future.cancelled() or manager.cancelled.get(job.id)
+        other, deduplicated = manager.submit(dict(PARAMS, run_id=None))
+        assert not deduplicated and other is not job
+        assert not manager.cancel(job)
+
+    asyncio.run(scenario())
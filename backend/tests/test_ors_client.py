@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(os.path.dirname(BACKEND_DIR), "app"), BACKEND_DIR]
+
+from ors_client import ORSClient, ORSError
+
+ROUTE = [[2.3522, 48.8566], [2.3376, 48.8606], [2.3266, 48.8600], [2.3389, 48.8530], [2.3326, 48.8541]]
+
+
+# Mock OpenRouteService: a straight-line route through the waypoints, a matrix of index
+# differences, and queued status overrides (e.g. 429 with a Retry-After header)
+class MockORS(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, body))
+        if self.server.responses:
+            status, headers = self.server.responses.pop(0)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        if self.path.startswith("/v2/directions/"):
+            data = {"type": "FeatureCollection", "features": [{
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": body["coordinates"]},
+                "properties": {"summary": {"distance": 100.0 * (len(body["coordinates"]) - 1), "duration": 10.0}},
+            }]}
+        elif self.path.startswith("/v2/matrix/"):
+            nodes = [ROUTE.index(location) for location in body["locations"]]
+            data = {f"{body['metrics'][0]}s": [[float(abs(nodes[i] - nodes[j])) for j in body["destinations"]]
+                                               for i in body["sources"]]}
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockORS)
+    server.requests, server.responses = [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, **options):
+    return ORSClient(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}",
+                     requests_per_minute=6000, **options)
+
+
+def test_long_route_is_split_and_stitched(server):
+    client = make_client(server, max_waypoints=3)
+    route = client.directions(ROUTE)
+    assert len(server.requests) == 2
+    feature = route["features"][0]
+    assert feature["geometry"]["coordinates"] == ROUTE
+    assert feature["properties"]["summary"]["distance"] == 400.0
+    # second call is served from the cache
+    client.directions(ROUTE)
+    assert len(server.requests) == 2
+
+
+def test_matrix_is_assembled_from_blocks(server):
+    client = make_client(server, max_matrix_elements=4)
+    values = client.matrix(ROUTE)
+    assert values == [[float(abs(i - j)) for j in range(len(ROUTE))] for i in range(len(ROUTE))]
+    assert len(server.requests) == 9
+
+
+@pytest.mark.parametrize("retry_after", ["0", formatdate(time.time() - 60, usegmt=True), "soon"])
+def test_429_is_retried_with_seconds_or_http_date(server, retry_after, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("ors_client.time.sleep", sleeps.append)
+    server.responses.append((429, {"Retry-After": retry_after}))
+    route = make_client(server).directions(ROUTE[:2])
+    assert route["features"][0]["geometry"]["coordinates"] == ROUTE[:2]
+    assert len(server.requests) == 2
+    # an unreadable header falls back to the exponential backoff (1 s on the first retry)
+    assert sleeps == [1] if retry_after == "soon" else sleeps == [0.0]
+
+
+def test_quota_still_exceeded_after_retries(server, monkeypatch):
+    monkeypatch.setattr("ors_client.time.sleep", lambda seconds: None)
+    server.responses.extend([(429, {"Retry-After": "0"})] * 4)
+    with pytest.raises(ORSError):
+        make_client(server).directions(ROUTE[:2])
+    assert len(server.requests) == 4
@@ -0,0 +1,59 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import numpy as np
+from batch_clustering import build_poi_arrays, run_batch, save_batch_result
+
+
+# Lignes synthétiques (label, latitude, longitude, type) réparties sur la France métropolitaine
+def synthetic_rows(n_rows, n_types=20, seed=0):
+    rng = np.random.default_rng(seed)
+    latitudes = rng.uniform(42.5, 51.0, n_rows)
+    longitudes = rng.uniform(-4.5, 8.0, n_rows)
+    types = rng.integers(0, n_types, n_rows)
+    return [(f"POI {i}", latitudes[i], longitudes[i], [f"Type{types[i]}"], i) for i in range(n_rows)]
+
+
+# Requêtes synthétiques : villes tirées au hasard, 3 types et un rayon de 5 à 30 km
+def synthetic_requests(n_requests, n_types=20, seed=1):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'latitude': float(rng.uniform(43.0, 50.5)),
+            'longitude': float(rng.uniform(-4.0, 7.5)),
+            'radius': float(rng.uniform(5, 30)),
+            'poi_types': [f"Type{t}" for t in rng.choice(n_types, 3, replace=False)],
+            'n_clusters': 10,
+            'run_id': f"batch_{i}"
+        }
+        for i in range(n_requests)
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark du clustering en lot (débit selon le nombre de processus)')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    arrays = build_poi_arrays(synthetic_rows(args.rows))
+    requests = synthetic_requests(args.requests)
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        results = run_batch(requests, arrays, workers=workers, clustering='kmeans')
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{workers:>3} processus  {elapsed:7.2f} s  {len(requests) / elapsed:8.1f} requêtes/s  "
+              f"accélération x{baseline / elapsed:.2f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        save_batch_result(os.path.join(directory, 'batch'), requests, results, arrays)
+        print(f"Export columnaire : {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,39 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import numpy as np
+from clustering import fit_clusters, project_coordinates
+
+
+# Nuage synthétique de n_points POIs : quelques foyers gaussiens autour de Paris
+def synthetic_coordinates(n_points, n_centers=25, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.column_stack([rng.uniform(48.5, 49.2, n_centers), rng.uniform(1.8, 2.9, n_centers)])
+    assignment = rng.integers(0, n_centers, n_points)
+    return centers[assignment] + rng.normal(0, 0.03, (n_points, 2))
+
+
+# Inertie (somme des carrés des distances en m²) des points à leur centre
+def inertia(points, labels, centers):
+    return float(np.sum((points - centers[labels]) ** 2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark du clustering des POIs (KMeans / MiniBatchKMeans)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--n_clusters', type=int, default=10)
+    parser.add_argument('--algorithms', nargs='+', default=['kmeans', 'minibatch'])
+    args = parser.parse_args()
+
+    for n_points in args.sizes:
+        points = project_coordinates(synthetic_coordinates(n_points), (48.85, 2.35))
+        for algorithm in args.algorithms:
+            start = time.perf_counter()
+            labels, centers = fit_clusters(points, n_clusters=args.n_clusters, algorithm=algorithm, random_state=0)
+            elapsed = time.perf_counter() - start
+            print(f"{n_points:>9} points  {algorithm:<9}  fit {elapsed:7.2f} s  "
+                  f"inertie {inertia(points, labels, centers):.4e} m²")
@@ -0,0 +1,69 @@
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from neo4j import GraphDatabase
+from clustering import (CLUSTERS_POI_QUERY, NEO4J_AUTH, NEO4J_URI, create_graph_batched, create_graph_indexes,
+                        delete_runs)
+
+
+# Requête de lecture d'origine (compréhension de motif par ligne, troncature côté Python)
+LEGACY_CLUSTERS_POI_QUERY = """
+MATCH (c:Cluster {run_id: $run_id})<-[:BELONGS_TO]-(p:POI)
+WITH c, p
+ORDER BY c.name, p.label_fr
+WHERE size([(c)-[:BELONGS_TO]-(p2) | p2]) >= $min_poi_count
+RETURN c.name AS cluster_name, collect([p.latitude, p.longitude, p.label_fr]) AS poi_data
+LIMIT $max_clusters
+"""
+
+
+# Run synthétique de n_pois POIs répartis dans n_clusters clusters autour de Paris
+def create_synthetic_run(session, run_id, n_pois, n_clusters):
+    list_pois = [
+        (f"POI {i}", 48.85 + random.uniform(-0.5, 0.5), 2.35 + random.uniform(-0.5, 0.5), ["Culture"], i)
+        for i in range(n_pois)
+    ]
+    clusters = [random.randrange(n_clusters) for _ in range(n_pois)]
+    create_graph_batched(session, run_id, clusters, list_pois)
+
+
+# Durée moyenne (s) d'une lecture complète de la requête, sur repeat exécutions
+def time_query(session, query, repeat, **params):
+    session.run(query, **params).consume()  # préchauffage du cache de plans
+    start = time.perf_counter()
+    for _ in range(repeat):
+        records = list(session.run(query, **params))
+        # Troncature côté client, comme le faisait get_clusters_poi_data
+        [record["poi_data"][:params['max_pois_per_cluster']] for record in records]
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark de la lecture des clusters (get_clusters_poi_data)')
+    parser.add_argument('--uri', default=NEO4J_URI)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--n_clusters', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    params = {'min_poi_count': 6, 'max_clusters': 10, 'max_pois_per_cluster': 10}
+    driver = GraphDatabase.driver(args.uri, auth=NEO4J_AUTH)
+    with driver.session() as session:
+        create_graph_indexes(session)
+        for n_pois in args.sizes:
+            run_id = f"bench_{uuid.uuid4().hex}"
+            create_synthetic_run(session, run_id, n_pois, args.n_clusters)
+            try:
+                legacy = time_query(session, LEGACY_CLUSTERS_POI_QUERY, args.repeat, run_id=run_id, **params)
+                current = time_query(session, CLUSTERS_POI_QUERY, args.repeat, run_id=run_id, **params)
+                print(f"{n_pois} POIs : ancienne requête {legacy * 1000:.1f} ms, "
+                      f"nouvelle requête {current * 1000:.1f} ms (x{legacy / current:.1f})")
+            finally:
+                delete_runs(session, [run_id])
+    driver.close()
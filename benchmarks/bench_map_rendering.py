@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import folium
+import numpy as np
+from clusters_result import COLORS, point_colors, result_dtype
+from map_rendering import clusters_map
+
+
+# Résultat columnaire synthétique de n_points POIs répartis en 10 clusters autour de Paris
+def synthetic_result(n_points, seed=0):
+    rng = np.random.default_rng(seed)
+    points = np.zeros(n_points, dtype=result_dtype(12))
+    points['cluster'] = rng.integers(0, len(COLORS), n_points)
+    points['latitude'] = 48.85 + rng.normal(0, 0.05, n_points)
+    points['longitude'] = 2.35 + rng.normal(0, 0.08, n_points)
+    points['label_fr'] = [f"POI {i}" for i in range(n_points)]
+    return {'points': points, 'colors': list(COLORS), 'cluster_names': [f"Cluster_{i}" for i in range(len(COLORS))]}
+
+
+# Rendu d'origine : un folium.Marker avec sa propre icône par POI
+def legacy_map(result, center):
+    map = folium.Map(location=list(center), zoom_start=12)
+    points = result['points']
+    for color, latitude, longitude, label_fr in zip(point_colors(result), points['latitude'],
+                                                    points['longitude'], points['label_fr']):
+        folium.Marker(location=[float(latitude), float(longitude)], icon=folium.Icon(color=color),
+                      tooltip=str(label_fr)).add_to(map)
+    return map
+
+
+# Temps de rendu dans un navigateur headless (si playwright est installé), en secondes
+def browser_render_time(html_path):
+    try:
+        from playwright.sync_api import sync_playwright
+    except ImportError:
+        return None
+    with sync_playwright() as playwright:
+        browser = playwright.chromium.launch()
+        page = browser.new_page()
+        start = time.perf_counter()
+        page.goto(f"file://{html_path}", wait_until='load')
+        page.wait_for_load_state('networkidle')
+        elapsed = time.perf_counter() - start
+        browser.close()
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark du rendu des cartes de clusters (taille HTML, temps)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 50_000])
+    parser.add_argument('--renderers', nargs='+', default=['legacy', 'geojson', 'fast_cluster'])
+    args = parser.parse_args()
+
+    center = (48.85, 2.35)
+    with tempfile.TemporaryDirectory() as directory:
+        for n_points in args.sizes:
+            result = synthetic_result(n_points)
+            for renderer in args.renderers:
+                start = time.perf_counter()
+                if renderer == 'legacy':
+                    map = legacy_map(result, center)
+                else:
+                    map = clusters_map(result, center, mode=renderer)
+                html_path = os.path.join(directory, f"{renderer}_{n_points}.html")
+                map.save(html_path)
+                build_time = time.perf_counter() - start
+                render_time = browser_render_time(html_path)
+                render = f"{render_time:6.2f} s" if render_time is not None else "   n/a"
+                print(f"{n_points:>6} POIs  {renderer:<12}  HTML {os.path.getsize(html_path) / 1e6:7.2f} Mo  "
+                      f"génération {build_time:6.2f} s  rendu navigateur {render}")
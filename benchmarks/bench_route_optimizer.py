@@ -0,0 +1,36 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import numpy as np
+from distance_matrix import build_distance_matrix
+from route_optimizer import optimize_routes, routes_cost
+
+
+# Qualité de la solution (distance totale) en fonction du budget de temps, pour n arrêts
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark de l'optimiseur d'itinéraire (qualité / temps)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100, 500])
+    parser.add_argument('--time_limits', type=float, nargs='+', default=[0, 1, 2, 5, 10])
+    parser.add_argument('--num_days', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n_stops in args.sizes:
+        coordinates = np.column_stack([rng.uniform(48.7, 49.0, n_stops), rng.uniform(2.1, 2.6, n_stops)])
+        start = time.perf_counter()
+        distance_matrix = build_distance_matrix(coordinates).tolist()
+        matrix_time = time.perf_counter() - start
+        reference = None
+        for time_limit in args.time_limits:
+            start = time.perf_counter()
+            routes = optimize_routes(distance_matrix, num_days=args.num_days, time_limit=time_limit)
+            elapsed = time.perf_counter() - start
+            cost = routes_cost(routes, distance_matrix)
+            reference = reference or cost
+            print(f"{n_stops:>4} arrêts  budget {time_limit:>5.1f} s  temps {elapsed:6.2f} s  "
+                  f"distance {cost / 1000:8.1f} km  ({(cost / reference - 1) * 100:+.1f} % / première solution)  "
+                  f"matrice {matrix_time * 1000:.1f} ms")
@@ -0,0 +1,67 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Points d'entrée : (nom, répertoire, module importé) ; les scripts en ligne de commande sont
+# importés avec --help, qui s'arrête juste après l'analyse des arguments
+ENTRY_POINTS = [
+    ('clustering', 'app', 'clustering'),
+    ('Creation_Clusters', 'app', 'Creation_Clusters'),
+    ('batch_clustering', 'app', 'batch_clustering'),
+    ('Streamlit_app', 'app', 'Streamlit_app'),
+    ('dashboard_dash', 'dash', 'dashboard_dash'),
+    ('backend', 'backend', 'main'),
+]
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.argv = ['bench', '--help']
+sys.path[:0] = [{directory!r}, {app_dir!r}]
+start = time.perf_counter()
+try:
+    import {module}
+except SystemExit:
+    pass
+print(time.perf_counter() - start, file=sys.stderr)
+print(','.join(name for name in ('sklearn', 'neo4j', 'folium', 'ortools', 'pandas', 'plotly', 'geopy')
+               if name in sys.modules) or '-', file=sys.stderr)
+"""
+
+
+# Durée d'import (s) du module dans un interpréteur neuf et modules lourds chargés, ou None si l'import échoue
+def import_time(directory, module):
+    directory = os.path.abspath(os.path.join(ROOT_DIR, directory))
+    script = IMPORT_SCRIPT.format(directory=directory, app_dir=os.path.abspath(os.path.join(ROOT_DIR, 'app')),
+                                  module=module)
+    completed = subprocess.run([sys.executable, '-c', script], cwd=directory, capture_output=True, text=True)
+    lines = completed.stderr.strip().splitlines()
+    if completed.returncode != 0 or len(lines) < 2:
+        return None, lines[-1] if lines else ''
+    return float(lines[-2]), lines[-1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark du temps d'import des points d'entrée (démarrage à froid)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--entry_points', nargs='+', default=[name for name, _, _ in ENTRY_POINTS])
+    args = parser.parse_args()
+
+    for name, directory, module in ENTRY_POINTS:
+        if name not in args.entry_points:
+            continue
+        timings, loaded = [], ''
+        for _ in range(args.repeat):
+            elapsed, loaded = import_time(directory, module)
+            if elapsed is None:
+                break
+            timings.append(elapsed)
+        if not timings:
+            print(f"{name:<20} import impossible : {loaded}")
+            continue
+        print(f"{name:<20} import {statistics.median(timings) * 1000:8.0f} ms  "
+              f"modules lourds chargés : {loaded if loaded != '-' else 'aucun'}")
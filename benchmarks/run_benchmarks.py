@@ -0,0 +1,249 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import numpy as np
+from clustering import (create_graph_batched, create_graph_indexes, delete_runs, filter_pois, fit_clusters,
+                        get_clusters_poi_data, poi_coordinates, project_coordinates)
+from clusters_result import clusters_to_result
+from distance_matrix import build_distance_matrix
+from map_rendering import clusters_map
+from route_optimizer import optimize_routes
+from synthetic_datatourisme import generate_pois, poi_rows
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Fichier des résultats (une ligne JSON par scénario et par taille), versionné avec le code
+DEFAULT_RESULTS = os.path.join(BENCHMARKS_DIR, 'results.jsonl')
+
+# Écart relatif de la médiane au-delà duquel un scénario est signalé comme régression
+DEFAULT_THRESHOLD = 0.10
+
+# Requête de référence : 20 km autour de Paris, types courants
+CENTER = (48.8566, 2.3522)
+RADIUS_KM = 20
+REQUEST_TYPES = ["Culture", "Restauration", "Monument"]
+
+
+# Commit courant et présence de modifications non commitées
+def git_revision():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARKS_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=BENCHMARKS_DIR, text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, dirty
+
+
+# Jeu synthétique d'une taille, généré une fois par exécution
+_datasets = {}
+
+
+def dataset(size):
+    if size not in _datasets:
+        _datasets.clear()
+        pois = generate_pois(size)
+        rows = poi_rows(pois, REQUEST_TYPES)
+        _datasets[size] = {'rows': rows, 'valid_rows': [row for row in rows if -90 <= row[1] <= 90]}
+    return _datasets[size]
+
+
+# --- scénarios : chacun prépare ses données hors chronométrage et renvoie (fonction, nettoyage) ---
+
+def bench_filter_pois(size, context):
+    rows = dataset(size)['rows']
+    return lambda: filter_pois(CENTER, rows, RADIUS_KM), None
+
+
+def bench_kmeans_fit(size, context):
+    rows = dataset(size)['valid_rows']
+    points = project_coordinates(poi_coordinates(rows), (46.5, 2.5))
+    return lambda: fit_clusters(points, n_clusters=10, algorithm='auto', random_state=0), None
+
+
+# Run de tous les POIs valides du jeu, répartis dans 10 clusters
+def neo4j_run(size):
+    rows = dataset(size)['valid_rows']
+    clusters = [i % 10 for i in range(len(rows))]
+    return clusters, rows
+
+
+def bench_create_graph(size, context):
+    clusters, rows = neo4j_run(size)
+    run_id = f"bench_{uuid.uuid4().hex}"
+    session = context['neo4j'].session()
+    context['teardown'].append(session.close)
+    create_graph_indexes(session)
+
+    def cleanup():
+        delete_runs(session, [run_id])
+
+    return lambda: create_graph_batched(session, run_id, clusters, rows), cleanup
+
+
+def bench_get_clusters_poi_data(size, context):
+    clusters, rows = neo4j_run(size)
+    run_id = f"bench_{uuid.uuid4().hex}"
+    driver = context['neo4j']
+    with driver.session() as session:
+        create_graph_indexes(session)
+        create_graph_batched(session, run_id, clusters, rows)
+
+    def teardown():
+        with driver.session() as session:
+            delete_runs(session, [run_id])
+
+    context['teardown'].append(teardown)
+    return lambda: get_clusters_poi_data(driver, run_id), None
+
+
+# Itinéraire sur size arrêts autour de Paris (la taille est un nombre d'arrêts, pas de POIs)
+def bench_solve_tsp(size, context):
+    rng = np.random.default_rng(0)
+    coordinates = np.column_stack([CENTER[0] + rng.normal(0, 0.05, size), CENTER[1] + rng.normal(0, 0.08, size)])
+    distance_matrix = build_distance_matrix(coordinates).tolist()
+    return lambda: optimize_routes(distance_matrix, time_limit=context['tsp_time_limit']), None
+
+
+# Génération du HTML de la carte des POIs de la requête de référence (size POIs au plus)
+def bench_map_render(size, context):
+    rows = dataset(max(size, 10_000))['rows'][:size]
+    clusters_data = {}
+    for i, (label_fr, latitude, longitude, _, _) in enumerate(rows):
+        clusters_data.setdefault(f"Cluster_{i % 10}", []).append((latitude, longitude, label_fr))
+    result = clusters_to_result(clusters_data)
+    return lambda: clusters_map(result, CENTER).get_root().render(), None
+
+
+# Scénarios : (fonction, tailles par défaut, Neo4j requis)
+SCENARIOS = {
+    'filter_pois': (bench_filter_pois, None, False),
+    'kmeans_fit': (bench_kmeans_fit, None, False),
+    'create_graph': (bench_create_graph, None, True),
+    'get_clusters_poi_data': (bench_get_clusters_poi_data, None, True),
+    'solve_tsp': (bench_solve_tsp, [20, 100], False),
+    'map_render': (bench_map_render, [1_000, 10_000], False),
+}
+
+
+# Chronométrage : un passage de préchauffage puis repeat passages mesurés ;
+# les messages des fonctions mesurées (POIs ignorés...) ne sont pas affichés
+def measure(function, cleanup, repeat):
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        function()
+        if cleanup is not None:
+            cleanup()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+            if cleanup is not None:
+                cleanup()
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'rounds': len(timings)
+    }
+
+
+def read_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+# Dernier résultat du même scénario, de la même taille et sur la même machine, d'un autre commit
+def previous_result(history, record):
+    for previous in reversed(history):
+        if (previous['scenario'], previous['size'], previous['machine']) == \
+                (record['scenario'], record['size'], record['machine']) and previous['commit'] != record['commit']:
+            return previous
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks du pipeline sur données DataTourisme synthétiques ; '
+                                                 'résultats enregistrés par commit et comparés au précédent')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000],
+                        help='Nombre de POIs générés (10k à 5M) pour les scénarios de données')
+    parser.add_argument('--tsp_sizes', type=int, nargs='+', default=None, help="Nombre d'arrêts de solve_tsp")
+    parser.add_argument('--map_sizes', type=int, nargs='+', default=None, help='Nombre de POIs de map_render')
+    parser.add_argument('--tsp_time_limit', type=float, default=0,
+                        help='Budget (s) de la recherche locale de solve_tsp (0 : première solution)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--neo4j', default=None, help='URI Neo4j des scénarios de graphe (ex. bolt://localhost)')
+    parser.add_argument('--neo4j_user', default='neo4j')
+    parser.add_argument('--neo4j_password', default='benchmark')
+    parser.add_argument('--machine', default=platform.node(),
+                        help='Nom de la machine : seuls les résultats de la même machine sont comparés')
+    parser.add_argument('--results', default=DEFAULT_RESULTS)
+    parser.add_argument('--no_record', action='store_true', help='Ne pas ajouter les résultats au fichier')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--fail_on_regression', action='store_true',
+                        help='Code de sortie 1 si un scénario est plus lent que son résultat précédent')
+    args = parser.parse_args()
+
+    sizes = {'solve_tsp': args.tsp_sizes, 'map_render': args.map_sizes}
+    context = {'neo4j': None, 'teardown': [], 'tsp_time_limit': args.tsp_time_limit}
+    if args.neo4j:
+        from neo4j import GraphDatabase
+        context['neo4j'] = GraphDatabase.driver(args.neo4j, auth=(args.neo4j_user, args.neo4j_password))
+
+    commit, dirty = git_revision()
+    history = read_results(args.results)
+    records, regressions = [], []
+    try:
+        for name in args.scenarios:
+            function, default_sizes, needs_neo4j = SCENARIOS[name]
+            if needs_neo4j and context['neo4j'] is None:
+                print(f"{name:<22} ignoré (--neo4j non renseigné)")
+                continue
+            for size in sizes.get(name) or default_sizes or args.sizes:
+                stats = measure(*function(size, context), repeat=args.repeat)
+                record = dict(stats, scenario=name, size=size, commit=commit, dirty=dirty, machine=args.machine,
+                              python=platform.python_version(), date=time.strftime('%Y-%m-%dT%H:%M:%S'))
+                records.append(record)
+                previous = previous_result(history, record)
+                change = ''
+                if previous is not None:
+                    ratio = record['median'] / previous['median']
+                    change = f"  x{ratio:.2f} / {previous['commit'][:8]}"
+                    if ratio > 1 + args.threshold:
+                        change += '  RÉGRESSION'
+                        regressions.append(record)
+                print(f"{name:<22}{size:>9}  médiane {stats['median'] * 1000:10.2f} ms  "
+                      f"min {stats['min'] * 1000:10.2f} ms  ± {stats['stddev'] * 1000:8.2f} ms{change}")
+    finally:
+        for teardown in context['teardown']:
+            teardown()
+        if context['neo4j'] is not None:
+            context['neo4j'].close()
+
+    if records and not args.no_record:
+        with open(args.results, 'a', encoding='utf-8') as file:
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"{len(records)} résultat(s) ajouté(s) à {args.results}" + (' (modifications non commitées)' if dirty else ''))
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import numpy as np
+
+
+# Types proposés par l'application (Streamlit_app.py), du plus au moins fréquent
+POI_TYPES = [
+    "Culture", "Restauration", "Hebergement", "Loisir", "Sport", "Nature", "Commerce local", "Service",
+    "Religion", "Monument", "Histoire", "Parcours", "Marche à pied", "Vélo", "Divertissement",
+    "Boisson", "Bar", "Musée", "Point de vue", "Détente", "Camping", "Parking", "Information", "Marché",
+    "Magasin", "Location", "Santé", "Jeunesse", "Apprentissage", "Animaux", "Plage", "Cours d'eau",
+    "Montagne", "Piscine", "Antiquité", "Banque", "Moyen de locomotion", "Mobilité réduite", "Militaire",
+    "Autre", "POI"
+]
+
+# Foyers de POIs : (latitude, longitude, écart-type en degrés, poids)
+CITIES = [
+    (48.8566, 2.3522, 0.08, 10), (45.7640, 4.8357, 0.06, 4), (43.2965, 5.3698, 0.06, 4),
+    (43.6047, 1.4442, 0.05, 3), (43.7102, 7.2620, 0.05, 3), (47.2184, -1.5536, 0.05, 2),
+    (48.5734, 7.7521, 0.04, 2), (44.8378, -0.5792, 0.05, 3), (50.6292, 3.0573, 0.04, 2),
+    (48.1173, -1.6778, 0.04, 2), (45.1885, 5.7245, 0.05, 2), (45.8992, 6.1294, 0.08, 2),
+    (42.6977, 9.4508, 0.10, 1), (47.3220, 5.0415, 0.04, 1), (48.6921, 6.1844, 0.04, 1)
+]
+
+# Part des POIs dispersés sur tout le territoire (hors foyers)
+RURAL_RATIO = 0.25
+
+# Emprise de la France métropolitaine (latitude min/max, longitude min/max)
+FRANCE_BOUNDS = (42.3, 51.1, -4.8, 8.2)
+
+# Part des coordonnées hors bornes, comme dans l'export DataTourisme
+INVALID_RATIO = 0.0005
+
+# Nombre de types par POI (1, 2 ou 3) et leurs probabilités
+TYPES_PER_POI = [0.6, 0.3, 0.1]
+
+# Modèles de labels : beaucoup de POIs homonymes, comme dans les données réelles
+LABEL_PREFIXES = ["Église", "Chapelle", "Musée", "Restaurant", "Hôtel", "Camping", "Parc", "Château",
+                  "Gîte", "Boulangerie", "Office de tourisme", "Sentier", "Place", "Moulin", "Fontaine"]
+LABEL_NAMES = ["Saint-Pierre", "Saint-Martin", "Notre-Dame", "du Lac", "des Pins", "de la Gare", "du Port",
+               "du Moulin", "des Vignes", "du Château", "de la Source", "Belle-Vue", "des Tilleuls",
+               "du Centre", "de la Forêt", "du Soleil", "des Cèdres", "de l'Abbaye", "du Marché", "Sainte-Anne"]
+
+ID_PREFIX = "https://data.datatourisme.fr/synthetic/"
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS datatourisme (id text PRIMARY KEY, label_fr text, "
+    "latitude double precision, longitude double precision)",
+    "CREATE TABLE IF NOT EXISTS types_de_poi (id integer PRIMARY KEY, type text)",
+    "CREATE TABLE IF NOT EXISTS liaison_datatourisme_types_de_poi (id_datatourisme text, id_type_de_poi integer)"
+]
+
+
+# Identifiants DataTourisme synthétiques ; le bourrage de zéros garde l'ordre numérique en texte
+def poi_ids(numbers):
+    return [f"{ID_PREFIX}{number:09d}" for number in numbers]
+
+
+# Jeu synthétique de n_pois POIs : coordonnées, labels et liaisons vers les types.
+# Même graine, même jeu : les résultats restent comparables d'un commit à l'autre.
+def generate_pois(n_pois, seed=0):
+    rng = np.random.default_rng(seed)
+    cities = np.array(CITIES)
+    city = rng.choice(len(cities), n_pois, p=cities[:, 3] / cities[:, 3].sum())
+    latitudes = cities[city, 0] + rng.normal(0, 1, n_pois) * cities[city, 2]
+    longitudes = cities[city, 1] + rng.normal(0, 1, n_pois) * cities[city, 2] * 1.5
+    rural = rng.random(n_pois) < RURAL_RATIO
+    min_lat, max_lat, min_lon, max_lon = FRANCE_BOUNDS
+    latitudes[rural] = rng.uniform(min_lat, max_lat, int(rural.sum()))
+    longitudes[rural] = rng.uniform(min_lon, max_lon, int(rural.sum()))
+    invalid = rng.random(n_pois) < INVALID_RATIO
+    latitudes[invalid] = rng.uniform(91, 180, int(invalid.sum()))
+
+    prefixes = rng.integers(0, len(LABEL_PREFIXES), n_pois)
+    names = rng.integers(0, len(LABEL_NAMES), n_pois)
+    labels = [f"{LABEL_PREFIXES[p]} {LABEL_NAMES[n]}" for p, n in zip(prefixes.tolist(), names.tolist())]
+
+    # Popularité des types en loi de Zipf ; un type tiré deux fois pour un POI n'est gardé qu'une fois
+    weights = 1 / np.arange(1, len(POI_TYPES) + 1)
+    counts = rng.choice(len(TYPES_PER_POI), n_pois, p=TYPES_PER_POI) + 1
+    link_pois = np.repeat(np.arange(n_pois), counts)
+    link_types = rng.choice(len(POI_TYPES), len(link_pois), p=weights / weights.sum())
+    links = np.unique(link_pois * len(POI_TYPES) + link_types)
+    return {
+        'latitudes': latitudes,
+        'longitudes': longitudes,
+        'labels': labels,
+        'link_pois': links // len(POI_TYPES),
+        'link_types': links % len(POI_TYPES)
+    }
+
+
+# Lignes au format de build_poi_query (label_fr, latitude, longitude, types, id), sans base de données
+def poi_rows(pois, poi_types=None):
+    wanted = None if poi_types is None else {POI_TYPES.index(poi_type) for poi_type in poi_types}
+    starts = np.searchsorted(pois['link_pois'], np.arange(len(pois['labels']) + 1))
+    link_types = pois['link_types'].tolist()
+    ids = poi_ids(range(len(pois['labels'])))
+    rows = []
+    for i, (label_fr, latitude, longitude) in enumerate(zip(pois['labels'], pois['latitudes'].tolist(),
+                                                            pois['longitudes'].tolist())):
+        types = [POI_TYPES[code] for code in link_types[starts[i]:starts[i + 1]] if wanted is None or code in wanted]
+        if types:
+            rows.append((label_fr, latitude, longitude, types, ids[i]))
+    return rows
+
+
+# Contenu des trois tables, par blocs de chunk_size lignes : (table, lignes)
+def table_chunks(pois, chunk_size=100_000):
+    yield 'types_de_poi', [(code + 1, poi_type) for code, poi_type in enumerate(POI_TYPES)]
+    n_pois = len(pois['labels'])
+    for start in range(0, n_pois, chunk_size):
+        end = min(start + chunk_size, n_pois)
+        yield 'datatourisme', list(zip(poi_ids(range(start, end)), pois['labels'][start:end],
+                                       pois['latitudes'][start:end].tolist(), pois['longitudes'][start:end].tolist()))
+    n_links = len(pois['link_pois'])
+    for start in range(0, n_links, chunk_size):
+        end = min(start + chunk_size, n_links)
+        yield 'liaison_datatourisme_types_de_poi', list(zip(poi_ids(pois['link_pois'][start:end].tolist()),
+                                                            (pois['link_types'][start:end] + 1).tolist()))
+
+
+# Export CSV (une ligne d'en-tête par table), chargeable avec \copy ... CSV HEADER
+def write_csv(pois, directory):
+    os.makedirs(directory, exist_ok=True)
+    headers = {
+        'types_de_poi': ['id', 'type'],
+        'datatourisme': ['id', 'label_fr', 'latitude', 'longitude'],
+        'liaison_datatourisme_types_de_poi': ['id_datatourisme', 'id_type_de_poi']
+    }
+    files = {}
+    try:
+        for table, rows in table_chunks(pois):
+            if table not in files:
+                files[table] = open(os.path.join(directory, f'{table}.csv'), 'w', encoding='utf-8', newline='')
+                csv.writer(files[table]).writerow(headers[table])
+            csv.writer(files[table]).writerows(rows)
+    finally:
+        for file in files.values():
+            file.close()
+
+
+# Chargement dans PostgreSQL par COPY ; replace vide d'abord les trois tables
+def load_postgres(pois, conn, replace=True):
+    from clustering import create_spatial_index
+    with conn.cursor() as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        if replace:
+            cursor.execute("TRUNCATE datatourisme, types_de_poi, liaison_datatourisme_types_de_poi")
+        for table, rows in table_chunks(pois):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute("ANALYZE datatourisme")
+        cursor.execute("ANALYZE liaison_datatourisme_types_de_poi")
+        create_spatial_index(cursor)
+    conn.commit()
+
+
+# Chargement dans Neo4j d'un run de clustering des POIs valides (KMeans sur tout le jeu)
+def load_neo4j(pois, driver, run_id='synthetic', n_clusters=10, batch_size=None):
+    from clustering import (DEFAULT_BATCH_SIZE, create_graph_batched, create_graph_indexes, fit_clusters,
+                            poi_coordinates, project_coordinates)
+    rows = [row for row in poi_rows(pois) if -90 <= row[1] <= 90]
+    points = project_coordinates(poi_coordinates(rows), (46.5, 2.5))
+    clusters, _ = fit_clusters(points, n_clusters=n_clusters, algorithm='minibatch', random_state=0)
+    with driver.session() as session:
+        create_graph_indexes(session)
+        create_graph_batched(session, run_id, clusters, rows, batch_size=batch_size or DEFAULT_BATCH_SIZE)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Génération de données DataTourisme synthétiques '
+                                                 '(datatourisme, types_de_poi, liaisons)')
+    parser.add_argument('--rows', type=int, default=100_000, help='Nombre de POIs (10k à 5M)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', default=None, help='Répertoire où écrire les trois tables en CSV')
+    parser.add_argument('--postgres', default=None,
+                        help='DSN PostgreSQL où charger les tables (ex. "host=localhost user=postgres")')
+    parser.add_argument('--neo4j', default=None, help='URI Neo4j où écrire un run de clustering (ex. bolt://localhost)')
+    parser.add_argument('--neo4j_user', default='neo4j')
+    parser.add_argument('--neo4j_password', default='benchmark')
+    parser.add_argument('--run_id', default='synthetic', help='Identifiant du run écrit dans Neo4j')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pois = generate_pois(args.rows, seed=args.seed)
+    print(f"{args.rows} POIs et {len(pois['link_pois'])} liaisons générés en {time.perf_counter() - start:.1f} s")
+
+    if args.csv:
+        start = time.perf_counter()
+        write_csv(pois, args.csv)
+        print(f"CSV écrits dans {args.csv} en {time.perf_counter() - start:.1f} s")
+
+    if args.postgres:
+        import psycopg2
+        start = time.perf_counter()
+        conn = psycopg2.connect(args.postgres)
+        try:
+            load_postgres(pois, conn)
+        finally:
+            conn.close()
+        print(f"Tables PostgreSQL chargées en {time.perf_counter() - start:.1f} s")
+
+    if args.neo4j:
+        from neo4j import GraphDatabase
+        start = time.perf_counter()
+        driver = GraphDatabase.driver(args.neo4j, auth=(args.neo4j_user, args.neo4j_password))
+        try:
+            n_rows = load_neo4j(pois, driver, run_id=args.run_id)
+        finally:
+            driver.close()
+        print(f"Run '{args.run_id}' de {n_rows} POIs écrit dans Neo4j en {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
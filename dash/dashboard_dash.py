@@ -1,68 +1,212 @@
+import os
+import sys
+import threading
 import dash
 from dash import dcc
 from dash import html
-from dash.dependencies import Input, Output
-import plotly.express as px
-from neo4j import GraphDatabase
-import pandas as pd
+from dash.dependencies import Input, Output, State
+import plotly.graph_objects as go
+from urllib.parse import parse_qs
 
-# Connexion à la base de données Neo4j
-uri = "bolt://188.166.105.53:7687"
-username = "neo4j"
-password = "od1235Azerty%"
+# Modules partagés : dans app/ dans le dépôt, à la racine de l'image Docker
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(BASE_DIR, "app"), BASE_DIR]
 
-driver = GraphDatabase.driver(uri, auth=(username, password))
+from settings import NEO4J_AUTH, NEO4J_URI
 
-def get_pois_and_clusters():
+# Driver Neo4j (et pandas) chargés au premier rafraîchissement ou par warm_up
+_driver = None
+_driver_lock = threading.Lock()
+
+
+def get_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            from neo4j import GraphDatabase
+            _driver = GraphDatabase.driver(NEO4J_URI, auth=NEO4J_AUTH)
+        return _driver
+
+# Période (ms) de rafraîchissement de la carte
+REFRESH_INTERVAL_MS = 5000
+
+# Nombre de runs dont le tableau de POIs est gardé en mémoire côté serveur
+MAX_CACHED_RUNS = 8
+
+COLUMNS = ['label', 'latitude', 'longitude', 'type', 'cluster_name', 'batch']
+
+# Tableaux des POIs déjà lus, par run : {run_id: {'version', 'batch', 'data'}}
+frames = {}
+frames_lock = threading.Lock()
+
+
+# Identifiant du run le plus récent, utilisé quand l'URL n'en précise pas
+def get_latest_run_id():
+    query = """
+    MATCH (cluster:Cluster)
+    RETURN cluster.run_id AS run_id
+    ORDER BY cluster.created_at DESC
+    LIMIT 1
+    """
+    with get_driver().session() as session:
+        record = session.run(query).single()
+    return record["run_id"] if record else None
+
+
+# Version d'un run : date de création de ses clusters, qui change quand le run est réécrit.
+# Ne lit que les quelques nœuds Cluster du run.
+def get_run_version(run_id):
     query = """
-    MATCH (poi:POI)-[:BELONGS_TO]->(cluster:Cluster)
-    RETURN poi.label_fr AS label, poi.latitude AS latitude, poi.longitude AS longitude, poi.poi_type AS type, cluster.name AS cluster_name
+    MATCH (cluster:Cluster {run_id: $run_id})
+    RETURN max(cluster.created_at).epochMillis AS version
     """
-    with driver.session() as session:
-        result = session.run(query)
-        data = pd.DataFrame([record.data() for record in result])
-    return data
+    with get_driver().session() as session:
+        record = session.run(query, run_id=run_id).single()
+    return record["version"] if record else None
+
+
+# POIs du run, ou seulement ceux des lots écrits après le lot since ; triés par lot
+def get_pois_and_clusters(run_id, since=None):
+    import pandas as pd
+    query = """
+    MATCH (poi:POI {run_id: $run_id})-[:BELONGS_TO]->(cluster:Cluster {run_id: $run_id})
+    """ + ("WHERE poi.batch > $since" if since is not None else "") + """
+    RETURN poi.label_fr AS label, poi.latitude AS latitude, poi.longitude AS longitude,
+           coalesce(poi.types, [poi.poi_type]) AS type,
+           cluster.name AS cluster_name, coalesce(poi.batch, 0) AS batch
+    ORDER BY batch
+    """
+    with get_driver().session() as session:
+        # Résultat converti en colonnes par le pilote, sans passer par un dict par ligne
+        data = session.run(query, run_id=run_id, since=since).to_df()
+    if data.empty:
+        return pd.DataFrame(columns=COLUMNS)
+
+    # Nettoyer les données (seules les lignes nouvelles passent ici)
+    data['latitude'] = pd.to_numeric(data['latitude'], errors='coerce')
+    data['longitude'] = pd.to_numeric(data['longitude'], errors='coerce')
+    data['batch'] = data['batch'].astype('int64')
+    # Un POI porte la liste de ses types (runs antérieurs : un seul type par nœud)
+    data['type'] = data['type'].map(lambda types: ', '.join(t for t in types if t))
+    return data.dropna(subset=['latitude', 'longitude'])[COLUMNS]
+
+
+# Mise à jour du tableau en cache d'un run : rechargement complet si le run a changé de version,
+# sinon lecture des seuls lots nouveaux
+def refresh_run(run_id):
+    import pandas as pd
+    version = get_run_version(run_id)
+    with frames_lock:
+        cached = frames.get(run_id)
+        if cached is None or cached['version'] != version:
+            data = get_pois_and_clusters(run_id)
+            cached = {'version': version, 'data': data, 'batch': int(data['batch'].max()) if len(data) else -1}
+            frames.pop(run_id, None)
+            frames[run_id] = cached
+            while len(frames) > MAX_CACHED_RUNS:
+                frames.pop(next(iter(frames)))
+            return cached
+
+        new_rows = get_pois_and_clusters(run_id, since=cached['batch'])
+        if len(new_rows):
+            cached['data'] = pd.concat([cached['data'], new_rows], ignore_index=True)
+            cached['batch'] = int(new_rows['batch'].max())
+        return cached
+
 
-# Récupérer les données
-# data = get_pois_and_clusters()
+# Lignes des lots postérieurs à since ; le tableau étant trié par lot, aucune copie complète
+def rows_after(data, since):
+    return data.iloc[data['batch'].searchsorted(since, side='right'):]
+
+
+# Figure complète : une trace par cluster, dans l'ordre de clusters
+def build_figure(data, clusters, run_id):
+    fig = go.Figure()
+    for cluster_name in clusters:
+        rows = data[data['cluster_name'] == cluster_name]
+        fig.add_trace(go.Scattermap(
+            lat=rows['latitude'].tolist(),
+            lon=rows['longitude'].tolist(),
+            text=rows['label'].tolist(),
+            customdata=rows['type'].tolist(),
+            name=cluster_name,
+            mode='markers',
+            hovertemplate='<b>%{text}</b><br>type=%{customdata}<extra>%{fullData.name}</extra>'
+        ))
+    center = {'lat': data['latitude'].mean(), 'lon': data['longitude'].mean()} if len(data) else None
+    fig.update_layout(
+        map_style="open-street-map",
+        map_zoom=10,
+        map_center=center,
+        height=600,
+        margin={'r': 0, 't': 0, 'l': 0, 'b': 0},
+        # Conserve le zoom et la position de l'utilisateur entre deux rafraîchissements du même run
+        uirevision=run_id
+    )
+    return fig
 
-# Nettoyer les données
-# data['latitude'] = pd.to_numeric(data['latitude'], errors='coerce')
-# data['longitude'] = pd.to_numeric(data['longitude'], errors='coerce')
-# data = data.dropna(subset=['latitude', 'longitude'])
 
 # Créer l'application Dash
 app = dash.Dash(__name__)
 
+# Le run affiché est passé dans l'URL : /?run_id=<identifiant>
 app.layout = html.Div([
+    dcc.Location(id='url'),
     dcc.Graph(id='graph'),
+    dcc.Interval(id='refresh', interval=REFRESH_INTERVAL_MS),
+    # Ce que le navigateur affiche déjà : run, version, dernier lot et ordre des traces
+    dcc.Store(id='graph-state'),
 ])
 
 @app.callback(
-    Output('graph', 'figure'),
-    [Input('graph', 'id')]
+    [Output('graph', 'figure'), Output('graph-state', 'data')],
+    [Input('url', 'search'), Input('refresh', 'n_intervals')],
+    [State('graph-state', 'data')]
 )
-def update_graph(_):
-    # Récupérer les données
-    data = get_pois_and_clusters()
+def update_graph(search, n_intervals, state):
+    # Récupérer les données du run demandé, ou du plus récent à défaut
+    run_id = parse_qs((search or '').lstrip('?')).get('run_id', [None])[0] or get_latest_run_id()
+    cached = refresh_run(run_id)
+    data = cached['data']
+    state = state or {}
+
+    if state.get('run_id') == run_id and state.get('version') == cached['version']:
+        new_rows = rows_after(data, state['batch'])
+        if new_rows.empty:
+            return dash.no_update, dash.no_update
+        clusters = state['clusters']
+        if set(new_rows['cluster_name']) <= set(clusters):
+            # Mise à jour partielle : seules les nouvelles lignes sont envoyées au navigateur
+            patched = dash.Patch()
+            for cluster_name, rows in new_rows.groupby('cluster_name', sort=False):
+                trace = patched['data'][clusters.index(cluster_name)]
+                trace['lat'].extend(rows['latitude'].tolist())
+                trace['lon'].extend(rows['longitude'].tolist())
+                trace['text'].extend(rows['label'].tolist())
+                trace['customdata'].extend(rows['type'].tolist())
+            return patched, dict(state, batch=cached['batch'])
+
+    clusters = sorted(data['cluster_name'].unique())
+    state = {'run_id': run_id, 'version': cached['version'], 'batch': cached['batch'], 'clusters': clusters}
+    return build_figure(data, clusters, run_id), state
+
+# Préchauffage avant de servir : driver Neo4j connecté et pandas chargé. Renvoie l'état
+# de Neo4j, aussi exposé sur /health pour les sondes du conteneur.
+def warm_up():
+    import pandas
+    try:
+        get_driver().verify_connectivity()
+        return {'neo4j': 'ok'}
+    except Exception as e:
+        return {'neo4j': f"error: {e}"}
+
+
+@app.server.route('/health')
+def health():
+    status = warm_up()
+    return status, 200 if status['neo4j'] == 'ok' else 503
 
-    # Nettoyer les données
-    data['latitude'] = pd.to_numeric(data['latitude'], errors='coerce')
-    data['longitude'] = pd.to_numeric(data['longitude'], errors='coerce')
-    data = data.dropna(subset=['latitude', 'longitude'])
-
-    fig = px.scatter_mapbox(
-        data,
-        lat='latitude',
-        lon='longitude',
-        color='cluster_name',
-        hover_name='label',
-        hover_data={'type': True, 'cluster_name': False},
-        zoom=10,
-        height=600
-    )
-    fig.update_layout(mapbox_style="open-street-map")
-    return fig
 
 if __name__ == '__main__':
-    app.run_server(host='0.0.0.0', port=8050, debug=True)
+    print(f"Préchauffage : {warm_up()}")
+    app.run(host='0.0.0.0', port=8050, debug=True)